@@ -1,7 +1,11 @@
 import os
 import json
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+import hashlib
+import hmac
+import time
+import threading
+from datetime import datetime, timedelta
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, stream_with_context, g, before_render_template, template_rendered, has_request_context
 from groq import Groq
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
@@ -9,16 +13,74 @@ from flask_dance.contrib.github import make_github_blueprint, github
 from flask_dance.contrib.gitlab import make_gitlab_blueprint, gitlab
 from typing import Dict, List, Any, Optional
 import re
-from modules.analyzer import analyze_code, complete_code, refactor_code
+from modules.analyzer import run_review, run_review_batch, run_diff_review, stream_review, review_events, format_review, reuse_review, review_cache, prompt_budget
+from modules.diff_review import parse_unified_diff, diff_snippet, map_findings
+from modules.storage import get_store, HISTORY_FIELDS
+from modules.jobs import JobQueue
+from modules.autocomplete import AutocompleteService, HistoryWriter, completion_key
+from modules.scope_index import DocumentIndex, ScopeIndex
+from modules.scheduler import ModelScheduler
+from modules import metrics
+from modules.repo_review import plan_repo_review, fetch_file, fetch_pull_diff, pull_request_event, MAX_FILE_BYTES, RepoProviderError
+from modules.repo_listing import RepoListCache, TokenClient
+from modules.auth import JsonFile, TokenStore
+from modules.similarity import jaccard
 
 app = Flask(__name__)
-app.secret_key = "1234"  # Replace with a strong key in production
+app.secret_key = os.environ.get("SECRET_KEY", "1234")  # Set SECRET_KEY in production; every worker must share it
 
-# Define file paths
-HISTORY_FILE = os.path.join(os.path.dirname(__file__), "data", "review_history.json")
-USERS_FILE = os.path.join(os.path.dirname(__file__), "data", "users.json")
+# Request timing and metrics
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.timings_token = metrics.request_timings.set([])
+
+@app.after_request
+def record_request_metrics(response):
+    if "request_start" in g:
+        endpoint = request.endpoint or "unknown"
+        metrics.http_latency.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+        metrics.http_requests.inc(endpoint=endpoint, status=response.status_code)
+        # Opt-in per-request breakdown for API clients
+        timings = metrics.request_timings.get()
+        if request.headers.get("X-Timing") and timings:
+            response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+@app.teardown_request
+def reset_request_timings(exc):
+    token = g.pop("timings_token", None)
+    if token is not None:
+        metrics.request_timings.reset(token)
+
+def _template_render_started(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+def _template_render_finished(sender, template, context, **extra):
+    if "template_start" in g:
+        metrics.record_span("template_render", time.perf_counter() - g.pop("template_start"))
+
+before_render_template.connect(_template_render_started, app)
+template_rendered.connect(_template_render_finished, app)
+
+# Define file paths (DATA_DIR is shared by every worker process)
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.path.dirname(__file__), "data"))
+HISTORY_FILE = os.path.join(DATA_DIR, "review_history.json")  # legacy, migrated on first use
+HISTORY_DB = os.path.join(DATA_DIR, "history.db")
+USERS_FILE = os.path.join(DATA_DIR, "users.json")
+TOKENS_FILE = os.path.join(DATA_DIR, "api_tokens.json")
 API_VERSION = "v1"
 
+history_store = get_store(HISTORY_DB)
+history_store.register_legacy_json(HISTORY_FILE)
+
+def index_history_backlog():
+    """Add entries written before the similarity and search indexes existed (or migrated in) to them."""
+    while history_store.index_similarity_backlog():
+        pass
+    while history_store.index_search_backlog():
+        pass
+
 # Add timestamp_to_date filter to resolve the template error
 @app.template_filter('timestamp_to_date')
 def timestamp_to_date(timestamp):
@@ -29,26 +91,13 @@ def timestamp_to_date(timestamp):
 
 # History management functions
 def load_history(user_id=None):
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r") as f:
-            try:
-                history = json.load(f)
-                if user_id:
-                    return [item for item in history if item.get("user_id") == user_id]
-                return history
-            except json.JSONDecodeError:
-                return []
-    return []
+    return history_store.list(user_id=user_id)
 
 def save_history(history):
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+    history_store.replace_all(history)
 
 def add_to_history(user_id, code, review, repo_provider=None, repo_name=None, file_path=None):
-    history = load_history()
-    history.append({
+    return history_store.add({
         "user_id": user_id,
         "code": code,
         "review": review,
@@ -57,18 +106,66 @@ def add_to_history(user_id, code, review, repo_provider=None, repo_name=None, fi
         "repo_name": repo_name,
         "file_path": file_path
     })
-    save_history(history)
 
-# User database functions
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+def parse_history_cursor(value):
+    """Parse a "<timestamp>_<id>" pagination cursor. Raises ValueError if malformed."""
+    if not value:
+        return None
+    timestamp, entry_id = value.split("_", 1)
+    return int(timestamp), int(entry_id)
+
+def format_history_cursor(cursor):
+    return f"{cursor[0]}_{cursor[1]}" if cursor else None
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+def parse_search_date(value, end=False):
+    """A unix timestamp or YYYY-MM-DD date as a search bound.
+
+    With end=True it is the exclusive upper bound that still includes the
+    given second or whole day. Raises ValueError if malformed.
+    """
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value) + 1 if end else int(value)
+    day = datetime.strptime(value, "%Y-%m-%d")
+    return int((day + timedelta(days=1) if end else day).timestamp())
+
+def search_history(user_id, args, limit):
+    """Run a history search from request args (q, repo, since, until, page).
+
+    Returns (results, next_page). Raises ValueError on malformed dates or pages.
+    """
+    page = int(args.get("page", 0))
+    if page < 0:
+        raise ValueError("page")
+    results, next_offset = history_store.search(
+        user_id,
+        args.get("q", ""),
+        repo_name=args.get("repo") or None,
+        since=parse_search_date(args.get("since")),
+        until=parse_search_date(args.get("until"), end=True),
+        limit=limit,
+        offset=page * limit,
+    )
+    return results, (page + 1 if next_offset is not None else None)
+
+# User database functions (parsed once, re-read only when the file changes)
+users_file = JsonFile(USERS_FILE)
+
 def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return users_file.load()
 
 def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+    users_file.save(users)
+
+# API tokens for IDE integrations, hashed at rest
+token_store = TokenStore(TOKENS_FILE)
 
 # OAuth setup for available providers
 github_bp = make_github_blueprint(
@@ -88,12 +185,106 @@ app.register_blueprint(gitlab_bp, url_prefix="/login/gitlab")
 # Groq client setup
 groq_client = Groq(api_key=os.environ.get("GROQ_API_KEY", "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"))
 
+# Every model call goes through the shared scheduler (LLM_RPM / LLM_TPM / LLM_MAX_RETRIES)
+llm_scheduler = ModelScheduler.from_env(groq_client)
+
+def model_client(priority="review", user_id=None):
+    return llm_scheduler.client(priority, user_id)
+
+# Near-duplicate reuse: code at least this similar (Jaccard over token shingles)
+# to one of the user's past submissions gets that review back (0 disables)
+SIMILAR_REUSE_THRESHOLD = float(os.environ.get("SIMILAR_REUSE_THRESHOLD", "0.95"))
+SIMILAR_MAX_RESULTS = 20
+# Candidates checked for reuse; some may not hold a reusable review
+SIMILAR_REUSE_CANDIDATES = 10
+
+def find_reusable_review(user_id, code, language):
+    """A run_review()-shaped result copied from the user's most similar past review, or None."""
+    if SIMILAR_REUSE_THRESHOLD <= 0 or not user_id:
+        return None
+    # The index only estimates similarity, so candidates are confirmed on the exact shingle sets
+    matches = history_store.similar(
+        user_id, code, limit=SIMILAR_REUSE_CANDIDATES, min_similarity=SIMILAR_REUSE_THRESHOLD - 0.1
+    )
+    for match in matches:
+        score = jaccard(code, match["code"])
+        if score < SIMILAR_REUSE_THRESHOLD:
+            continue
+        result = reuse_review(match["review"], code, language)
+        if result is not None:
+            result["reused_from"] = {"entry_id": match["id"], "similarity": round(score, 3)}
+            return result
+    return None
+
+def review_code(code, user_id, priority="review", use_cache=True, file_path=None):
+    """run_review(), answered from a near-identical past review when caching is allowed."""
+    language = detect_language(code, file_path)
+    if use_cache:
+        result = find_reusable_review(user_id, code, language)
+        if result is not None:
+            return result
+    return run_review(code, model_client(priority, user_id), use_cache=use_cache, language=language)
+
+# Background review jobs (JOB_BACKEND / JOB_WORKERS)
+def process_review_job(payload):
+    if payload.get("kind") == "diff":
+        return process_diff_job(payload)
+    result = review_code(
+        payload["code"],
+        payload["user_id"],
+        priority="batch",
+        use_cache=not payload.get("no_cache", False),
+        file_path=payload.get("file_path")
+    )
+    entry_id = add_to_history(
+        user_id=payload["user_id"],
+        code=payload["code"],
+        review=format_review(result),
+        repo_provider=payload.get("provider"),
+        repo_name=payload.get("repo_name", ""),
+        file_path=payload.get("file_path", "")
+    )
+    return {
+        "review": {name: result[name] for name in ("analysis", "suggestions", "completion")},
+        "errors": result["errors"],
+        "static_analysis": result["static_analysis"],
+        "reused_from": result.get("reused_from"),
+        "entry_id": entry_id
+    }
+
+review_jobs = JobQueue.from_env(process_review_job, DATA_DIR)
+
+# Autocomplete fast path (AUTOCOMPLETE_* settings)
+autocomplete_service = AutocompleteService.from_env()
+document_index = DocumentIndex.from_env()
+autocomplete_history = HistoryWriter(
+    # Completions are not reviews, so they stay out of similar-review reuse
+    lambda records: history_store.add_many(records, index_similar=False),
+    sample_rate=float(os.environ.get("AUTOCOMPLETE_HISTORY_SAMPLE", "1.0"))
+)
+
+# Metrics exported at scrape time
+metrics.track_cache("review", review_cache)
+metrics.track_cache("autocomplete", autocomplete_service.cache)
+scheduler_events = metrics.registry.counter("codereview_scheduler_events_total", "Model scheduler calls, retries and failures")
+metrics.registry.add_collector(
+    lambda: [scheduler_events.set_total(value, event=event) for event, value in llm_scheduler.stats.items()]
+)
+
 # Repository provider handlers
 repo_providers = {
     "github": github,
     "gitlab": gitlab
 }
 
+# Provider repository lists, cached per user (REPO_LIST_TTL) and revalidated with ETags
+repo_lists = RepoListCache.from_env()
+
+def provider_listing_client(provider):
+    """A client for the provider API that keeps working in background threads."""
+    oauth = repo_providers[provider]
+    return TokenClient(oauth.base_url, oauth.token)
+
 # Login required decorator
 def login_required(f):
     @wraps(f)
@@ -103,6 +294,24 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def api_token_required(f):
+    """Resolve the Bearer token to g.api_user_id, or answer 401."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get("Authorization", "")
+        user_id = token_store.resolve(auth_header[len("Bearer "):]) if auth_header.startswith("Bearer ") else None
+        if user_id is None:
+            return jsonify({"error": "Unauthorized"}), 401
+        g.api_user_id = user_id
+        return f(*args, **kwargs)
+    return decorated_function
+
+def forbidden_user(requested_user_id):
+    """A 403 response if the request names a user other than the token's owner, else None."""
+    if requested_user_id and requested_user_id != g.api_user_id:
+        return jsonify({"error": "Token does not belong to this user"}), 403
+    return None
+
 # OAuth callback handlers
 @app.route("/callback/<provider>")
 def oauth_callback(provider):
@@ -140,6 +349,8 @@ def login_page():
 
 @app.route("/logout")
 def logout():
+    if session.get("user_id"):
+        repo_lists.invalidate(session["user_id"])
     for provider in repo_providers:
         if f"{provider}_oauth_token" in session:
             del session[f"{provider}_oauth_token"]
@@ -173,14 +384,17 @@ def register():
         if password != confirm_password:
             return render_template('register.html', error="Passwords don't match")
         
-        users = load_users()
-        if username in users:
-            return render_template('register.html', error="Username already exists")
+        password_hash = generate_password_hash(password)
         
-        users[username] = {
-            'password': generate_password_hash(password)
-        }
-        save_users(users)
+        def add_user(users):
+            if username in users:
+                return None
+            users[username] = {'password': password_hash}
+            return users, True
+        
+        # Check and insert under the users file lock so concurrent sign-ups in other workers are never lost
+        if not users_file.update(add_user):
+            return render_template('register.html', error="Username already exists")
         
         session['username'] = username
         session['user_id'] = username  # Use username as user_id for regular login
@@ -188,25 +402,44 @@ def register():
     
     return render_template('register.html')
 
+@app.route("/tokens", methods=["GET", "POST"])
+@login_required
+def api_tokens():
+    """List, create and revoke the API tokens used by IDE integrations."""
+    new_token = None
+    if request.method == "POST":
+        _, new_token = token_store.create(session["user_id"], request.form.get("name", "").strip())
+    
+    return render_template(
+        "tokens.html", tokens=token_store.list(session["user_id"]), new_token=new_token, user=session.get("username")
+    )
+
+@app.route("/tokens/<token_id>/revoke", methods=["POST"])
+@login_required
+def revoke_api_token(token_id):
+    token_store.revoke(token_id, session["user_id"])
+    return redirect(url_for("api_tokens"))
+
 # Web UI routes
 @app.route("/", methods=["GET", "POST"])
 @login_required
 def index():
     review = ""
     repos = []
+    more_repos = False
     
     provider = session.get("provider")
     
     if provider and provider in repo_providers and repo_providers[provider].authorized:
-        # Fetch repositories for the authenticated user
-        if provider == "github":
-            repos_resp = github.get("/user/repos")
-            if repos_resp.ok:
-                repos = [{"name": repo["full_name"], "url": repo["html_url"]} for repo in repos_resp.json()]
-        elif provider == "gitlab":
-            repos_resp = gitlab.get("/api/v4/projects")
-            if repos_resp.ok:
-                repos = [{"name": repo["path_with_namespace"], "url": repo["web_url"]} for repo in repos_resp.json()]
+        # Repositories come from the per-user cache; the provider is only
+        # contacted in the background, never on the page or review path
+        with metrics.span("repo_listing"):
+            listing = repo_lists.cached(session["user_id"])
+            if listing is None or listing.get("stale"):
+                repo_lists.refresh(session["user_id"], provider, provider_listing_client(provider))
+        if listing:
+            repos = listing["repos"]
+            more_repos = bool(listing["has_next"])
     
     if request.method == "POST":
         code = request.form["code"]
@@ -214,12 +447,8 @@ def index():
         file_path = request.form.get("file_path", "")
         
         try:
-            # Process code review
-            analysis = analyze_code(code, groq_client)
-            completion = complete_code(code, groq_client)
-            refactor = refactor_code(code, groq_client)
-            
-            review = f"🔍 Analysis:\n{analysis}\n\n✨ Suggestions:\n{refactor}\n\n⚙️ Completion:\n{completion}"
+            # Process code review (the three model calls run concurrently)
+            review = format_review(review_code(code, session["user_id"], file_path=file_path))
             
             # Save review history
             add_to_history(
@@ -233,93 +462,306 @@ def index():
         except Exception as e:
             review = f"Error processing code: {str(e)}"
     
-    return render_template("index.html", review=review, repos=repos, user=session.get("username"), provider=provider)
+    return render_template(
+        "index.html", review=review, repos=repos, more_repos=more_repos, user=session.get("username"), provider=provider
+    )
+
+@app.route("/repos")
+@login_required
+def list_repos():
+    """One page of the user's provider repositories as JSON, for lazy loading in the UI."""
+    provider = session.get("provider")
+    if not provider or provider not in repo_providers or not repo_providers[provider].authorized:
+        return jsonify({"error": "Connect a GitHub or GitLab account first"}), 401
+    
+    page = max(1, request.args.get("page", 1, type=int))
+    try:
+        with metrics.span("repo_listing"):
+            listing = repo_lists.get(session["user_id"], provider, provider_listing_client(provider), page)
+    except RepoProviderError as e:
+        return jsonify({"error": str(e)}), 502
+    
+    return jsonify({"repos": listing["repos"], "page": page, "has_next": bool(listing["has_next"])})
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_review_response(code, user_id, repo_provider=None, repo_name=None, file_path=None, use_cache=True):
+    """Server-Sent Events response that forwards review tokens as they arrive.
+
+    The assembled review is written to history once every section has finished.
+    A near-identical past review, when caching is allowed, is replayed instead.
+    """
+    def generate():
+        language = detect_language(code, file_path)
+        reused = find_reusable_review(user_id, code, language) if use_cache else None
+        if reused is not None:
+            events = review_events(reused)
+        else:
+            events = stream_review(code, model_client("review", user_id), use_cache=use_cache, language=language)
+        for kind, section, payload in events:
+            if kind == "delta":
+                yield sse_event("delta", {"section": section, "text": payload})
+            elif kind == "error":
+                yield sse_event("error", {"section": section, "error": payload})
+            else:
+                review = {name: payload[name] for name in ("analysis", "suggestions", "completion")}
+                entry_id = None
+                if len(payload["errors"]) < len(review):
+                    entry_id = add_to_history(
+                        user_id=user_id,
+                        code=code,
+                        review=format_review(payload),
+                        repo_provider=repo_provider,
+                        repo_name=repo_name,
+                        file_path=file_path
+                    )
+                yield sse_event("done", {
+                    "review": review,
+                    "errors": payload["errors"],
+                    "static_analysis": payload["static_analysis"],
+                    "entry_id": entry_id,
+                    "reused_from": payload.get("reused_from")
+                })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/review/stream", methods=["POST"])
+@login_required
+def review_stream():
+    """Streaming variant of the index review form."""
+    code = request.form.get("code", "")
+    if not code:
+        return jsonify({"error": "Code is required"}), 400
+    
+    return stream_review_response(
+        code,
+        user_id=session["user_id"],
+        repo_provider=session.get("provider"),
+        repo_name=request.form.get("repo_name", ""),
+        file_path=request.form.get("file_path", "")
+    )
+
+REPO_REVIEW_CHUNK = 20
+
+@app.route("/repo-review", methods=["POST"])
+@login_required
+def repo_review():
+    """Review every supported file of a repository through the provider API.
+
+    Blob SHAs from the previous run are remembered per file, so only files that
+    changed since then are fetched and reviewed. Progress is streamed back as
+    newline-delimited JSON.
+    """
+    provider = session.get("provider")
+    if not provider or provider not in repo_providers or not repo_providers[provider].authorized:
+        return jsonify({"error": "Connect a GitHub or GitLab account first"}), 401
+    
+    data = request.get_json(silent=True) or request.form
+    repo_name = data.get("repo_name", "")
+    if not repo_name:
+        return jsonify({"error": "Repository name is required"}), 400
+    ref = data.get("ref") or None
+    force = str(data.get("force", "")).lower() in ("1", "true", "yes")
+    
+    user_id = session["user_id"]
+    client = repo_providers[provider]
+    previous = {} if force else history_store.repo_file_shas(user_id, provider, repo_name)
+    
+    try:
+        changed, removed = plan_repo_review(
+            provider, client, repo_name, previous,
+            is_supported=lambda path: detect_language("", path) != "unknown",
+            ref=ref
+        )
+    except RepoProviderError as e:
+        return jsonify({"error": f"Could not list repository: {e}"}), 502
+    
+    def generate():
+        yield json.dumps({"repo_name": repo_name, "changed": len(changed), "removed": len(removed)}) + "\n"
+        if removed:
+            history_store.forget_repo_files(user_id, provider, repo_name, removed)
+        
+        reviewed = 0
+        for start in range(0, len(changed), REPO_REVIEW_CHUNK):
+            items = []
+            for f in changed[start:start + REPO_REVIEW_CHUNK]:
+                try:
+                    code = fetch_file(provider, client, repo_name, f["sha"])
+                except (RepoProviderError, UnicodeDecodeError) as e:
+                    yield json.dumps({"file_path": f["path"], "success": False, "error": str(e)}) + "\n"
+                    continue
+                if len(code) > MAX_FILE_BYTES or not code.strip():
+                    yield json.dumps({"file_path": f["path"], "success": False, "skipped": True}) + "\n"
+                    continue
+                items.append({
+                    "file_path": f["path"],
+                    "sha": f["sha"],
+                    "code": code,
+                    "language": detect_language(code, f["path"])
+                })
+            
+            # Write history and file SHAs per chunk so an interrupted run keeps its progress
+            records = []
+            shas = {}
+            for item, result, error in run_review_batch(items, model_client("batch", user_id)):
+                if error:
+                    yield json.dumps({"file_path": item["file_path"], "success": False, "error": error}) + "\n"
+                    continue
+                records.append({
+                    "user_id": user_id,
+                    "code": item["code"],
+                    "review": format_review(result),
+                    "timestamp": int(datetime.now().timestamp()),
+                    "repo_provider": provider,
+                    "repo_name": repo_name,
+                    "file_path": item["file_path"]
+                })
+                shas[item["file_path"]] = item["sha"]
+                yield json.dumps({"file_path": item["file_path"], "success": True, "errors": result["errors"]}) + "\n"
+            if records:
+                history_store.add_many(records)
+                history_store.set_repo_file_shas(
+                    user_id, provider, repo_name, shas, int(datetime.now().timestamp())
+                )
+                reviewed += len(records)
+        
+        yield json.dumps({"done": True, "reviewed": reviewed}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    history = load_history(user_id=session["user_id"])
-    return render_template("dashboard.html", history=history, user=session.get("username"))
+    try:
+        cursor = parse_history_cursor(request.args.get("cursor"))
+    except ValueError:
+        return redirect(url_for("dashboard"))
+    
+    search = {key: request.args.get(key, "").strip() for key in ("q", "repo", "since", "until")}
+    next_page = None
+    if search["q"]:
+        try:
+            history, next_page = search_history(session["user_id"], request.args, SEARCH_PAGE_SIZE)
+        except ValueError:
+            return redirect(url_for("dashboard"))
+        next_cursor = None
+    else:
+        history, next_cursor = history_store.page(
+            session["user_id"],
+            limit=HISTORY_PAGE_SIZE,
+            cursor=cursor,
+            fields=["timestamp", "code", "review", "repo_name", "file_path"],
+            preview=300
+        )
+    trend = history_store.review_lengths(session["user_id"])
+    return render_template(
+        "dashboard.html",
+        history=history,
+        trend=trend,
+        next_cursor=format_history_cursor(next_cursor),
+        search=search,
+        next_page=next_page,
+        user=session.get("username")
+    )
 
-def calculate_acceptance_rate(suggestions):
-    """Calculate acceptance rate for suggestions."""
-    # For now, return a placeholder value
-    # In a real implementation, you'd track which suggestions were actually applied
-    return 50
+@app.route("/dashboard/<int:entry_id>")
+@login_required
+def dashboard_entry(entry_id):
+    entry = history_store.get(entry_id, user_id=session["user_id"])
+    if entry is None:
+        return "Review not found", 404
+    return render_template("history_entry.html", entry=entry, user=session.get("username"))
+
+def calculate_acceptance_rate(user_id):
+    """Percentage of a user's decided suggestions that were accepted (0 if none yet).
+
+    The accepted/ignored counters are maintained as decisions are recorded.
+    """
+    accepted, ignored = history_store.suggestion_counts(user_id)
+    if not accepted + ignored:
+        return 0
+    return round(100 * accepted / (accepted + ignored))
 
 # Helper functions for automated code generation
+LANGUAGE_EXTENSIONS = {
+    'py': 'python', 'python': 'python',
+    'js': 'javascript', 'javascript': 'javascript',
+    'ts': 'typescript', 'typescript': 'typescript',
+    'java': 'java',
+    'rb': 'ruby', 'ruby': 'ruby',
+    'go': 'go',
+    'c': 'c++', 'cpp': 'c++', 'h': 'c++', 'hpp': 'c++',
+}
+
+LANGUAGE_PATTERNS = [
+    ('python', re.compile(r'import\s+[\w.]+|from\s+[\w.]+\s+import')),
+    ('javascript', re.compile(r'function\s+\w+\s*\(|const\s+\w+\s*=|let\s+\w+\s*=|var\s+\w+\s*=')),
+    ('java', re.compile(r'class\s+\w+|public\s+static\s+void')),
+]
+
 def detect_language(code, file_path=None):
     """Detect programming language based on code or file extension."""
     # Extract file extension if path is available
     if file_path:
-        ext = file_path.split('.')[-1].lower()
-        if ext in ['py', 'python']:
-            return 'python'
-        elif ext in ['js', 'javascript']:
-            return 'javascript'
-        elif ext in ['ts', 'typescript']:
-            return 'typescript'
-        elif ext in ['java']:
-            return 'java'
-        elif ext in ['rb', 'ruby']:
-            return 'ruby'
-        elif ext in ['go']:
-            return 'go'
-        elif ext in ['c', 'cpp', 'h', 'hpp']:
-            return 'c++'
+        language = LANGUAGE_EXTENSIONS.get(file_path.split('.')[-1].lower())
+        if language:
+            return language
     
     # Fallback: analyze code patterns
-    if re.search(r'import\s+[\w.]+|from\s+[\w.]+\s+import', code):
-        return 'python'
-    elif re.search(r'function\s+\w+\s*\(|const\s+\w+\s*=|let\s+\w+\s*=|var\s+\w+\s*=', code):
-        return 'javascript'
-    elif re.search(r'class\s+\w+|public\s+static\s+void', code):
-        return 'java'
+    for language, pattern in LANGUAGE_PATTERNS:
+        if pattern.search(code):
+            return language
     
     return 'unknown'
 
 def get_current_scope(code, cursor_position, language='unknown'):
-    """Extract the current code scope (function, class, etc.)."""
-    # Get code until cursor position
-    code_until_cursor = code[:cursor_position]
-    
-    # Find the current function/method/class
-    current_scope = {
-        'type': None,
-        'name': None,
-        'content': '',
-        'indentation': 0
-    }
-    
-    if language == 'python':
-        # Find the last def or class
-        function_match = re.search(r'def\s+(\w+)\s*\([^)]*\)[^:]*:', code_until_cursor)
-        class_match = re.search(r'class\s+(\w+)[^:]*:', code_until_cursor)
-        
-        if function_match:
-            current_scope['type'] = 'function'
-            current_scope['name'] = function_match.group(1)
-        elif class_match:
-            current_scope['type'] = 'class'
-            current_scope['name'] = class_match.group(1)
-    
-    return current_scope
+    """Return the innermost function/class enclosing the cursor.
 
-def generate_code_completions(code, cursor_position, ai_client, max_suggestions=3, file_path=None):
-    """Generate code completion suggestions using AI."""
-    if not ai_client:
-        return []
-    
-    # Detect language
-    language = detect_language(code, file_path)
-    
-    # Get current scope
-    current_scope = get_current_scope(code, cursor_position, language)
+    The dict has 'type', 'name' (dotted, e.g. 'Model.save'), 'content' (the
+    scope's header and its text up to the cursor) and 'indentation'.
+    """
+    return ScopeIndex(code, language).scope_at(cursor_position)
+
+def build_completion_context(code, cursor_position, file_path=None, doc_key=None, edits=None):
+    """Return the language, enclosing scope, the code to send before the cursor and the document text.
+
+    With a doc_key the document's scope index is cached between calls and
+    updated from the edit delta (or from explicit edits instead of code), so a
+    keystroke only re-tokenizes the lines it touched; the document text
+    returned is then the cached copy with the edits applied. Raises LookupError
+    for edits against a document that is not cached or whose ranges do not fit it.
+    """
+    if doc_key is None:
+        language = detect_language(code, file_path)
+        current_scope = get_current_scope(code, cursor_position, language)
+    else:
+        language = document_index.language(doc_key)
+        if language in (None, 'unknown') and edits is None:
+            language = detect_language(code, file_path)
+        synced = document_index.scope_at(
+            doc_key, language, cursor_position, text=None if edits is not None else code, edits=edits
+        )
+        if synced is None:
+            raise LookupError("Unknown or out-of-sync document; send the full code to resync")
+        code, current_scope = synced
     
-    # Extract recent code (last few lines before cursor)
-    lines = code[:cursor_position].split('\n')
-    recent_code = '\n'.join(lines[-min(10, len(lines)):])
+    # Prefer the enclosing scope's own text; fall back to the last few lines at module level
+    if current_scope['content']:
+        recent_code = current_scope['content']
+    else:
+        lines = code[:cursor_position].split('\n')
+        recent_code = '\n'.join(lines[-min(10, len(lines)):])
     
+    return language, current_scope, recent_code, code
+
+def request_code_completions(language, current_scope, recent_code, ai_client, max_suggestions=3):
+    """Ask the model for completions. Raises on API or parsing errors."""
+    recent_code, model, max_tokens = prompt_budget.prepare("autocomplete", recent_code, language)
     # Prepare prompt for the AI
     prompt = f"""
 Given the following {language} code, provide {max_suggestions} code completion suggestions.
@@ -337,25 +779,38 @@ Format as JSON with 'completions' containing a list of objects with 'code' and '
 Each completion should be a coherent code snippet that logically follows the existing code.
 """
     
+    # Call Groq API
+    start = time.perf_counter()
     try:
-        # Call Groq API
         response = ai_client.chat.completions.create(
-            model="mixtral-8x7b-32768",  # Adjust based on available models
+            model=model,
             messages=[
                 {"role": "system", "content": "You are a coding assistant specializing in code completion."},
                 {"role": "user", "content": prompt}
             ],
+            max_tokens=max_tokens,
             response_format={"type": "json_object"}
         )
-        
-        # Extract and parse the result
-        result = response.choices[0].message.content
-        try:
-            suggestions = json.loads(result).get('completions', [])
-            return suggestions
-        except json.JSONDecodeError:
-            return [{"code": "# Error parsing AI response", "explanation": "Could not generate suggestions"}]
-            
+    except Exception as e:
+        metrics.record_model_call("autocomplete", time.perf_counter() - start, error=e)
+        raise
+    metrics.record_model_call("autocomplete", time.perf_counter() - start, response)
+    
+    # Extract and parse the result
+    result = response.choices[0].message.content
+    return json.loads(result).get('completions', [])
+
+def generate_code_completions(code, cursor_position, ai_client, max_suggestions=3, file_path=None):
+    """Generate code completion suggestions using AI."""
+    if not ai_client:
+        return []
+    
+    language, current_scope, recent_code, _ = build_completion_context(code, cursor_position, file_path)
+    
+    try:
+        return request_code_completions(language, current_scope, recent_code, ai_client, max_suggestions)
+    except json.JSONDecodeError:
+        return [{"code": "# Error parsing AI response", "explanation": "Could not generate suggestions"}]
     except Exception as e:
         return [{"code": f"# Error: {str(e)}", "explanation": "Error generating suggestions"}]
 
@@ -363,29 +818,42 @@ Each completion should be a coherent code snippet that logically follows the exi
 @app.route("/automated")
 @login_required
 def automated():
-    suggestions = load_history(user_id=session.get("user_id", ""))
-    
-    # Process suggestions for the template - simplified version
-    processed_suggestions = []
-    for suggestion in suggestions:
-        # Only include if both code and review exist
-        if suggestion.get("code") and suggestion.get("review"):
-            processed_suggestions.append({
-                "id": str(suggestions.index(suggestion)),
-                "type": "analysis",  # Simplified to just one type
-                "original_code": suggestion.get("code", ""),
-                "suggested_code": suggestion.get("review", ""),
-                "timestamp": suggestion.get("timestamp", 0)
-            })
+    """Reviewed entries awaiting a decision; ignored ones are filtered out in the query.
+
+    Suggestion ids are the history entry ids, so they stay stable as history grows.
+    """
+    status = request.args.get("status") or None
+    if status not in (None, "pending", "accepted", "ignored"):
+        return redirect(url_for("automated"))
+    try:
+        cursor = parse_history_cursor(request.args.get("cursor"))
+    except ValueError:
+        return redirect(url_for("automated"))
+    
+    entries, next_cursor = history_store.suggestions(
+        session["user_id"], status=status, limit=HISTORY_PAGE_SIZE, cursor=cursor, preview=2000
+    )
     
-    # Convert to JSON for JavaScript
-    suggestions_json = json.dumps(processed_suggestions)
+    # Process suggestions for the template
+    processed_suggestions = [
+        {
+            "id": str(entry["id"]),
+            "type": "analysis",  # Simplified to just one type
+            "original_code": entry["code"],
+            "suggested_code": entry["review"],
+            "timestamp": entry["timestamp"],
+            "status": entry["status"]
+        }
+        for entry in entries
+    ]
     
     return render_template(
         "automated.html",
         user=session.get("username"),
         suggestions=processed_suggestions,
-        suggestions_json=suggestions_json
+        status=status,
+        next_cursor=format_history_cursor(next_cursor),
+        acceptance_rate=calculate_acceptance_rate(session["user_id"])
     )
 
 # API endpoints
@@ -402,38 +870,63 @@ def auth_status():
     })
 
 @app.route(f"/api/{API_VERSION}/review", methods=["POST"])
+@api_token_required
 def api_review():
-    # Check authentication (using API token for IDE integrations)
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"error": "Unauthorized"}), 401
-    
-    token = auth_header.split(" ")[1]
-    # TODO: Implement proper token validation
-    
     data = request.json
     if not data or "code" not in data:
         return jsonify({"error": "Code is required"}), 400
+    denied = forbidden_user(data.get("user_id"))
+    if denied:
+        return denied
     
     code = data["code"]
     repo_name = data.get("repo_name", "")
     file_path = data.get("file_path", "")
-    user_id = data.get("user_id", "api_user")
+    user_id = g.api_user_id
+    no_cache = bool(data.get("no_cache", False))
+    
+    if data.get("async"):
+        # Job mode: queue the review and return immediately
+        if data.get("callback_url"):
+            try:
+                review_jobs.check_callback(data["callback_url"])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        payload = {
+            "code": code,
+            "user_id": user_id,
+            "provider": data.get("provider"),
+            "repo_name": repo_name,
+            "file_path": file_path,
+            "no_cache": no_cache,
+            "callback_url": data.get("callback_url")
+        }
+        # Only requests that would produce the same review and history entry share a job
+        fingerprint = json.dumps([
+            code, file_path, repo_name, detect_language(code, file_path), payload["provider"], no_cache
+        ])
+        job_id, created = review_jobs.submit(
+            payload, dedupe_key=f"{user_id}:{hashlib.sha256(fingerprint.encode()).hexdigest()}"
+        )
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "deduplicated": not created,
+            "status_url": url_for("api_job_status", job_id=job_id)
+        }), 202
     
     try:
-        # Process code review
-        analysis = analyze_code(code, groq_client)
-        completion = complete_code(code, groq_client)
-        refactor = refactor_code(code, groq_client)
+        # Process code review (the three model calls run concurrently)
+        result = review_code(code, user_id, use_cache=not no_cache, file_path=file_path)
         
         review = {
-            "analysis": analysis,
-            "suggestions": refactor,
-            "completion": completion
+            "analysis": result["analysis"],
+            "suggestions": result["suggestions"],
+            "completion": result["completion"]
         }
         
         # Save review history
-        full_review = f"🔍 Analysis:\n{analysis}\n\n✨ Suggestions:\n{refactor}\n\n⚙️ Completion:\n{completion}"
+        full_review = format_review(result)
         add_to_history(
             user_id=user_id,
             code=code,
@@ -445,7 +938,11 @@ def api_review():
         
         return jsonify({
             "success": True,
-            "review": review
+            "review": review,
+            "partial": bool(result["errors"]),
+            "errors": result["errors"],
+            "static_analysis": result["static_analysis"],
+            "reused_from": result.get("reused_from")
         })
     except Exception as e:
         return jsonify({
@@ -453,33 +950,459 @@ def api_review():
             "error": str(e)
         }), 500
 
+@app.route(f"/api/{API_VERSION}/review/batch", methods=["POST"])
+@api_token_required
+def api_review_batch():
+    """Review many files in one request.
+
+    Results are streamed back as newline-delimited JSON in completion order and
+    history is written once for the whole batch.
+    """
+    data = request.json
+    files = data.get("files") if data else None
+    if not files or not isinstance(files, list):
+        return jsonify({"error": "A list of files is required"}), 400
+    if any(not isinstance(item, dict) or "code" not in item for item in files):
+        return jsonify({"error": "Each file needs a code field"}), 400
+    denied = forbidden_user(data.get("user_id"))
+    if denied:
+        return denied
+    
+    user_id = g.api_user_id
+    provider = data.get("provider")
+    repo_name = data.get("repo_name", "")
+    use_cache = not data.get("no_cache", False)
+    
+    # Group files by language so related reviews are scheduled together
+    items = [
+        dict(item, language=detect_language(item["code"], item.get("file_path")))
+        for item in files
+    ]
+    items.sort(key=lambda item: item["language"])
+    
+    def generate():
+        records = []
+        for item, result, error in run_review_batch(items, model_client("batch", user_id), use_cache=use_cache):
+            line = {"file_path": item.get("file_path", ""), "language": item["language"]}
+            if error:
+                line.update(success=False, error=error)
+            else:
+                line.update(
+                    success=True,
+                    review={name: result[name] for name in ("analysis", "suggestions", "completion")},
+                    errors=result["errors"],
+                    static_analysis=result["static_analysis"]
+                )
+                records.append({
+                    "user_id": user_id,
+                    "code": item["code"],
+                    "review": format_review(result),
+                    "timestamp": int(datetime.now().timestamp()),
+                    "repo_provider": provider,
+                    "repo_name": repo_name,
+                    "file_path": item.get("file_path", "")
+                })
+            yield json.dumps(line) + "\n"
+        
+        if records:
+            history_store.add_many(records)
+        yield json.dumps({"done": True, "reviewed": len(records), "failed": len(items) - len(records)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Diff reviews: only changed hunks go to the model (DIFF_CONTEXT_LINES of context around them)
+DIFF_CONTEXT_LINES = int(os.environ.get("DIFF_CONTEXT_LINES", "3"))
+DIFF_MAX_BYTES = 2_000_000
+
+# Pull request webhooks are accepted only when WEBHOOK_SECRET is set; their reviews belong to WEBHOOK_USER_ID
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_USER_ID = os.environ.get("WEBHOOK_USER_ID", "webhook")
+PROVIDER_API_URLS = {
+    "github": os.environ.get("GITHUB_API_URL", "https://api.github.com/"),
+    "gitlab": os.environ.get("GITLAB_URL", "https://gitlab.com/"),
+}
+
+def provider_api_client(provider):
+    """The connected user's provider session if there is one, else the server's GITHUB_TOKEN / GITLAB_TOKEN."""
+    if has_request_context() and provider in repo_providers and repo_providers[provider].authorized:
+        return provider_listing_client(provider)
+    token = os.environ.get(f"{provider.upper()}_TOKEN")
+    if token:
+        return TokenClient(PROVIDER_API_URLS[provider], {"access_token": token})
+    return None
+
+def review_diff_text(diff_text, user_id, priority="review", use_cache=True, provider=None, repo_name="",
+                     context_lines=DIFF_CONTEXT_LINES):
+    """Review the changed hunks of a unified diff, one model call per file.
+
+    Findings that cite a line shown to the model are returned with their file
+    and new-file line number. History gets one entry per reviewed file.
+    """
+    units = []
+    skipped = []
+    for entry in parse_unified_diff(diff_text):
+        code, lines = (None, set()) if entry["binary"] or not entry["new_path"] else diff_snippet(entry, context_lines)
+        if code is None:
+            skipped.append(entry["path"])
+            continue
+        units.append({
+            "file_path": entry["path"],
+            "code": code,
+            "lines": lines,
+            "language": detect_language("", entry["path"])
+        })
+    
+    files, findings, records = [], [], []
+    for unit, review, error in run_diff_review(units, model_client(priority, user_id), use_cache=use_cache):
+        if error:
+            files.append({"file_path": unit["file_path"], "success": False, "error": error})
+            continue
+        file_findings = map_findings(review, unit["file_path"], unit["lines"])
+        findings.extend(file_findings)
+        files.append({"file_path": unit["file_path"], "success": True, "review": review, "findings": file_findings})
+        records.append({
+            "user_id": user_id,
+            "code": unit["code"],
+            "review": review,
+            "timestamp": int(datetime.now().timestamp()),
+            "repo_provider": provider,
+            "repo_name": repo_name,
+            "file_path": unit["file_path"]
+        })
+    if records:
+        history_store.add_many(records)
+    return {
+        "files": files,
+        "findings": findings,
+        "skipped": skipped,
+        "reviewed": len(records),
+        "failed": len(files) - len(records)
+    }
+
+def process_diff_job(payload):
+    diff_text = payload.get("diff")
+    if diff_text is None:
+        client = provider_api_client(payload["provider"])
+        if client is None:
+            raise RuntimeError(f"No {payload['provider']} token configured")
+        diff_text = fetch_pull_diff(payload["provider"], client, payload["repo_name"], payload["pull_request"])
+    return review_diff_text(
+        diff_text,
+        payload["user_id"],
+        priority="batch",
+        use_cache=not payload.get("no_cache", False),
+        provider=payload.get("provider"),
+        repo_name=payload.get("repo_name", ""),
+        context_lines=payload.get("context", DIFF_CONTEXT_LINES)
+    )
+
+@app.route(f"/api/{API_VERSION}/review/diff", methods=["POST"])
+@api_token_required
+def api_review_diff():
+    """Review only what a unified diff, or a pull/merge request, changes."""
+    data = request.json
+    if not data or not (data.get("diff") or (data.get("repo_name") and data.get("pull_request"))):
+        return jsonify({"error": "A diff, or a repo_name and pull_request, is required"}), 400
+    denied = forbidden_user(data.get("user_id"))
+    if denied:
+        return denied
+    
+    user_id = g.api_user_id
+    provider = data.get("provider")
+    repo_name = data.get("repo_name", "")
+    try:
+        context_lines = max(0, int(data.get("context", DIFF_CONTEXT_LINES)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid context"}), 400
+    
+    diff_text = data.get("diff")
+    if not diff_text:
+        if provider not in repo_providers:
+            return jsonify({"error": "provider must be github or gitlab"}), 400
+        client = provider_api_client(provider)
+        if client is None:
+            return jsonify({"error": f"Connect a {provider} account or configure {provider.upper()}_TOKEN"}), 400
+        try:
+            diff_text = fetch_pull_diff(provider, client, repo_name, data["pull_request"])
+        except ValueError:
+            return jsonify({"error": "Invalid pull_request"}), 400
+        except RepoProviderError as e:
+            return jsonify({"error": f"Could not fetch the pull request: {e}"}), 502
+    if len(diff_text) > DIFF_MAX_BYTES:
+        return jsonify({"error": "Diff too large"}), 413
+    
+    if data.get("async"):
+        if data.get("callback_url"):
+            try:
+                review_jobs.check_callback(data["callback_url"])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        payload = {
+            "kind": "diff",
+            "diff": diff_text,
+            "user_id": user_id,
+            "provider": provider,
+            "repo_name": repo_name,
+            "context": context_lines,
+            "no_cache": bool(data.get("no_cache", False)),
+            "callback_url": data.get("callback_url")
+        }
+        fingerprint = json.dumps([diff_text, provider, repo_name, context_lines, payload["no_cache"]])
+        job_id, created = review_jobs.submit(
+            payload, dedupe_key=f"{user_id}:diff:{hashlib.sha256(fingerprint.encode()).hexdigest()}"
+        )
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "deduplicated": not created,
+            "status_url": url_for("api_job_status", job_id=job_id)
+        }), 202
+    
+    try:
+        result = review_diff_text(
+            diff_text, user_id, use_cache=not data.get("no_cache", False),
+            provider=provider, repo_name=repo_name, context_lines=context_lines
+        )
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    return jsonify(dict(result, success=True))
+
+@app.route("/webhooks/<provider>", methods=["POST"])
+def pull_request_webhook(provider):
+    """Queue a diff review when a GitHub pull request or GitLab merge request gets new commits."""
+    if not WEBHOOK_SECRET or provider not in repo_providers:
+        return jsonify({"error": "Not found"}), 404
+    
+    body = request.get_data()
+    if provider == "github":
+        expected = "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        # Compared as bytes: compare_digest rejects non-ASCII str with a TypeError
+        valid = hmac.compare_digest(request.headers.get("X-Hub-Signature-256", "").encode(), expected.encode())
+        event = request.headers.get("X-GitHub-Event", "")
+    else:
+        valid = hmac.compare_digest(request.headers.get("X-Gitlab-Token", "").encode(), WEBHOOK_SECRET.encode())
+        event = request.headers.get("X-Gitlab-Event", "")
+    if not valid:
+        return jsonify({"error": "Invalid signature"}), 401
+    
+    try:
+        target = pull_request_event(provider, event, json.loads(body or b"{}"))
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"error": "Malformed payload"}), 400
+    if target is None:
+        return jsonify({"ignored": True})
+    
+    payload = dict(target, kind="diff", user_id=WEBHOOK_USER_ID, provider=provider, context=DIFF_CONTEXT_LINES)
+    job_id, created = review_jobs.submit(
+        payload,
+        dedupe_key=f"webhook:{provider}:{target['repo_name']}:{target['pull_request']}:{target['head_sha']}"
+    )
+    return jsonify({"job_id": job_id, "deduplicated": not created}), 202
+
+@app.route(f"/api/{API_VERSION}/jobs/<job_id>", methods=["GET"])
+@api_token_required
+def api_job_status(job_id):
+    job = review_jobs.get(job_id)
+    if job is None or (job["payload"] or {}).get("user_id") != g.api_user_id:
+        return jsonify({"error": "Not found"}), 404
+    
+    return jsonify({
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "created": job["created"],
+        "updated": job["updated"]
+    })
+
+@app.route(f"/api/{API_VERSION}/review/stream", methods=["POST"])
+@api_token_required
+def api_review_stream():
+    """Streaming variant of /api/v1/review using Server-Sent Events."""
+    data = request.json
+    if not data or "code" not in data:
+        return jsonify({"error": "Code is required"}), 400
+    denied = forbidden_user(data.get("user_id"))
+    if denied:
+        return denied
+    
+    return stream_review_response(
+        data["code"],
+        user_id=g.api_user_id,
+        repo_provider=data.get("provider"),
+        repo_name=data.get("repo_name", ""),
+        file_path=data.get("file_path", ""),
+        use_cache=not data.get("no_cache", False)
+    )
+
 @app.route(f"/api/{API_VERSION}/history", methods=["GET"])
+@api_token_required
 def api_history():
-    # Check authentication
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"error": "Unauthorized"}), 401
+    denied = forbidden_user(request.args.get("user_id"))
+    if denied:
+        return denied
+    user_id = g.api_user_id
     
-    token = auth_header.split(" ")[1]
-    # TODO: Implement proper token validation
+    try:
+        cursor = parse_history_cursor(request.args.get("cursor"))
+        limit = min(int(request.args.get("limit", HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid cursor or limit"}), 400
     
-    user_id = request.args.get("user_id", "")
+    fields = None
+    if request.args.get("fields"):
+        fields = [f.strip() for f in request.args["fields"].split(",") if f.strip()]
+        unknown = set(fields) - set(HISTORY_FIELDS) - {"id"}
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    
+    # The ETag covers the user's history version and the page being asked for,
+    # so polling clients get a 304 until a new entry is written
+    etag = hashlib.sha1(
+        f"{history_store.version(user_id)}|{request.query_string.decode()}".encode()
+    ).hexdigest()
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    history, next_cursor = history_store.page(user_id, limit=limit, cursor=cursor, fields=fields)
+    response = jsonify({
+        "history": history,
+        "next_cursor": format_history_cursor(next_cursor)
+    })
+    response.set_etag(etag)
+    return response
+
+@app.route(f"/api/{API_VERSION}/history/<int:entry_id>", methods=["GET"])
+@api_token_required
+def api_history_entry(entry_id):
+    denied = forbidden_user(request.args.get("user_id"))
+    if denied:
+        return denied
+    
+    entry = history_store.get(entry_id, user_id=g.api_user_id)
+    if entry is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"entry": entry})
+
+@app.route(f"/api/{API_VERSION}/history/search", methods=["GET"])
+@api_token_required
+def api_search_history():
+    """Ranked full-text search over the token owner's code, reviews, repositories and file paths."""
+    denied = forbidden_user(request.args.get("user_id"))
+    if denied:
+        return denied
+    if not request.args.get("q", "").strip():
+        return jsonify({"error": "Query parameter q is required"}), 400
+    
+    try:
+        limit = min(int(request.args.get("limit", SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit")
+        results, next_page = search_history(g.api_user_id, request.args, limit)
+    except ValueError:
+        return jsonify({"error": "Invalid limit, page, since or until"}), 400
+    return jsonify({"results": results, "next_page": next_page})
+
+@app.route(f"/api/{API_VERSION}/history/similar", methods=["POST"])
+@api_token_required
+def api_similar_reviews():
+    """The token owner's past reviews of code most similar to the submitted code."""
+    data = request.json
+    if not data or "code" not in data:
+        return jsonify({"error": "Code is required"}), 400
+    denied = forbidden_user(data.get("user_id"))
+    if denied:
+        return denied
+    
+    try:
+        limit = min(int(data.get("limit", 5)), SIMILAR_MAX_RESULTS)
+        min_similarity = float(data.get("min_similarity", 0.5))
+        preview = int(data["preview"]) if data.get("preview") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid limit, min_similarity or preview"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit, min_similarity or preview"}), 400
+    
+    matches = history_store.similar(
+        g.api_user_id, data["code"], limit=limit, min_similarity=min_similarity, preview=preview
+    )
+    return jsonify({"similar": matches})
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route(f"/api/{API_VERSION}/cache/stats", methods=["GET"])
+def api_cache_stats():
+    """Hit/miss counters for the review cache."""
+    return jsonify({"review_cache": review_cache.get_stats()})
+
+def request_user_id():
+    """The owner of the request's Bearer token, else the logged-in user, else None."""
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        return token_store.resolve(auth_header[len("Bearer "):])
+    return session.get("user_id")
+
+def record_suggestion_state(status):
+    user_id = request_user_id()
     if not user_id:
-        return jsonify({"error": "User ID is required"}), 400
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    suggestion_id = (request.json or {}).get("suggestion_id")
+    if not suggestion_id:
+        return jsonify({"error": "Suggestion ID is required"}), 400
+    try:
+        entry_id = int(suggestion_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid suggestion ID"}), 400
     
-    history = load_history(user_id=user_id)
-    return jsonify({"history": history})
+    if not history_store.set_suggestion_state(entry_id, user_id, status):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"success": True, "status": status, "acceptance_rate": calculate_acceptance_rate(user_id)})
 
 @app.route(f"/api/{API_VERSION}/ignore-suggestion", methods=["POST"])
 def ignore_suggestion():
     """API endpoint to ignore a suggestion."""
-    # For simplicity, we're not implementing full authentication here
-    suggestion_id = request.json.get("suggestion_id")
-    if not suggestion_id:
-        return jsonify({"error": "Suggestion ID is required"}), 400
+    return record_suggestion_state("ignored")
+
+@app.route(f"/api/{API_VERSION}/accept-suggestion", methods=["POST"])
+def accept_suggestion():
+    """API endpoint to mark a suggestion as applied."""
+    return record_suggestion_state("accepted")
+
+@app.route(f"/api/{API_VERSION}/suggestions", methods=["GET"])
+def api_suggestions():
+    """A user's suggestions with their decision state, filterable by status and paginated like history."""
+    user_id = request_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    status = request.args.get("status") or None
+    if status not in (None, "pending", "accepted", "ignored"):
+        return jsonify({"error": "status must be pending, accepted or ignored"}), 400
+    try:
+        cursor = parse_history_cursor(request.args.get("cursor"))
+        limit = min(int(request.args.get("limit", HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid cursor or limit"}), 400
     
-    # In a real implementation, you would update the suggestion status in the database
-    return jsonify({"success": True})
+    entries, next_cursor = history_store.suggestions(user_id, status=status, limit=limit, cursor=cursor)
+    accepted, ignored = history_store.suggestion_counts(user_id)
+    return jsonify({
+        "suggestions": entries,
+        "next_cursor": format_history_cursor(next_cursor),
+        "accepted": accepted,
+        "ignored": ignored,
+        "acceptance_rate": calculate_acceptance_rate(user_id)
+    })
 
 @app.route("/autocomplete", methods=["POST"])
 @login_required
@@ -489,59 +1412,92 @@ def web_autocomplete():
     cursor_position = request.json.get("cursor_position", len(code))
     file_path = request.json.get("file_path", "")
     max_suggestions = request.json.get("max_suggestions", 3)
+    # Editors can send {"start", "end", "text"} deltas instead of the whole buffer
+    edits = request.json.get("edits")
+    doc_key = f"{session.get('user_id')}:{file_path}:{request.json.get('document_id', '')}"
     
     try:
-        # Generate code completions
-        completions = generate_code_completions(
-            code=code,
-            cursor_position=cursor_position,
-            ai_client=groq_client,
-            max_suggestions=max_suggestions,
-            file_path=file_path
-        )
+        if edits is not None:
+            edits = [(int(e["start"]), int(e["end"]), str(e["text"])) for e in edits]
+    except (TypeError, KeyError, ValueError):
+        return jsonify({"success": False, "error": "edits must be a list of {start, end, text}"}), 400
+    
+    try:
+        try:
+            language, current_scope, recent_code, code = build_completion_context(
+                code, cursor_position, file_path, doc_key=doc_key, edits=edits
+            )
+        except LookupError as e:
+            return jsonify({"success": False, "error": str(e), "resync": True}), 409
+        client = model_client("interactive", session.get("user_id"))
         
-        language = detect_language(code, file_path)
+        # Fast path: cached by recent code + scope, newer keystrokes from the
+        # same session supersede this one, and the latency budget caps the wait
+        completions, source = autocomplete_service.complete(
+            session_key=f"{session.get('user_id')}:{file_path}",
+            key=completion_key(recent_code, current_scope, language, max_suggestions),
+            compute=lambda: request_code_completions(
+                language, current_scope, recent_code, client, max_suggestions
+            )
+        )
         
         # Format the response for better display
         processed_completions = []
         for completion in completions:
             processed_completions.append({
-                "code": completion["code"],
-                "explanation": completion["explanation"],
+                "code": completion.get("code", ""),
+                "explanation": completion.get("explanation", ""),
                 "language": language
             })
         
-        # Save to history with more detailed information
-        if session.get("user_id"):
-            add_to_history(
-                user_id=session["user_id"],
-                code=code,
-                review=json.dumps(processed_completions),
-                repo_provider=session.get("provider"),
-                repo_name=request.json.get("repo_name", ""),
-                file_path=file_path
-            )
+        # Save to history in the background (sampled by AUTOCOMPLETE_HISTORY_SAMPLE)
+        if session.get("user_id") and source in ("model", "cache"):
+            autocomplete_history.submit({
+                "user_id": session["user_id"],
+                "code": code,
+                "review": json.dumps(processed_completions),
+                "timestamp": int(datetime.now().timestamp()),
+                "repo_provider": session.get("provider"),
+                "repo_name": request.json.get("repo_name", ""),
+                "file_path": file_path
+            })
         
         return jsonify({
             "success": True,
             "language": language,
-            "completions": processed_completions
+            "completions": processed_completions,
+            "source": source
         })
+    except json.JSONDecodeError:
+        return jsonify({
+            "success": False,
+            "error": "Could not parse AI response"
+        }), 502
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
-# Create data directory and files at startup
+def create_app(config=None):
+    """Prepare the data directory and stores and return the app; called once per worker process.
+
+    Every store lives under DATA_DIR and is safe to share between processes:
+    history and jobs are SQLite databases in WAL mode, and the users and
+    token files are updated under an exclusive file lock. Per-process state
+    (caches, scope indexes) is rebuilt in each worker; metrics are merged
+    across workers through METRICS_DIR when it is set.
+    """
+    if config:
+        app.config.update(config)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    history_store.connect()
+    # Pick up jobs queued or left running by a worker that has since exited
+    review_jobs.start()
+    threading.Thread(target=index_history_backlog, name="history-index-backlog", daemon=True).start()
+    # With METRICS_DIR set, /metrics on any worker reports every worker's totals
+    metrics.registry.start_flusher()
+    return app
+
 if __name__ == "__main__":
-    # Create data directory
-    os.makedirs(os.path.join(os.path.dirname(__file__), "data"), exist_ok=True)
-    
-    # Initialize files if they don't exist
-    if not os.path.exists(HISTORY_FILE):
-        save_history([])
-    if not os.path.exists(USERS_FILE):
-        save_users({})
-    
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""Deterministic stand-in for the Groq chat-completions client.
+
+Latency is modelled as a fixed time-to-first-token plus the completion
+length divided by a token rate, so benchmark runs are repeatable and never
+touch the network.
+"""
+import hashlib
+import json
+import time
+from types import SimpleNamespace
+
+
+class FakeCompletions:
+    def __init__(self, latency=0.2, tokens_per_second=200.0, completion_tokens=120, sleep=time.sleep):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.sleep = sleep
+        self.calls = 0
+
+    def _text(self, messages):
+        prompt = messages[-1]["content"]
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        words = [digest[i:i + 6] for i in range(0, len(digest), 6)]
+        return " ".join(words[i % len(words)] for i in range(self.completion_tokens))
+
+    def _usage(self, messages):
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            total_tokens=prompt_tokens + self.completion_tokens,
+        )
+
+    def create(self, model=None, messages=None, stream=False, response_format=None, **kwargs):
+        self.calls += 1
+        text = self._text(messages)
+        if response_format and response_format.get("type") == "json_object":
+            text = json.dumps({
+                "completions": [{"code": "pass", "explanation": text[:40]}],
+                "analysis": text,
+                "suggestions": text,
+                "completion": text,
+            })
+
+        if stream:
+            return self._stream(text)
+
+        self.sleep(self.latency + self.completion_tokens / self.tokens_per_second)
+        message = SimpleNamespace(content=text)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message)],
+            usage=self._usage(messages),
+        )
+
+    def _stream(self, text):
+        self.sleep(self.latency)
+        per_token = 1.0 / self.tokens_per_second
+        for word in text.split(" "):
+            self.sleep(per_token)
+            delta = SimpleNamespace(content=word + " ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class FakeChatClient:
+    """Drop-in for groq.Groq in benchmarks: client.chat.completions.create(...)."""
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeCompletions(**kwargs))
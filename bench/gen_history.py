@@ -0,0 +1,62 @@
+"""Generate a review-history fixture for benchmarks.
+
+    python -m bench.gen_history --entries 100000 --users 50 --db /tmp/bench_history.db
+"""
+import argparse
+import random
+import time
+
+from modules.storage import HistoryStore
+
+SNIPPETS = [
+    "def calc_area(r):\n    pi = 3.14159\n    return pi * r * r\n",
+    "import os\n\nfor name in os.listdir('.'):\n    print(name)\n",
+    "class Stack:\n    def __init__(self):\n        self.items = []\n\n    def push(self, item):\n        self.items.append(item)\n",
+    "function add(a, b) {\n  return a + b;\n}\n",
+    "const total = items.reduce((sum, item) => sum + item.price, 0);\n",
+]
+
+REVIEW = (
+    "🔍 Analysis:\n{body}\n\n✨ Suggestions:\nConsider descriptive names and docstrings.\n\n"
+    "⚙️ Completion:\n{body}"
+)
+
+
+def generate(store, entries, users, seed=0, batch_size=10_000, body_size=800):
+    rng = random.Random(seed)
+    now = int(time.time())
+    start = now - entries
+    written = 0
+    while written < entries:
+        batch = []
+        for i in range(written, min(entries, written + batch_size)):
+            snippet = rng.choice(SNIPPETS)
+            batch.append({
+                "user_id": f"user{rng.randrange(users)}",
+                "code": snippet * rng.randint(1, 4),
+                "review": REVIEW.format(body="x" * rng.randint(body_size // 2, body_size)),
+                "timestamp": start + i,
+                "repo_provider": rng.choice([None, "github", "gitlab"]),
+                "repo_name": rng.choice(["", "acme/api", "acme/web"]),
+                "file_path": rng.choice(["", "app.py", "src/index.js", "billing.py"]),
+            })
+        store.add_many(batch)
+        written += len(batch)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default="bench_history.db")
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    written = generate(HistoryStore(args.db), args.entries, args.users, args.seed)
+    print(f"wrote {written} entries to {args.db} in {time.perf_counter() - began:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
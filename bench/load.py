@@ -0,0 +1,178 @@
+"""Load driver for the main endpoints, backed by the fake LLM client.
+
+In-process (default) the Flask app is driven through its test client with a
+fake model backend and a generated history fixture:
+
+    python -m bench.load --concurrency 16 --requests 400 --output load.json
+
+Against a running server, with real sessions and tokens:
+
+    python -m bench.load --url http://localhost:5000 --username bench --password bench --token <api token>
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_llm import FakeChatClient
+from bench.gen_history import generate
+from bench.report import print_table, summarize, write_output
+
+ENDPOINTS = ("review", "autocomplete", "history", "dashboard")
+
+
+def make_code(i, distinct):
+    n = i % distinct
+    return f"def handler_{n}(request):\n    value = request.get('v{n}')\n    return value * {n}\n"
+
+
+class InProcessTarget:
+    def __init__(self, args):
+        import app
+        from modules.auth import TokenStore
+        from modules.storage import HistoryStore
+
+        self.app = app
+        if args.review_mode:
+            import modules.analyzer
+            modules.analyzer.REVIEW_MODE = args.review_mode
+        fake = FakeChatClient(latency=args.llm_latency, tokens_per_second=args.llm_token_rate)
+        app.groq_client = fake
+        app.llm_scheduler.backend = fake
+
+        workdir = tempfile.mkdtemp(prefix="bench-load-")
+        app.history_store = HistoryStore(os.path.join(workdir, "history.db"))
+        generate(app.history_store, args.history_entries, args.users)
+
+        self.user_id = "user1"
+        app.token_store = TokenStore(os.path.join(workdir, "api_tokens.json"))
+        _, token = app.token_store.create(self.user_id, "bench")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self.app.app.test_client()
+            with client.session_transaction() as session:
+                session["username"] = self.user_id
+                session["user_id"] = self.user_id
+            self._local.client = client
+        return client
+
+    def request(self, method, path, body=None, headers=None):
+        client = self._client()
+        response = client.open(path, method=method, json=body, headers=headers or {})
+        response.get_data()
+        return response.status_code
+
+
+class HttpTarget:
+    def __init__(self, args):
+        self.base = args.url.rstrip("/")
+        self.args = args
+        self.user_id = args.username or "user1"
+        self.headers = {"Authorization": f"Bearer {args.token}"}
+        self._local = threading.local()
+
+    def _opener(self):
+        opener = getattr(self._local, "opener", None)
+        if opener is None:
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            if self.args.username:
+                form = urllib.parse.urlencode({"username": self.args.username, "password": self.args.password}).encode()
+                opener.open(self.base + "/login", data=form).read()
+            self._local.opener = opener
+        return opener
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method, headers=dict(headers or {}))
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with self._opener().open(req) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def make_call(target, endpoint, i, args):
+    if endpoint == "review":
+        body = {"code": make_code(i, args.distinct), "file_path": "bench.py"}
+        return lambda: target.request("POST", "/api/v1/review", body, target.headers)
+    if endpoint == "autocomplete":
+        code = make_code(i, args.distinct)
+        body = {"code": code, "cursor_position": len(code), "file_path": "bench.py"}
+        return lambda: target.request("POST", "/autocomplete", body)
+    if endpoint == "history":
+        path = "/api/v1/history?limit=50&fields=id,timestamp,file_path"
+        return lambda: target.request("GET", path, headers=target.headers)
+    if endpoint == "dashboard":
+        return lambda: target.request("GET", "/dashboard")
+    raise ValueError(endpoint)
+
+
+def run_endpoint(target, endpoint, args):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        call = make_call(target, endpoint, i, args)
+        start = time.perf_counter()
+        try:
+            status = call()
+        except Exception:
+            status = 599
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors += 1
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    return summarize(latencies, time.perf_counter() - began, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--distinct", type=int, default=50, help="distinct code snippets (controls cache hit rate)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake time to first token, seconds")
+    parser.add_argument("--llm-token-rate", type=float, default=400.0, help="fake tokens per second")
+    parser.add_argument("--review-mode", choices=("separate", "combined"),
+                        help="override REVIEW_MODE for the in-process app")
+    parser.add_argument("--history-entries", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--token", help="API bearer token")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    target = HttpTarget(args) if args.url else InProcessTarget(args)
+    results = {}
+    for endpoint in args.endpoints.split(","):
+        results[endpoint] = run_endpoint(target, endpoint.strip(), args)
+
+    print_table(results)
+    if args.output:
+        write_output(args.output, "load", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Micro-benchmarks for history loading and the autocomplete helpers.
+
+    python -m bench.micro --entries 10000 --output micro.json
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from bench.gen_history import generate
+from bench.report import print_table, summarize, write_output
+
+
+def measure(fn, repeat):
+    latencies = []
+    began = time.perf_counter()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - began)
+
+
+def sample_code(lines):
+    body = []
+    for i in range(lines // 10):
+        body.append(f"class Model{i}:")
+        body.append(f"    def method_{i}(self, value):")
+        body.extend(f"        value = value + {j}" for j in range(7))
+        body.append("")
+    return "import os\n" + "\n".join(body)
+
+
+def keystrokes(code):
+    """One typed character per call against a cached document index, as /autocomplete sees it."""
+    from modules.scope_index import DocumentIndex
+
+    index = DocumentIndex()
+    cursor = [len(code) // 2]
+    index.scope_at("bench", "python", cursor[0], text=code)
+
+    def step():
+        index.scope_at("bench", "python", cursor[0] + 1, edits=[(cursor[0], cursor[0], "x")])
+        cursor[0] += 1
+    return step
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    import app
+    from modules.storage import HistoryStore
+
+    workdir = tempfile.mkdtemp(prefix="bench-micro-")
+    store = HistoryStore(os.path.join(workdir, "history.db"))
+    generate(store, args.entries, args.users)
+    app.history_store = store
+
+    results = {}
+    results["load_history(user)"] = measure(lambda: app.load_history(user_id="user1"), max(1, args.repeat // 10))
+    results["history_page(user)"] = measure(lambda: store.page("user1", limit=50, fields=["id", "timestamp"]), args.repeat)
+    for lines in (100, 2000):
+        code = sample_code(lines)
+        results[f"detect_language({lines} lines)"] = measure(lambda: app.detect_language(code), args.repeat)
+        results[f"get_current_scope({lines} lines)"] = measure(
+            lambda: app.get_current_scope(code, len(code) // 2, "python"), args.repeat
+        )
+        results[f"scope keystroke({lines} lines)"] = measure(keystrokes(code), args.repeat)
+
+    print_table(results)
+    if args.output:
+        write_output(args.output, "micro", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Latency summaries and machine-readable benchmark output."""
+import json
+import platform
+import time
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def print_table(results):
+    print(f"{'benchmark':<28}{'reqs':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<28}{r['requests']:>8}{r['errors']:>6}{r['rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+
+def write_output(path, kind, config, results):
+    """Write a JSON document that later runs can be diffed against."""
+    document = {
+        "kind": kind,
+        "created": int(time.time()),
+        "python": platform.python_version(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
@@ -0,0 +1,138 @@
+"""Multi-process write stress test: proves no history, user or token writes are lost.
+
+Starts N worker processes sharing one DATA_DIR, as a multi-worker server
+would, each driving the app with M concurrent threads against the fake LLM:
+
+    python -m bench.stress --workers 4 --concurrency 8 --requests 25
+
+Every thread registers a user and posts reviews with distinct code; every
+worker creates an API token. Afterwards the shared stores are counted and the
+run fails (exit status 1) if anything is missing.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.report import print_table, summarize, write_output
+
+
+def stress_code(worker, thread, i):
+    # Distinct enough that neither the review cache nor similar-review reuse skips a write
+    return f"def w{worker}_t{thread}_r{i}(x):\n    return x * {worker * 1_000_000 + thread * 1_000 + i}\n"
+
+
+def run_worker(worker, args, data_dir, results):
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["SIMILAR_REUSE_THRESHOLD"] = "0"
+    import app as app_module
+    from bench.fake_llm import FakeChatClient
+
+    app = app_module.create_app()
+    fake = FakeChatClient(latency=args.llm_latency, tokens_per_second=args.llm_token_rate)
+    app_module.groq_client = fake
+    app_module.llm_scheduler.backend = fake
+
+    _, token = app_module.token_store.create(f"stress-w{worker}", "stress")
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one_thread(thread):
+        nonlocal errors
+        client = app.test_client()
+        username = f"stress-w{worker}-t{thread}"
+        response = client.post("/register", data={
+            "username": username, "password": "stress", "confirm_password": "stress"
+        })
+        failed = int(response.status_code != 302)
+        timings = []
+        for i in range(args.requests):
+            start = time.perf_counter()
+            response = client.post("/api/v1/review", json={"code": stress_code(worker, thread, i)}, headers=headers)
+            timings.append(time.perf_counter() - start)
+            failed += int(response.status_code != 200)
+        with lock:
+            latencies.extend(timings)
+            errors += failed
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one_thread, range(args.concurrency)))
+    results.put((worker, latencies, errors, time.perf_counter() - began))
+
+
+def count_writes(data_dir, args):
+    from modules.auth import JsonFile
+    from modules.storage import HistoryStore
+
+    store = HistoryStore(os.path.join(data_dir, "history.db"))
+    conn = store.connect()
+    users = JsonFile(os.path.join(data_dir, "users.json")).load()
+    tokens = JsonFile(os.path.join(data_dir, "api_tokens.json")).load()
+    return {
+        "history": (conn.execute("SELECT COUNT(*) FROM history").fetchone()[0], args.workers * args.concurrency * args.requests),
+        "users": (len(users), args.workers * args.concurrency),
+        "tokens": (len(tokens), args.workers),
+        "similarity_index": (
+            conn.execute("SELECT COUNT(*) FROM similarity_signatures").fetchone()[0],
+            args.workers * args.concurrency * args.requests,
+        ),
+        "search_index": (
+            conn.execute("SELECT COUNT(*) FROM history_fts_docsize").fetchone()[0],
+            args.workers * args.concurrency * args.requests,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent request threads per worker")
+    parser.add_argument("--requests", type=int, default=25, help="reviews per thread")
+    parser.add_argument("--llm-latency", type=float, default=0.01, help="fake time to first token, seconds")
+    parser.add_argument("--llm-token-rate", type=float, default=5000.0, help="fake tokens per second")
+    parser.add_argument("--data-dir", help="shared data directory (default: a new temporary one)")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-stress-")
+    # Fresh interpreters, like a pre-fork server without preload_app
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(worker, args, data_dir, results))
+        for worker in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    finished = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [latency for _, worker_latencies, _, _ in finished for latency in worker_latencies]
+    errors = sum(worker_errors for _, _, worker_errors, _ in finished)
+    elapsed = max(worker_elapsed for _, _, _, worker_elapsed in finished)
+    summary = {"review": summarize(latencies, elapsed, errors)}
+    print_table(summary)
+
+    counts = count_writes(data_dir, args)
+    lost = False
+    for name, (found, expected) in counts.items():
+        status = "ok" if found == expected else "LOST"
+        lost = lost or found != expected
+        print(f"{name:<28}{found:>8} / {expected:<8}{status}")
+    print(f"data dir: {data_dir}")
+
+    if args.output:
+        summary["writes"] = {name: {"found": found, "expected": expected} for name, (found, expected) in counts.items()}
+        write_output(args.output, "stress", vars(args), summary)
+    sys.exit(1 if lost or errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,272 @@
+import ast
+import io
+import keyword
+import math
+import re
+import tokenize
+
+# Thresholds for the local smell checks
+MAX_FUNCTION_LINES = 50
+MAX_PARAMETERS = 5
+MAX_NESTING = 4
+MAX_COMPLEXITY = 10
+
+# Nodes that add a decision point for cyclomatic complexity
+DECISION_NODES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+    ast.With, ast.AsyncWith, ast.Assert, ast.comprehension, ast.match_case,
+)
+NESTING_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.With, ast.AsyncWith)
+
+
+class _Survey(ast.NodeVisitor):
+    """Collects everything the local checks need in a single walk of the tree.
+
+    Each function's complexity and nesting depth are accumulated in a frame
+    while its body is visited, so no subtree is walked twice.
+    """
+
+    def __init__(self):
+        self.used = set()
+        self.imports = []
+        self.functions = []  # (node, complexity, nesting depth)
+        self.smells = []
+        # [complexity, current depth, deepest depth] of the scope being scored
+        self._frame = [1, 0, 0]
+        self.module_complexity = 1
+
+    def survey(self, tree):
+        self.visit(tree)
+        self.module_complexity = self._frame[0]
+        return self
+
+    def _scoped(self, node):
+        outer, self._frame = self._frame, [1, 0, 0]
+        self.generic_visit(node)
+        frame, self._frame = self._frame, outer
+        return frame
+
+    def _visit_function(self, node):
+        frame = self._scoped(node)
+        self.functions.append((node, frame[0], frame[2]))
+        self._function_smells(node, frame[0], frame[2])
+
+    visit_FunctionDef = visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node):
+        # Class bodies, like nested functions, are not scored with their parent
+        self._scoped(node)
+
+    visit_Lambda = visit_ClassDef
+
+    def generic_visit(self, node):
+        frame = self._frame
+        if isinstance(node, DECISION_NODES):
+            frame[0] += 1
+        if isinstance(node, NESTING_NODES):
+            frame[1] += 1
+            frame[2] = max(frame[2], frame[1])
+            super().generic_visit(node)
+            frame[1] -= 1
+        else:
+            super().generic_visit(node)
+
+    def visit_BoolOp(self, node):
+        self._frame[0] += len(node.values) - 1
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        self.used.add(node.id)
+
+    def visit_Assign(self, node):
+        # Names re-exported through __all__ count as used
+        if any(isinstance(t, ast.Name) and t.id == '__all__' for t in node.targets) \
+                and isinstance(node.value, (ast.List, ast.Tuple)):
+            self.used.update(e.value for e in node.value.elts if isinstance(e, ast.Constant))
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        self.imports.append(node)
+
+    def visit_ImportFrom(self, node):
+        self.imports.append(node)
+        if any(a.name == '*' for a in node.names):
+            self._smell('star_import', node, f"'from {node.module} import *' hides where names come from")
+
+    def visit_ExceptHandler(self, node):
+        if node.type is None:
+            self._smell('bare_except', node,
+                "Bare 'except:' also catches SystemExit and KeyboardInterrupt", 'warning')
+        self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(comparator, ast.Constant) \
+                    and comparator.value is None:
+                self._smell('none_comparison', node, "Compare to None with 'is' / 'is not'")
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and node.func.id in ('eval', 'exec'):
+            self._smell('eval_usage', node, f"Use of {node.func.id}() can execute arbitrary code", 'warning')
+        self.generic_visit(node)
+
+    def _function_smells(self, node, complexity, depth):
+        length = node.end_lineno - node.lineno + 1
+        if length > MAX_FUNCTION_LINES:
+            self._smell('long_function', node,
+                f"Function '{node.name}' is {length} lines long; consider splitting it")
+        params = len(node.args.args) + len(node.args.kwonlyargs) + len(node.args.posonlyargs)
+        if params > MAX_PARAMETERS:
+            self._smell('too_many_parameters', node, f"Function '{node.name}' takes {params} parameters")
+        if complexity > MAX_COMPLEXITY:
+            self._smell('high_complexity', node,
+                f"Function '{node.name}' has cyclomatic complexity {complexity}")
+        for default in node.args.defaults + [d for d in node.args.kw_defaults if d]:
+            if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                self._smell('mutable_default', default,
+                    f"Function '{node.name}' uses a mutable default argument", 'warning')
+        if depth > MAX_NESTING:
+            self._smell('deep_nesting', node, f"Function '{node.name}' nests blocks {depth} levels deep")
+
+    def _smell(self, issue_type, node, message, severity='info'):
+        self.smells.append({'type': issue_type, 'line': node.lineno, 'severity': severity, 'message': message})
+
+
 class CodeAnalyzer:
     def __init__(self, code):
         self.code = code
         self.issues = []
         self.syntax_error = None
+        self.tree = None
+        self.survey = None
 
     def parse(self):
         try:
-            compile(self.code, '<string>', 'exec')
+            self.tree = ast.parse(self.code)
+            compile(self.tree, '<string>', 'exec')
+            self.survey = _Survey().survey(self.tree)
             return True
-        except SyntaxError as e:
+        except (SyntaxError, ValueError, RecursionError, MemoryError) as e:
+            # Pathologically nested input exhausts the parser's stack or memory
+            self.tree = None
             self.syntax_error = {
-                'line': e.lineno,
-                'msg': str(e)
+                'line': getattr(e, 'lineno', None),
+                'msg': str(e) or 'code is too deeply nested to parse'
             }
             return False
 
     def get_smart_suggestions(self, refactor_type='all'):
         suggestions = []
-        # Add your intelligent suggestion logic here
-        # Example: Check for common patterns, code smells, etc.
+        if self.tree is None and not self.parse():
+            suggestions.append({
+                'type': 'syntax_error',
+                'line': self.syntax_error['line'],
+                'severity': 'error',
+                'message': self.syntax_error['msg']
+            })
+            self.issues = suggestions
+            return suggestions
+
+        suggestions.extend(self._unused_imports())
+        suggestions.extend(self._unused_functions())
+        suggestions.extend(self.survey.smells)
+
+        if refactor_type != 'all':
+            suggestions = [s for s in suggestions if s['type'] == refactor_type]
+        suggestions.sort(key=lambda s: s['line'] or 0)
+        self.issues = suggestions
         return suggestions
 
+    def _unused_imports(self):
+        used = self.survey.used
+        issues = []
+        for node in self.survey.imports:
+            if isinstance(node, ast.ImportFrom) and node.module == '__future__':
+                continue
+            for alias in node.names:
+                if alias.name == '*':
+                    continue
+                bound = alias.asname or alias.name.split('.')[0]
+                if bound not in used:
+                    issues.append({
+                        'type': 'unused_import',
+                        'line': node.lineno,
+                        'name': bound,
+                        'severity': 'warning',
+                        'message': f"'{alias.name}' is imported but never used"
+                    })
+        return issues
+
+    def _unused_functions(self):
+        used = self.survey.used
+        issues = []
+        for node in self.tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if node.name.startswith('__') or node.decorator_list:
+                    continue
+                if node.name not in used and node.name != 'main':
+                    issues.append({
+                        'type': 'unused_function',
+                        'line': node.lineno,
+                        'name': node.name,
+                        'severity': 'info',
+                        'message': f"Function '{node.name}' is defined but never called in this file"
+                    })
+        return issues
+
 class CodeRefactorer:
     def __init__(self, code, issues):
         self.code = code
         self.issues = issues
 
     def apply_refactorings(self):
-        # Add your refactoring logic here
-        return self.code
+        # Only mechanical, behaviour-preserving fixes are applied locally
+        lines = self.code.split('\n')
+        unused = {}
+        for issue in self.issues:
+            if issue['type'] == 'unused_import':
+                unused.setdefault(issue['line'], set()).add(issue['name'])
+
+        none_comparisons = {i['line'] for i in self.issues if i['type'] == 'none_comparison'}
+
+        result = []
+        for line_no, line in enumerate(lines, start=1):
+            if line_no in unused:
+                line = self._drop_imports(line, unused[line_no])
+                if line is None:
+                    continue
+            if line_no in none_comparisons:
+                line = re.sub(r'!=\s*None\b', 'is not None', line)
+                line = re.sub(r'==\s*None\b', 'is None', line)
+            result.append(line.rstrip())
+        return '\n'.join(result)
+
+    @staticmethod
+    def _drop_imports(line, names):
+        # Single-line "import a, b" / "from x import a, b" statements only
+        match = re.match(r'^(\s*)(import|from\s+[\w.]+\s+import)\s+([\w.,\s]+?)\s*(#.*)?$', line)
+        if not match:
+            return line
+        indent, head, targets, comment = match.groups()
+        kept = []
+        for target in targets.split(','):
+            target = target.strip()
+            bound = target.split(' as ')[-1].strip() if ' as ' in target else target.split('.')[0]
+            if bound not in names:
+                kept.append(target)
+        if not kept:
+            return None if not indent else f"{indent}pass"
+        return f"{indent}{head} {', '.join(kept)}" + (f"  {comment}" if comment else '')
 
 class IntelligentSuggestions:
     def __init__(self, code, context=None):
         self.code = code
         self.context = context or {}
+        self.analyzer = CodeAnalyzer(code)
 
     def analyze(self):
-        suggestions = []
-        # Add your intelligent analysis logic here
-        # Example: Pattern matching, best practices, etc.
+        suggestions = self.analyzer.get_smart_suggestions()
         return {
             'suggestions': suggestions,
             'metrics': {
@@ -48,9 +276,187 @@ class IntelligentSuggestions:
         }
 
     def _calculate_complexity(self):
-        # Add complexity calculation logic
-        return 0
+        # Highest cyclomatic complexity of any function, or of the module body
+        if self.analyzer.tree is None and not self.analyzer.parse():
+            return 0
+        survey = self.analyzer.survey
+        return max([complexity for _, complexity, _ in survey.functions] + [survey.module_complexity])
+
+    def _halstead_volume(self):
+        operators, operands = [], []
+        try:
+            for tok in tokenize.generate_tokens(io.StringIO(self.code).readline):
+                if tok.type == tokenize.OP or (tok.type == tokenize.NAME and keyword.iskeyword(tok.string)):
+                    operators.append(tok.string)
+                elif tok.type in (tokenize.NAME, tokenize.NUMBER, tokenize.STRING):
+                    operands.append(tok.string)
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            return 0
+        vocabulary = len(set(operators)) + len(set(operands))
+        length = len(operators) + len(operands)
+        return length * math.log2(vocabulary) if vocabulary > 1 else 0
 
     def _calculate_maintainability(self):
-        # Add maintainability index calculation
-        return 0
\ No newline at end of file
+        # Maintainability index normalized to 0-100 (the Visual Studio variant)
+        if self.analyzer.tree is None and not self.analyzer.parse():
+            return 0
+        loc = sum(1 for line in self.code.split('\n') if line.strip() and not line.strip().startswith('#'))
+        if loc == 0:
+            return 100
+        volume = max(self._halstead_volume(), 1)
+        survey = self.analyzer.survey
+        complexity = survey.module_complexity + sum(c for _, c, _ in survey.functions)
+        index = 171 - 5.2 * math.log(volume) - 0.23 * complexity - 16.2 * math.log(loc)
+        return round(max(0, index * 100 / 171), 1)
+
+
+def local_precheck(code, language='python'):
+    # Millisecond-scale pass run before any model call. Syntax and smell
+    # checks only apply to Python; other languages get the triviality check.
+    meaningful = [
+        line for line in code.split('\n')
+        if line.strip() and not line.strip().startswith(('#', '//'))
+    ]
+    result = {
+        'trivial': not meaningful,
+        'syntax_error': None,
+        'findings': [],
+        'metrics': {},
+    }
+    if language not in ('python', 'unknown') or result['trivial']:
+        return result
+
+    analyzer = CodeAnalyzer(code)
+    if not analyzer.parse():
+        # Unknown languages that do not compile as Python are simply not Python
+        if language == 'python':
+            result['syntax_error'] = analyzer.syntax_error
+        return result
+
+    suggestions = IntelligentSuggestions(code)
+    suggestions.analyzer = analyzer
+    analysis = suggestions.analyze()
+    result['findings'] = analysis['suggestions']
+    result['metrics'] = analysis['metrics']
+    return result
+
+
+def estimate_tokens(text):
+    # Rough estimate: about four characters per token for source code
+    return len(text) // 4 + 1
+
+
+class CodeChunker:
+    # Lines that start a new top-level unit in brace/keyword languages
+    BOUNDARY_PATTERNS = {
+        'javascript': r'^\s{0,4}(export\s+)?(default\s+)?(async\s+)?(function\b|class\b|(const|let|var)\s+\w+\s*=\s*(async\s*)?(\(|function))',
+        'typescript': r'^\s{0,4}(export\s+)?(default\s+)?(abstract\s+)?(async\s+)?(function\b|class\b|interface\b|type\s+\w+\s*=|(const|let|var)\s+\w+\s*=\s*(async\s*)?(\(|function))',
+        'java': r'^\s{0,4}(public|private|protected|static|final|abstract|class|interface|enum|@)',
+        'ruby': r'^\s{0,2}(def|class|module)\b',
+        'go': r'^(func|type)\b',
+        'c++': r'^(\w[\w:<>,\s\*&]*\s+\**\w[\w:]*\s*\([^;]*$|class\b|struct\b|namespace\b|template\b)',
+        'unknown': r'^\s{0,4}(def|class|function|func|fn|public|private|protected|module)\b',
+    }
+
+    def __init__(self, code, language='unknown', max_tokens=3000):
+        self.code = code
+        self.language = language
+        self.max_tokens = max_tokens
+        self.lines = code.split('\n')
+
+    def chunks(self):
+        """Split the code into chunks of whole functions/classes within the token budget.
+
+        Each chunk is a dict with 'start_line' and 'end_line' (1-based, inclusive),
+        'name' and 'code'.
+        """
+        units = None
+        if self.language in ('python', 'unknown') and CodeAnalyzer(self.code).parse():
+            units = self._python_units()
+        if units is None:
+            units = self._pattern_units()
+        return self._pack(units)
+
+    def _python_units(self):
+        try:
+            tree = ast.parse(self.code)
+        except (SyntaxError, ValueError, RecursionError, MemoryError):
+            return None
+        return self._units_from_nodes(tree.body, 1, len(self.lines))
+
+    def _node_span(self, node):
+        start = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+        return start, node.end_lineno
+
+    def _units_from_nodes(self, nodes, first_line, last_line):
+        units = []
+        cursor = first_line
+        for node in nodes:
+            start, end = self._node_span(node)
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            if start > cursor:
+                units.append((cursor, start - 1, None))
+            if isinstance(node, ast.ClassDef) and self._tokens(start, end) > self.max_tokens:
+                # Oversized class: keep its header together and split at method boundaries
+                body_start = self._node_span(node.body[0])[0]
+                units.append((start, body_start - 1, node.name))
+                units.extend(
+                    (s, e, f"{node.name}.{name}" if name else node.name)
+                    for s, e, name in self._units_from_nodes(node.body, body_start, end)
+                )
+            else:
+                units.append((start, end, node.name))
+            cursor = end + 1
+        if cursor <= last_line:
+            units.append((cursor, last_line, None))
+        return [u for u in units if u[0] <= u[1]]
+
+    def _pattern_units(self):
+        pattern = re.compile(self.BOUNDARY_PATTERNS.get(self.language, self.BOUNDARY_PATTERNS['unknown']))
+        starts = [1] + [i + 1 for i, line in enumerate(self.lines) if i > 0 and pattern.match(line)]
+        ends = [s - 1 for s in starts[1:]] + [len(self.lines)]
+        return [(s, e, None) for s, e in zip(starts, ends) if s <= e]
+
+    def _tokens(self, start, end):
+        return estimate_tokens('\n'.join(self.lines[start - 1:end]))
+
+    def _pack(self, units):
+        chunks = []
+        current = None
+        for start, end, name in units:
+            for s, e in self._split_oversized(start, end):
+                if current and self._tokens(current[0], e) <= self.max_tokens:
+                    current = (current[0], e, current[2] or name)
+                else:
+                    if current:
+                        chunks.append(current)
+                    current = (s, e, name)
+        if current:
+            chunks.append(current)
+        return [
+            {
+                'start_line': s,
+                'end_line': e,
+                'name': name,
+                'code': '\n'.join(self.lines[s - 1:e]),
+            }
+            for s, e, name in chunks
+        ]
+
+    def _split_oversized(self, start, end):
+        # A single unit over budget is cut into line ranges that fit
+        if self._tokens(start, end) <= self.max_tokens:
+            return [(start, end)]
+        pieces = []
+        piece_start = start
+        size = 0
+        for line_no in range(start, end + 1):
+            line_tokens = estimate_tokens(self.lines[line_no - 1])
+            if size and size + line_tokens > self.max_tokens:
+                pieces.append((piece_start, line_no - 1))
+                piece_start = line_no
+                size = 0
+            size += line_tokens
+        pieces.append((piece_start, end))
+        return pieces
@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Requests mostly wait on the model API, and streaming reviews hold a thread for
+# their whole duration, so each worker serves several requests on threads
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+
+# Model calls (REVIEW_CALL_TIMEOUT) and streamed reviews can run for a while
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+
+# Every worker imports the app itself: the stores open per-process SQLite
+# connections and start background threads, neither of which survives a fork
+preload_app = False
+
+accesslog = "-"
+
+# Multiprocess metrics: every worker writes snapshots to METRICS_DIR and
+# /metrics merges them, so stale snapshots from a previous run are cleared
+# first, and exited workers' gauges are dropped (their counters are kept).
+metrics_dir = os.environ.get("METRICS_DIR")
+
+
+def on_starting(server):
+    if metrics_dir:
+        from modules.metrics import clear_directory
+        os.makedirs(metrics_dir, exist_ok=True)
+        clear_directory(metrics_dir)
+
+
+def child_exit(server, worker):
+    if metrics_dir:
+        from modules.metrics import mark_process_dead
+        mark_process_dead(worker.pid, metrics_dir)
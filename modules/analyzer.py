@@ -1,23 +1,692 @@
-def analyze_code(code, client):
-    prompt = f"Review this code for bugs, security issues, and optimizations:\n\n{code}"
-    response = client.chat.completions.create(
-        model="llama3-70b-8192",
-        messages=[{"role": "user", "content": prompt}],
-    )
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+
+from code_analyzer import CodeChunker, estimate_tokens, local_precheck
+from modules.budget import PromptBudget
+from modules.cache import ReviewCache, make_key
+from modules.metrics import record_model_call
+
+PROMPTS = {
+    "analysis": "Review this code for bugs, security issues, and optimizations:\n\n{code}",
+    "completion": "Complete the following code:\n\n{code}",
+    "suggestions": "Suggest refactoring techniques for better maintainability and readability:\n\n{code}",
+    # Combined mode: all three sections from one structured-output call
+    "review": (
+        "Review the code below and answer with a JSON object with exactly three string fields:\n"
+        '"analysis": bugs, security issues, and optimizations;\n'
+        '"suggestions": refactoring techniques for better maintainability and readability;\n'
+        '"completion": a completion of the code.\n\n{code}'
+    ),
+    # Diff mode: only the changed hunks, numbered with their lines in the new file
+    "diff": (
+        "Review this change. Lines marked + were added and - removed; unmarked lines are "
+        "unchanged context, and the left column is the line number in the new file. "
+        "Report bugs, security issues and maintainability problems in the changed lines only, "
+        'one per line, each starting with "Line N:".\n\n{code}'
+    ),
+}
+
+# "separate" sends one prompt per section; "combined" asks for all of them in a
+# single JSON response and falls back to separate prompts for whatever it lacks
+REVIEW_MODE = os.environ.get("REVIEW_MODE", "separate")
+
+# Concurrency settings, configurable per deployment
+MAX_INFLIGHT_CALLS = int(os.environ.get("REVIEW_MAX_INFLIGHT", "6"))
+CALL_TIMEOUT = float(os.environ.get("REVIEW_CALL_TIMEOUT", "60"))
+
+# Files estimated above this many tokens are reviewed in chunks
+CHUNK_TOKENS = int(os.environ.get("REVIEW_CHUNK_TOKENS", "3000"))
+
+# Files reviewed at once by one user's batch
+MAX_BATCH_FILES = int(os.environ.get("REVIEW_BATCH_FILES", "4"))
+
+# Users whose worker pools are kept; the least recently used are shut down beyond this
+MAX_USER_POOLS = int(os.environ.get("REVIEW_USER_POOLS", "32"))
+
+# Content-addressed cache of section results (REVIEW_CACHE_SIZE / _TTL / _DIR)
+review_cache = ReviewCache.from_env()
+
+# Input compaction, token caps and per-task model routing (MODEL_ROUTING)
+prompt_budget = PromptBudget.from_env()
+
+# Task names used in metrics
+METRIC_TASKS = {
+    "analysis": "analysis", "suggestions": "refactor", "completion": "completion", "review": "combined", "diff": "diff",
+}
+
+def _submit(executor, fn, *args):
+    # Carry the caller's context (e.g. the per-request timing breakdown) into the pool thread
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+class _UserPools:
+    """A thread pool per user, so queued work only ever waits behind the same user's.
+
+    The model scheduler caps how many calls each user has in flight. In one
+    shared pool, a user's surplus chunk or batch calls would hold workers while
+    blocked on that cap, and every other user's calls would queue behind them.
+    Clients without a user_id (unscheduled clients) share one pool.
+    """
+
+    def __init__(self, workers, prefix, max_users=MAX_USER_POOLS):
+        self.workers = workers
+        self.prefix = prefix
+        self.max_users = max_users
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, client, fn, *args):
+        user_id = getattr(client, "user_id", None)
+        with self._lock:
+            pool = self._pools.pop(user_id, None)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.prefix)
+            self._pools[user_id] = pool
+            while len(self._pools) > self.max_users:
+                # Work already queued on an evicted pool still runs to completion
+                self._pools.popitem(last=False)[1].shutdown(wait=False)
+            return _submit(pool, fn, *args)
+
+# Model calls and batch files run on per-user pools
+_executor = _UserPools(MAX_INFLIGHT_CALLS, "review")
+_batch_executor = _UserPools(MAX_BATCH_FILES, "review-batch")
+
+def _call_options(deadline):
+    """The timeout= for a model call made for a review that must finish by deadline (monotonic)."""
+    if deadline is None:
+        return {}
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        # The caller has already given up on this call's result
+        raise TimeoutError("Review deadline passed before the model call started")
+    return {"timeout": remaining}
+
+def _run_prompt(task, code, client, context="", language="unknown", deadline=None):
+    code, model, max_tokens = prompt_budget.prepare(task, code, language, PROMPTS[task] + context)
+    options = _call_options(deadline)
+    start = time.perf_counter()
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": PROMPTS[task].format(code=code) + context}],
+            max_tokens=max_tokens,
+            **options,
+        )
+    except Exception as e:
+        record_model_call(METRIC_TASKS[task], time.perf_counter() - start, error=e)
+        raise
+    record_model_call(METRIC_TASKS[task], time.perf_counter() - start, response)
     return response.choices[0].message.content.strip()
 
-def complete_code(code, client):
-    prompt = f"Complete the following code:\n\n{code}"
-    response = client.chat.completions.create(
-        model="llama3-70b-8192",
-        messages=[{"role": "user", "content": prompt}],
+def analyze_code(code, client, context="", language="unknown", deadline=None):
+    return _run_prompt("analysis", code, client, context, language, deadline)
+
+def complete_code(code, client, context="", language="unknown", deadline=None):
+    return _run_prompt("completion", code, client, context, language, deadline)
+
+def refactor_code(code, client, context="", language="unknown", deadline=None):
+    return _run_prompt("suggestions", code, client, context, language, deadline)
+
+def review_diff(code, client, context="", language="unknown", deadline=None):
+    return _run_prompt("diff", code, client, context, language, deadline)
+
+REVIEW_TASKS = {
+    "analysis": analyze_code,
+    "suggestions": refactor_code,
+    "completion": complete_code,
+}
+
+# Every prompt _cached_task() can run; REVIEW_TASKS are the sections of a full review
+TASK_FUNCTIONS = dict(REVIEW_TASKS, diff=review_diff)
+
+# Sections that receive the local static-analysis findings in their prompt
+CONTEXT_TASKS = ("analysis", "suggestions")
+MAX_CONTEXT_FINDINGS = 20
+
+def _cache_key(task, code, context, language):
+    # Routing is a function of the code and the task settings, so the settings stand in for the model
+    return make_key(code, PROMPTS[task] + context + language, prompt_budget.signature(task))
+
+def _cached_task(task, code, client, use_cache=True, context="", language="unknown", deadline=None):
+    key = _cache_key(task, code, context, language)
+    if use_cache:
+        cached = review_cache.get(key)
+        if cached is not None:
+            return cached
+    result = TASK_FUNCTIONS[task](code, client, context, language, deadline)
+    review_cache.set(key, result)
+    return result
+
+def _section_text(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return "\n".join(f"- {item}" for item in value)
+    return json.dumps(value, indent=2)
+
+def parse_combined_review(text):
+    """The sections found in a combined-mode answer, as {section: text}.
+
+    Tolerates code fences and prose around the JSON object, and renders
+    list or object values as text. Sections that are missing or empty are
+    left out; raises ValueError if no JSON object can be read at all.
+    """
+    text = (text or "").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object in the combined review")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in the combined review: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("The combined review is not a JSON object")
+    sections = {}
+    for name in REVIEW_TASKS:
+        value = data.get(name)
+        if value not in (None, "", [], {}):
+            sections[name] = _section_text(value)
+    return sections
+
+def _run_combined(code, client, context="", language="unknown", deadline=None):
+    code, model, max_tokens = prompt_budget.prepare("review", code, language, PROMPTS["review"] + context)
+    options = _call_options(deadline)
+    start = time.perf_counter()
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": PROMPTS["review"].format(code=code) + context}],
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+            **options,
+        )
+    except Exception as e:
+        record_model_call(METRIC_TASKS["review"], time.perf_counter() - start, error=e)
+        raise
+    record_model_call(METRIC_TASKS["review"], time.perf_counter() - start, response)
+    return parse_combined_review(response.choices[0].message.content)
+
+def _combined_sections(code, client, use_cache=True, context="", language="unknown", deadline=None):
+    """All review sections from one call; {} when the call fails or its JSON is unusable."""
+    key = _cache_key("review", code, context, language)
+    if use_cache:
+        cached = review_cache.get(key)
+        if cached is not None:
+            return cached
+    try:
+        sections = _run_combined(code, client, context, language, deadline)
+    except Exception:
+        # The separate prompts are the fallback for anything this call did not deliver
+        return {}
+    if len(sections) == len(REVIEW_TASKS):
+        review_cache.set(key, sections)
+    return sections
+
+def local_sections(precheck):
+    """Sections answered locally, without a model call, for trivial or non-compiling code."""
+    if precheck["trivial"]:
+        return {
+            "analysis": "Nothing to review: the submission contains no code.",
+            "suggestions": "Nothing to refactor: the submission contains no code.",
+            "completion": "",
+        }
+    if precheck["syntax_error"]:
+        error = precheck["syntax_error"]
+        # Completion still goes to the model: unfinished code often does not compile yet
+        return {
+            "analysis": f"Syntax error on line {error['line']}: {error['msg']}\n"
+                        "Fix it first; a full review needs code that compiles.",
+            "suggestions": "Refactoring suggestions are skipped until the syntax error is fixed.",
+        }
+    return {}
+
+def findings_context(findings, metrics=None):
+    """Prompt suffix telling the model what the local pass already found."""
+    if not findings and not metrics:
+        return ""
+    lines = [
+        "",
+        "",
+        "A local static analysis pass already reported the following. "
+        "Do not repeat these; focus on issues it cannot detect:",
+    ]
+    lines.extend(f"- line {f['line']}: {f['message']}" for f in findings[:MAX_CONTEXT_FINDINGS])
+    if metrics:
+        lines.append(
+            f"- metrics: cyclomatic complexity {metrics['complexity']}, "
+            f"maintainability index {metrics['maintainability']}/100"
+        )
+    return "\n".join(lines)
+
+def _static_analysis(precheck):
+    return {
+        "syntax_error": precheck["syntax_error"],
+        "findings": precheck["findings"],
+        "metrics": precheck["metrics"],
+    }
+
+def run_review(code, client, timeout=None, use_cache=True, language="unknown"):
+    """Run the analysis, refactor and completion calls concurrently.
+
+    A local static pass runs first: trivial or non-compiling code is answered
+    without model calls where possible, and its findings are added to the
+    prompts. Returns a dict with one entry per section, "static_analysis", and
+    an "errors" dict naming the sections that failed or timed out. Raises only
+    if every section failed. Pass use_cache=False to force fresh model calls.
+    Code over the chunk token budget is reviewed with run_chunked_review().
+    """
+    precheck = local_precheck(code, language)
+    local = local_sections(precheck)
+
+    if estimate_tokens(code) > CHUNK_TOKENS:
+        review = run_chunked_review(code, client, timeout, use_cache, language, precheck["findings"], local)
+        review["static_analysis"] = _static_analysis(precheck)
+        return review
+
+    timeout = CALL_TIMEOUT if timeout is None else timeout
+    context = findings_context(precheck["findings"], precheck["metrics"])
+    deadline = time.monotonic() + timeout
+
+    review = dict(local)
+    errors = {}
+    tasks = [name for name in REVIEW_TASKS if name not in local]
+    if REVIEW_MODE == "combined" and len(tasks) > 1:
+        combined = _executor.submit(client, _combined_sections, code, client, use_cache, context, language, deadline)
+        try:
+            sections = combined.result(timeout=timeout)
+        except FutureTimeoutError:
+            combined.cancel()
+            sections = {}
+        review.update((name, sections[name]) for name in tasks if name in sections)
+        tasks = [name for name in tasks if name not in sections]
+        if tasks and time.monotonic() >= deadline:
+            for name in tasks:
+                review[name] = ""
+                errors[name] = f"Timed out after {timeout:g}s"
+            tasks = []
+
+    futures = {
+        name: _executor.submit(
+            client, _cached_task, name, code, client, use_cache,
+            context if name in CONTEXT_TASKS else "", language, deadline
+        )
+        for name in tasks
+    }
+    for name, future in futures.items():
+        try:
+            review[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            review[name] = ""
+            errors[name] = f"Timed out after {timeout:g}s"
+        except Exception as e:
+            review[name] = ""
+            errors[name] = str(e)
+
+    if errors and len(errors) == len(REVIEW_TASKS) and not local:
+        raise RuntimeError("; ".join(f"{name}: {msg}" for name, msg in errors.items()))
+
+    review["errors"] = errors
+    review["static_analysis"] = _static_analysis(precheck)
+    return review
+
+def _number_lines(chunk):
+    # Prefix original line numbers so findings can be mapped back to the file
+    return "\n".join(
+        f"{chunk['start_line'] + i:>5} | {line}" for i, line in enumerate(chunk["code"].split("\n"))
     )
-    return response.choices[0].message.content.strip()
 
-def refactor_code(code, client):
-    prompt = f"Suggest refactoring techniques for better maintainability and readability:\n\n{code}"
-    response = client.chat.completions.create(
-        model="llama3-70b-8192",
-        messages=[{"role": "user", "content": prompt}],
+def run_chunked_review(code, client, timeout=None, use_cache=True, language="unknown", findings=(), local=None):
+    """Review a large file in function/class-sized chunks.
+
+    Analysis and refactoring run in parallel for every chunk, with original line
+    numbers and the local findings for that range in the prompt; completion only
+    needs the last chunk. Sections in local are not sent to the model. Findings
+    are merged per section under "Lines a-b" headings.
+    """
+    timeout = CALL_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    local = local or {}
+    chunks = CodeChunker(code, language, max_tokens=CHUNK_TOKENS).chunks()
+
+    futures = []
+    for chunk in chunks:
+        numbered = _number_lines(chunk)
+        context = findings_context([
+            f for f in findings if chunk["start_line"] <= (f["line"] or 0) <= chunk["end_line"]
+        ])
+        for task in CONTEXT_TASKS:
+            if task not in local:
+                futures.append((task, chunk, _executor.submit(
+                    client, _cached_task, task, numbered, client, use_cache, context, language, deadline
+                )))
+    if "completion" not in local:
+        futures.append(("completion", chunks[-1], _executor.submit(
+            client, _cached_task, "completion", chunks[-1]["code"], client, use_cache, "", language, deadline
+        )))
+
+    parts = {name: [] for name in REVIEW_TASKS}
+    failures = {name: [] for name in REVIEW_TASKS}
+    for task, chunk, future in futures:
+        heading = f"Lines {chunk['start_line']}-{chunk['end_line']}"
+        if chunk["name"]:
+            heading += f" ({chunk['name']})"
+        try:
+            text = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            failures[task].append(f"{heading}: timed out after {timeout:g}s")
+            continue
+        except Exception as e:
+            failures[task].append(f"{heading}: {e}")
+            continue
+        parts[task].append(text if task == "completion" else f"{heading}:\n{text}")
+
+    review = {}
+    errors = {}
+    for name in REVIEW_TASKS:
+        if name in local:
+            review[name] = local[name]
+            continue
+        review[name] = "\n\n".join(parts[name])
+        if failures[name] and not parts[name]:
+            errors[name] = "; ".join(failures[name])
+        elif failures[name]:
+            review[name] += "\n\n(unavailable: " + "; ".join(failures[name]) + ")"
+
+    if not local and len(errors) == len(REVIEW_TASKS):
+        raise RuntimeError("; ".join(f"{name}: {msg}" for name, msg in errors.items()))
+
+    review["errors"] = errors
+    review["chunks"] = len(chunks)
+    return review
+
+def run_review_batch(items, client, use_cache=True):
+    """Review several files, yielding (item, result, error) as each one finishes.
+
+    items are dicts with at least a "code" key; they are scheduled in the
+    order given, so callers can group related files together.
+    """
+    futures = {
+        _batch_executor.submit(
+            client, run_review, item["code"], client, None, use_cache, item.get("language", "unknown")
+        ): item
+        for item in items
+    }
+    for future in as_completed(futures):
+        item = futures[future]
+        try:
+            yield item, future.result(), None
+        except Exception as e:
+            yield item, None, str(e)
+
+def run_diff_review(units, client, timeout=None, use_cache=True):
+    """Review the changed hunks of several files concurrently, one prompt per file.
+
+    units are dicts with "code" (a diff_snippet()) and "language". Returns
+    [(unit, review, error)] in the order given.
+    """
+    timeout = CALL_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    futures = [
+        (unit, _executor.submit(
+            client, _cached_task, "diff", unit["code"], client, use_cache, "", unit.get("language", "unknown"), deadline
+        ))
+        for unit in units
+    ]
+    results = []
+    for unit, future in futures:
+        try:
+            results.append((unit, future.result(timeout=max(0, deadline - time.monotonic())), None))
+        except FutureTimeoutError:
+            future.cancel()
+            results.append((unit, None, f"Timed out after {timeout:g}s"))
+        except Exception as e:
+            results.append((unit, None, str(e)))
+    return results
+
+def _stream_usage(chunk):
+    # OpenAI-style clients report usage on the last chunk; Groq puts it under x_groq
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return usage
+
+def stream_prompt(task, code, client, context="", language="unknown", deadline=None):
+    """Yield the model's answer for one review section as it is generated."""
+    code, model, max_tokens = prompt_budget.prepare(task, code, language, PROMPTS[task] + context)
+    options = _call_options(deadline)
+    start = time.perf_counter()
+    usage = None
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": PROMPTS[task].format(code=code) + context}],
+            max_tokens=max_tokens,
+            stream=True,
+            **options,
+        )
+        for chunk in stream:
+            usage = _stream_usage(chunk) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        record_model_call(METRIC_TASKS[task], time.perf_counter() - start, error=e)
+        raise
+    record_model_call(METRIC_TASKS[task], time.perf_counter() - start, types.SimpleNamespace(usage=usage))
+
+def _stream_units(code, language, precheck, local):
+    """The prompts a streamed review sends, as {section: [(heading, prompt code, context)]}.
+
+    Code over the chunk budget is split the way run_chunked_review() splits
+    it, and each chunk is a unit of its section with a "Lines a-b" heading.
+    """
+    if estimate_tokens(code) <= CHUNK_TOKENS:
+        context = findings_context(precheck["findings"], precheck["metrics"])
+        return {
+            task: [(None, code, context if task in CONTEXT_TASKS else "")]
+            for task in REVIEW_TASKS if task not in local
+        }, None
+
+    chunks = CodeChunker(code, language, max_tokens=CHUNK_TOKENS).chunks()
+    units = {task: [] for task in CONTEXT_TASKS if task not in local}
+    for chunk in chunks:
+        heading = f"Lines {chunk['start_line']}-{chunk['end_line']}"
+        if chunk["name"]:
+            heading += f" ({chunk['name']})"
+        context = findings_context([
+            f for f in precheck["findings"] if chunk["start_line"] <= (f["line"] or 0) <= chunk["end_line"]
+        ])
+        for task in units:
+            units[task].append((heading, _number_lines(chunk), context))
+    if "completion" not in local:
+        units["completion"] = [(None, chunks[-1]["code"], "")]
+    return units, len(chunks)
+
+def stream_review(code, client, timeout=None, use_cache=True, language="unknown"):
+    """Stream the three review sections concurrently.
+
+    Yields ("delta", section, text) as tokens arrive and ("error", section,
+    message) for sections that fail. The final item is ("done", None, review)
+    where review has the same shape as the run_review() result.
+
+    Prompts are prepared as for run_review(): large files are streamed chunk
+    by chunk (each section's chunks arrive in order, under their "Lines a-b"
+    headings), and in combined mode the sections come from one JSON call, with
+    streamed prompts only for the sections it did not deliver.
+    """
+    timeout = CALL_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    precheck = local_precheck(code, language)
+    local = local_sections(precheck)
+    units, chunk_count = _stream_units(code, language, precheck, local)
+
+    review = {}
+    errors = {}
+    for task, text in local.items():
+        review[task] = text
+        yield "delta", task, text
+
+    if REVIEW_MODE == "combined" and chunk_count is None and len(units) > 1:
+        context = findings_context(precheck["findings"], precheck["metrics"])
+        combined = _executor.submit(client, _combined_sections, code, client, use_cache, context, language, deadline)
+        try:
+            sections = combined.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            combined.cancel()
+            sections = {}
+        for task in [task for task in units if task in sections]:
+            review[task] = sections[task]
+            del units[task]
+            yield "delta", task, sections[task]
+
+    events = queue.Queue()
+
+    def produce(task, index, prompt_code, context):
+        key = _cache_key(task, prompt_code, context, language)
+        try:
+            cached = review_cache.get(key) if use_cache else None
+            if cached is not None:
+                events.put(("delta", task, index, cached))
+                events.put(("end", task, index, cached))
+                return
+            parts = []
+            for delta in stream_prompt(task, prompt_code, client, context, language, deadline):
+                parts.append(delta)
+                events.put(("delta", task, index, delta))
+            text = "".join(parts).strip()
+            review_cache.set(key, text)
+            events.put(("end", task, index, text))
+        except Exception as e:
+            events.put(("error", task, index, str(e)))
+
+    if time.monotonic() < deadline:
+        for task, task_units in units.items():
+            for index, (_, prompt_code, context) in enumerate(task_units):
+                _executor.submit(client, produce, task, index, prompt_code, context)
+
+    # Per section: the unit being forwarded, events of later units held back until
+    # it finishes, the finished texts, the failures and whether any text went out yet
+    current = {task: 0 for task in units}
+    held = {task: {} for task in units}
+    parts = {task: [] for task in units}
+    failures = {task: [] for task in units}
+    started = {task: set() for task in units}
+
+    def handle(kind, task, index, text):
+        heading = units[task][index][0]
+        if kind == "delta":
+            if index not in started[task]:
+                prefix = "\n\n" if started[task] else ""
+                text = prefix + (f"{heading}:\n" if heading else "") + text
+                started[task].add(index)
+            yield "delta", task, text
+            return
+        if kind == "end":
+            parts[task].append(f"{heading}:\n{text}" if heading else text)
+        else:
+            failures[task].append(f"{heading}: {text}" if heading else text)
+        current[task] += 1
+        for later in held[task].pop(current[task], ()):
+            yield from handle(later[0], task, current[task], later[1])
+        if index == len(units[task]) - 1:
+            yield from finish(task)
+
+    def finish(task):
+        review[task] = "\n\n".join(parts[task])
+        if failures[task] and not parts[task]:
+            errors[task] = "; ".join(failures[task])
+            yield "error", task, errors[task]
+        elif failures[task]:
+            review[task] += "\n\n(unavailable: " + "; ".join(failures[task]) + ")"
+
+    pending = {task for task in units if units[task]}
+    while pending:
+        try:
+            kind, task, index, text = events.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            for task in sorted(pending):
+                for index in range(current[task], len(units[task])):
+                    heading = units[task][index][0]
+                    # Later chunks may have finished while an earlier one held them back
+                    kind, text = next(
+                        (event for event in held[task].get(index, ()) if event[0] != "delta"),
+                        ("error", f"timed out after {timeout:g}s" if heading else f"Timed out after {timeout:g}s"),
+                    )
+                    if kind == "end":
+                        parts[task].append(f"{heading}:\n{text}" if heading else text)
+                    else:
+                        failures[task].append(f"{heading}: {text}" if heading else text)
+                yield from finish(task)
+            break
+        if index == current[task]:
+            yield from handle(kind, task, index, text)
+        else:
+            held[task].setdefault(index, []).append((kind, text))
+        if current[task] == len(units[task]):
+            pending.discard(task)
+
+    review["errors"] = errors
+    review["static_analysis"] = _static_analysis(precheck)
+    if chunk_count is not None:
+        review["chunks"] = chunk_count
+    yield "done", None, review
+
+def review_events(review):
+    """Replay a finished run_review() result as stream_review() events."""
+    for task in REVIEW_TASKS:
+        if task in review.get("errors", {}):
+            yield "error", task, review["errors"][task]
+        elif review.get(task):
+            yield "delta", task, review[task]
+    yield "done", None, review
+
+def format_review(review):
+    """Render a run_review() result as the plain-text review stored in history."""
+    errors = review.get("errors", {})
+
+    def section(name):
+        if name in errors:
+            return f"(unavailable: {errors[name]})"
+        return review.get(name, "")
+
+    return (
+        f"🔍 Analysis:\n{section('analysis')}\n\n"
+        f"✨ Suggestions:\n{section('suggestions')}\n\n"
+        f"⚙️ Completion:\n{section('completion')}"
     )
-    return response.choices[0].message.content.strip()
+
+_REVIEW_SECTIONS = re.compile(
+    r"\A🔍 Analysis:\n(?P<analysis>.*)\n\n✨ Suggestions:\n(?P<suggestions>.*)\n\n⚙️ Completion:\n(?P<completion>.*)\Z",
+    re.S,
+)
+
+def parse_review(text):
+    """Split a format_review() text back into its sections; None if it is not a complete review."""
+    match = _REVIEW_SECTIONS.match(text or "")
+    if not match:
+        return None
+    sections = match.groupdict()
+    if any(body.startswith("(unavailable: ") for body in sections.values()):
+        return None
+    return sections
+
+def reuse_review(stored, code, language="unknown"):
+    """A run_review()-shaped result built from a stored review of near-identical code.
+
+    The model sections are copied; the static analysis is redone locally for
+    the new code. Returns None if the stored review cannot be reused.
+    """
+    sections = parse_review(stored)
+    if sections is None:
+        return None
+    review = dict(sections, errors={})
+    review["static_analysis"] = _static_analysis(local_precheck(code, language))
+    return review
@@ -0,0 +1,165 @@
+import copy
+import hashlib
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: updates are only serialized within the process
+    fcntl = None
+
+TOKEN_PREFIX = "cr_"
+
+
+class JsonFile:
+    """A JSON document on disk, parsed once and cached until the file changes.
+
+    The cache is keyed on the file's inode, mtime and size, so writes from this or any
+    other process are picked up on the next load() at the cost of one stat().
+    save() replaces the file atomically; read-modify-write cycles go through
+    update(), which holds an exclusive lock shared by every process.
+    """
+
+    def __init__(self, path, default=dict):
+        self.path = path
+        self.default = default
+        self._lock = threading.RLock()
+        self._signature = None
+        self._data = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def load(self):
+        """The parsed document. Shared between callers: treat it as read-only and save() a new one."""
+        signature = self._stat()
+        if signature == self._signature and self._data is not None:
+            return self._data
+        with self._lock:
+            return self._read()
+
+    def _read(self):
+        signature = self._stat()
+        if signature is None:
+            data = self.default()
+        else:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        self._data, self._signature = data, signature
+        self.on_load(data)
+        return data
+
+    def on_load(self, data):
+        """Hook for subclasses that keep an index over the document."""
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold this process's lock and, where available, an flock() on a sidecar lock file."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, mutate):
+        """Apply mutate(data) to a freshly read copy of the document and save it.
+
+        The whole read-modify-write runs under the exclusive lock, so
+        concurrent updates from other threads or processes are never lost.
+        mutate may return (new_data, result) to report something back, or
+        None to leave the file untouched; update() returns result.
+        """
+        with self._exclusive():
+            # Always re-read: a write from another process can leave the stat() signature unchanged
+            outcome = mutate(copy.deepcopy(self._read()))
+            if outcome is None:
+                return None
+            data, result = outcome
+            self.save(data)
+            return result
+
+    def save(self, data):
+        with self._lock:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._data, self._signature = data, self._stat()
+            self.on_load(data)
+
+
+def hash_token(token):
+    # Tokens are 256-bit random strings, so a fast unsalted digest is enough and keeps lookups cheap
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenStore(JsonFile):
+    """Per-user API tokens, stored as SHA-256 hashes.
+
+    The file maps token ids to {"user_id", "name", "hash", "created", "last4"}.
+    An in-memory dict from hash to record is rebuilt whenever the file
+    changes, so resolve() is one stat() plus a hash and a dict lookup.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._by_hash = {}
+
+    def on_load(self, data):
+        self._by_hash = {record["hash"]: dict(record, id=token_id) for token_id, record in data.items()}
+
+    def resolve(self, token):
+        """The user_id a token belongs to, or None."""
+        if not token or not token.startswith(TOKEN_PREFIX):
+            return None
+        self.load()
+        record = self._by_hash.get(hash_token(token))
+        return record["user_id"] if record else None
+
+    def create(self, user_id, name=""):
+        """Issue a token for user_id. Returns (token_id, token); the token itself is not stored."""
+        token = TOKEN_PREFIX + secrets.token_urlsafe(32)
+        token_id = secrets.token_hex(8)
+        record = {
+            "user_id": user_id,
+            "name": name,
+            "hash": hash_token(token),
+            "created": int(time.time()),
+            "last4": token[-4:],
+        }
+        self.update(lambda tokens: (dict(tokens, **{token_id: record}), None))
+        return token_id, token
+
+    def revoke(self, token_id, user_id):
+        def remove(tokens):
+            if tokens.get(token_id, {}).get("user_id") != user_id:
+                return None
+            del tokens[token_id]
+            return tokens, True
+
+        return bool(self.update(remove))
+
+    def list(self, user_id):
+        return [
+            {"id": token_id, "name": record["name"], "created": record["created"], "last4": record["last4"]}
+            for token_id, record in self.load().items()
+            if record["user_id"] == user_id
+        ]
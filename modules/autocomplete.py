@@ -0,0 +1,180 @@
+import contextvars
+import hashlib
+import os
+import queue
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.cache import ReviewCache
+
+
+def completion_key(recent_code, scope, language, max_suggestions):
+    """Cache key over the code before the cursor plus the enclosing scope."""
+    digest = hashlib.sha256()
+    for part in (language, str(scope.get("type")), str(scope.get("name")), str(max_suggestions), recent_code):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class HistoryWriter:
+    """Writes autocomplete history off the response path, optionally sampled.
+
+    Records are batched and handed to write_many() from a background thread.
+    """
+
+    def __init__(self, write_many, sample_rate=1.0, batch_size=50):
+        self.write_many = write_many
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, record):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="autocomplete-history", daemon=True)
+                self._thread.start()
+        self._queue.put(record)
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write_many(batch)
+            except Exception:
+                # History is best effort for autocomplete; never take the writer down
+                pass
+
+
+class _Pending:
+    def __init__(self, token):
+        self.token = token
+        self.wake = threading.Event()
+
+
+class AutocompleteService:
+    """Fast path for typing-speed completions.
+
+    - results are cached on the hash of the recent code plus scope;
+    - a newer request from the same session supersedes older ones, which
+      return immediately and skip their model call if it has not started;
+    - identical in-flight requests share one model call;
+    - after latency_budget seconds the caller gets the cached or last
+      suggestions for the session while the model call finishes in the background.
+
+    Per-session state is kept for the max_sessions most recently active sessions.
+    """
+
+    def __init__(self, cache=None, latency_budget=1.5, workers=4, max_sessions=1024):
+        self.cache = cache or ReviewCache(max_entries=2048, ttl=600)
+        self.latency_budget = latency_budget
+        self.max_sessions = max_sessions
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="autocomplete")
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._last_result = OrderedDict()
+        self._inflight = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            cache=ReviewCache(
+                max_entries=int(os.environ.get("AUTOCOMPLETE_CACHE_SIZE", "2048")),
+                ttl=float(os.environ.get("AUTOCOMPLETE_CACHE_TTL", "600")),
+            ),
+            latency_budget=float(os.environ.get("AUTOCOMPLETE_LATENCY_BUDGET", "1.5")),
+            workers=int(os.environ.get("AUTOCOMPLETE_WORKERS", "4")),
+            max_sessions=int(os.environ.get("AUTOCOMPLETE_SESSIONS", "1024")),
+        )
+
+    def _remember(self, sessions, session_key, value):
+        # Caller holds self._lock; least recently active sessions are dropped first
+        sessions[session_key] = value
+        sessions.move_to_end(session_key)
+        while len(sessions) > self.max_sessions:
+            sessions.popitem(last=False)
+
+    def _set_last_result(self, session_key, result):
+        with self._lock:
+            self._remember(self._last_result, session_key, result)
+
+    def _begin(self, session_key):
+        with self._lock:
+            previous = self._sessions.get(session_key)
+            pending = _Pending(previous.token + 1 if previous else 1)
+            self._remember(self._sessions, session_key, pending)
+        if previous:
+            previous.wake.set()
+        return pending
+
+    def _is_current(self, session_key, pending):
+        with self._lock:
+            return self._sessions.get(session_key) is pending
+
+    def complete(self, session_key, key, compute):
+        """Return (completions, source) where source is one of
+        "cache", "model", "stale", "timeout" or "superseded".
+        """
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._set_last_result(session_key, cached)
+            return cached, "cache"
+
+        pending = self._begin(session_key)
+
+        def run():
+            # Skip the model call entirely if every waiter was superseded by a newer keystroke
+            with self._lock:
+                waiters = list(self._inflight[key][1])
+            if not any(self._is_current(s, p) for s, p in waiters):
+                return None
+            result = compute()
+            self.cache.set(key, result)
+            return result
+
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                waiters = [(session_key, pending)]
+                self._inflight[key] = (None, waiters)
+                future = self._executor.submit(contextvars.copy_context().run, run)
+                self._inflight[key] = (future, waiters)
+                future.add_done_callback(lambda f: self._forget(key, f))
+            else:
+                future, waiters = entry
+                waiters.append((session_key, pending))
+        future.add_done_callback(lambda f: pending.wake.set())
+
+        pending.wake.wait(self.latency_budget)
+
+        if not self._is_current(session_key, pending):
+            return [], "superseded"
+        if future.done() and not future.exception() and future.result() is not None:
+            result = future.result()
+            self._set_last_result(session_key, result)
+            return result, "model"
+        if future.done() and future.exception():
+            raise future.exception()
+        with self._lock:
+            stale = self._last_result.get(session_key)
+        if stale is not None:
+            return stale, "stale"
+        return [], "timeout"
+
+    def _forget(self, key, future):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is future:
+                del self._inflight[key]
@@ -0,0 +1,196 @@
+import copy
+import io
+import json
+import os
+import re
+import tokenize
+
+from code_analyzer import estimate_tokens
+
+# Routes are tried in order; the first whose max_input_tokens covers the prompt wins.
+# compact: "none", "lines" (keeps line numbers, for prompts that cite lines) or "full".
+# truncate: which end of an over-budget input to keep ("head" or "tail").
+DEFAULT_TASKS = {
+    "analysis": {
+        "max_input_tokens": 6000,
+        "max_output_tokens": 1024,
+        "compact": "lines",
+        "truncate": "head",
+        "routes": [
+            {"max_input_tokens": 300, "model": "llama3-8b-8192"},
+            {"model": "llama3-70b-8192"},
+        ],
+    },
+    "suggestions": {
+        "max_input_tokens": 6000,
+        "max_output_tokens": 1024,
+        "compact": "lines",
+        "truncate": "head",
+        "routes": [
+            {"max_input_tokens": 300, "model": "llama3-8b-8192"},
+            {"model": "llama3-70b-8192"},
+        ],
+    },
+    "completion": {
+        "max_input_tokens": 4000,
+        "max_output_tokens": 512,
+        "compact": "full",
+        "truncate": "tail",
+        "routes": [
+            {"max_input_tokens": 1500, "model": "llama3-8b-8192"},
+            {"model": "llama3-70b-8192"},
+        ],
+    },
+    "review": {
+        "max_input_tokens": 6000,
+        "max_output_tokens": 2048,
+        "compact": "lines",
+        "truncate": "head",
+        "routes": [
+            {"max_input_tokens": 300, "model": "llama3-8b-8192"},
+            {"model": "llama3-70b-8192"},
+        ],
+    },
+    "diff": {
+        "max_input_tokens": 6000,
+        "max_output_tokens": 1024,
+        "compact": "none",
+        "truncate": "head",
+        "routes": [
+            {"max_input_tokens": 300, "model": "llama3-8b-8192"},
+            {"model": "llama3-70b-8192"},
+        ],
+    },
+    "autocomplete": {
+        "max_input_tokens": 1500,
+        "max_output_tokens": 256,
+        "compact": "full",
+        "truncate": "tail",
+        "routes": [
+            {"max_input_tokens": 1500, "model": "llama3-8b-8192"},
+            {"model": "mixtral-8x7b-32768"},
+        ],
+    },
+}
+
+_LINE_COMMENTS = {
+    "ruby": "#",
+    "javascript": "//",
+    "typescript": "//",
+    "java": "//",
+    "go": "//",
+    "c++": "//",
+}
+
+_BLANK_RUNS = re.compile(r"\n{3,}")
+
+
+def _strip_python_comments(code):
+    """Remove # comments using the tokenizer, so '#' inside strings is left alone."""
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return code
+    lines = code.split("\n")
+    for tok in reversed(tokens):
+        if tok.type == tokenize.COMMENT:
+            row, col = tok.start
+            line = lines[row - 1]
+            if row == 1 and line.startswith("#!"):
+                continue
+            lines[row - 1] = line[:col] + line[tok.end[1]:]
+    return "\n".join(lines)
+
+
+def compact_code(code, language="unknown", mode="full"):
+    """Shrink code before it goes into a prompt.
+
+    "lines" drops trailing whitespace and comments but keeps every line, so
+    line numbers in local findings still match; "full" also collapses runs of
+    blank lines. Only whole-line comments are removed outside Python, where
+    the tokenizer makes inline comments safe to drop too.
+    """
+    if mode == "none" or not code:
+        return code
+    if language == "python":
+        code = _strip_python_comments(code)
+    elif language in _LINE_COMMENTS:
+        marker = _LINE_COMMENTS[language]
+        code = "\n".join(
+            "" if line.lstrip().startswith(marker) and not (i == 0 and line.startswith("#!")) else line
+            for i, line in enumerate(code.split("\n"))
+        )
+    code = "\n".join(line.rstrip() for line in code.split("\n"))
+    if mode == "full":
+        code = _BLANK_RUNS.sub("\n\n", code).strip("\n")
+    return code
+
+
+def fit_tokens(text, max_tokens, keep="head"):
+    """Cut text at a line boundary so it fits max_tokens, keeping the head or the tail."""
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split("\n")
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line + "\n")
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if keep == "tail":
+        kept.reverse()
+        return "...\n" + "\n".join(kept)
+    return "\n".join(kept) + "\n..."
+
+
+class PromptBudget:
+    """Per-task input compaction, input/output token caps and model routing.
+
+    The defaults in DEFAULT_TASKS can be overridden per task with the
+    MODEL_ROUTING environment variable, either inline JSON or the path of a
+    JSON file, e.g. {"analysis": {"routes": [{"model": "llama3-70b-8192"}]}}.
+    """
+
+    def __init__(self, tasks=None):
+        self.tasks = copy.deepcopy(DEFAULT_TASKS)
+        for task, settings in (tasks or {}).items():
+            self.tasks.setdefault(task, {}).update(settings)
+
+    @classmethod
+    def from_env(cls):
+        raw = os.environ.get("MODEL_ROUTING", "").strip()
+        if not raw:
+            return cls()
+        if not raw.startswith("{"):
+            with open(raw, "r") as f:
+                raw = f.read()
+        return cls(json.loads(raw))
+
+    def route(self, task, input_tokens):
+        """The model for a task given the estimated size of its prompt."""
+        routes = self.tasks[task]["routes"]
+        for route in routes:
+            if route.get("max_input_tokens") is None or input_tokens <= route["max_input_tokens"]:
+                return route["model"]
+        return routes[-1]["model"]
+
+    def signature(self, task):
+        """A string that changes whenever the task's budget or routing settings do (for cache keys)."""
+        return json.dumps(self.tasks[task], sort_keys=True)
+
+    def prepare(self, task, code, language="unknown", overhead=""):
+        """Return (code, model, max_tokens) for one prompt.
+
+        overhead is the rest of the prompt (instructions, findings), counted
+        toward routing but never compacted or cut.
+        """
+        settings = self.tasks[task]
+        code = compact_code(code, language, settings.get("compact", "none"))
+        budget = settings.get("max_input_tokens")
+        if budget:
+            code = fit_tokens(code, max(1, budget - estimate_tokens(overhead)), settings.get("truncate", "head"))
+        model = self.route(task, estimate_tokens(code) + estimate_tokens(overhead))
+        return code, model, settings.get("max_output_tokens")
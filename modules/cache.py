@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_code(code):
+    """Normalize code so cosmetic resubmissions map to the same cache key."""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def make_key(code, prompt_template, model):
+    """Content-addressed key over the normalized code, prompt template and model name."""
+    digest = hashlib.sha256()
+    for part in (model, prompt_template, normalize_code(code)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """Two-tier cache: an in-memory LRU with TTL and an optional SQLite tier on disk.
+
+    Disk reads and writes happen outside the lock on per-thread connections, so
+    a slow lookup never holds up memory hits in other threads. Every
+    PRUNE_EVERY writes the disk tier drops expired rows and is trimmed to
+    max_disk_entries rows, oldest first.
+    """
+
+    # Disk-tier size and expiry are enforced every this many writes
+    PRUNE_EVERY = 256
+
+    def __init__(self, max_entries=512, ttl=3600, path=None, max_disk_entries=50000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # The disk tier may be shared by several worker processes
+            db = self._connect()
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_cache_created ON cache (created)")
+            db.commit()
+
+    @classmethod
+    def from_env(cls):
+        cache_dir = os.environ.get("REVIEW_CACHE_DIR", "")
+        return cls(
+            max_entries=int(os.environ.get("REVIEW_CACHE_SIZE", "512")),
+            ttl=float(os.environ.get("REVIEW_CACHE_TTL", "3600")),
+            path=os.path.join(cache_dir, "review_cache.db") if cache_dir else None,
+            max_disk_entries=int(os.environ.get("REVIEW_CACHE_DISK_SIZE", "50000")),
+        )
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            self._local.db = db
+        return db
+
+    def _expired(self, created):
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._entries[key]
+
+        if self.path:
+            db = self._connect()
+            row = db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row and not self._expired(row[1]):
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, value, row[1])
+                    self.stats["disk_hits"] += 1
+                return value
+            if row:
+                db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                db.commit()
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        created = time.time()
+        with self._lock:
+            self._remember(key, value, created)
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if self.path:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), created),
+            )
+            db.commit()
+            if prune:
+                self.prune_disk()
+
+    def prune_disk(self):
+        """Drop expired rows and the oldest rows beyond max_disk_entries; returns how many."""
+        if not self.path:
+            return 0
+        db = self._connect()
+        removed = 0
+        if self.ttl > 0:
+            removed += db.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        if self.max_disk_entries > 0:
+            removed += db.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            ).rowcount
+        db.commit()
+        with self._lock:
+            self.stats["disk_evictions"] += removed
+        return removed
+
+    def _remember(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            db = self._connect()
+            db.execute("DELETE FROM cache")
+            db.commit()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = self.stats["hits"] + self.stats["disk_hits"]
+            return dict(
+                self.stats,
+                entries=len(self._entries),
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            )
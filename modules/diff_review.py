@@ -0,0 +1,131 @@
+import re
+
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_GIT_HEADER = re.compile(r"^diff --git a/(.+?) b/(.+)$")
+# "Line 12:", "lines 12-14", "L12" at the start of (or inside) a finding
+_LINE_REF = re.compile(r"\b(?:lines?|L)\s*(\d+)(?:\s*[-–]\s*(\d+))?", re.I)
+
+
+def _path(header):
+    path = header.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path[:2] in ("a/", "b/"):
+        path = path[2:]
+    return path
+
+
+def parse_unified_diff(text):
+    """Parse a unified diff (git, GitHub or GitLab flavour) into per-file hunks.
+
+    Returns [{"path", "old_path", "new_path", "binary", "hunks"}]; each hunk is
+    {"old_start", "new_start", "lines"} with lines as (kind, old_no, new_no,
+    text) tuples, kind being "+", "-" or " ". new_path is None for deleted files.
+    """
+    files = []
+    current = None
+    hunk = None
+    old_left = new_left = 0
+    old_no = new_no = 0
+
+    def start_file(old_path=None, new_path=None):
+        entry = {"path": new_path or old_path, "old_path": old_path, "new_path": new_path, "binary": False, "hunks": []}
+        files.append(entry)
+        return entry
+
+    for line in (text or "").splitlines():
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            kind = line[:1] or " "
+            if kind == "\\":
+                continue  # "\ No newline at end of file"
+            if kind in " +-":
+                if kind == "+":
+                    hunk["lines"].append(("+", None, new_no, line[1:]))
+                    new_no += 1
+                    new_left -= 1
+                elif kind == "-":
+                    hunk["lines"].append(("-", old_no, None, line[1:]))
+                    old_no += 1
+                    old_left -= 1
+                else:
+                    hunk["lines"].append((" ", old_no, new_no, line[1:]))
+                    old_no += 1
+                    new_no += 1
+                    old_left -= 1
+                    new_left -= 1
+                continue
+            hunk = None
+
+        git = _GIT_HEADER.match(line)
+        if git:
+            current = start_file(git.group(1), git.group(2))
+            hunk = None
+        elif line.startswith("--- "):
+            if current is None or current["hunks"]:
+                current = start_file()
+            current["old_path"] = _path(line[4:])
+        elif line.startswith("+++ ") and current is not None:
+            current["new_path"] = _path(line[4:])
+            current["path"] = current["new_path"] or current["old_path"]
+        elif line.startswith("deleted file mode") and current is not None:
+            current["new_path"] = None
+        elif line.startswith("Binary files") and current is not None:
+            current["binary"] = True
+        else:
+            match = _HUNK.match(line)
+            if match and current is not None:
+                old_no, old_left = int(match.group(1)), int(match.group(2) or 1)
+                new_no, new_left = int(match.group(3)), int(match.group(4) or 1)
+                hunk = {"old_start": old_no, "new_start": new_no, "lines": []}
+                current["hunks"].append(hunk)
+    return files
+
+
+def diff_snippet(entry, context=3):
+    """The changed lines of one file with at most context unchanged lines around them.
+
+    Lines are prefixed with their number in the new file and a +/- marker so
+    the model can cite positions. Returns (snippet, lines) where lines is the
+    set of new-file line numbers shown, or (None, set()) if nothing changed.
+    """
+    out, shown = [], set()
+    for hunk in entry["hunks"]:
+        lines = hunk["lines"]
+        changed = [i for i, line in enumerate(lines) if line[0] != " "]
+        if not changed:
+            continue
+        keep = set()
+        for i in changed:
+            keep.update(range(max(0, i - context), min(len(lines), i + context + 1)))
+        previous = None
+        for i in sorted(keep):
+            if out and (previous is None or i != previous + 1):
+                out.append("  ...")
+            kind, _, new_no, text = lines[i]
+            if kind == "-":
+                out.append(f"{'':>5} - {text}")
+            else:
+                out.append(f"{new_no:>5} {kind} {text}")
+                shown.add(new_no)
+            previous = i
+    if not out:
+        return None, set()
+    return f"File: {entry['path']}\n" + "\n".join(out), shown
+
+
+def map_findings(review, file_path, lines):
+    """Findings in a diff review that cite a line shown to the model, as [{"file_path", "line", "message"}]."""
+    findings = []
+    for text in review.splitlines():
+        text = text.strip().lstrip("-*• ").strip()
+        match = _LINE_REF.search(text)
+        if not match:
+            continue
+        line = int(match.group(1))
+        if line not in lines:
+            continue
+        finding = {"file_path": file_path, "line": line, "message": text}
+        if match.group(2):
+            finding["end_line"] = int(match.group(2))
+        findings.append(finding)
+    return findings
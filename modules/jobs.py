@@ -0,0 +1,366 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def check_callback_url(url, allowed_hosts=()):
+    """Raise ValueError unless url is a safe place to POST a finished job.
+
+    Only http(s) URLs are accepted. With allowed_hosts the host must be one of
+    them; otherwise every address it resolves to must be public, so clients
+    cannot aim the server at loopback, private networks or metadata endpoints.
+    """
+    parsed = urllib.parse.urlsplit(url or "")
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("callback_url must be an http(s) URL")
+    host = parsed.hostname.lower()
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise ValueError("callback_url host is not allowed")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError("callback_url host does not resolve")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%", 1)[0]).is_global:
+            raise ValueError("callback_url must not point at a private address")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect could lead a checked callback to an internal host
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+
+
+class MemoryJobBackend:
+    """In-process job backend; jobs are lost when the process exits."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._inflight = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    def enqueue(self, payload, dedupe_key=None):
+        """Queue a job and return (job_id, created). An identical in-flight job is reused."""
+        with self._lock:
+            if dedupe_key and dedupe_key in self._inflight:
+                return self._inflight[dedupe_key], False
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": QUEUED,
+                "payload": payload,
+                "result": None,
+                "error": None,
+                "dedupe_key": dedupe_key,
+                "created": now,
+                "updated": now,
+            }
+            if dedupe_key:
+                self._inflight[dedupe_key] = job_id
+        self._queue.put(job_id)
+        return job_id, True
+
+    def claim(self, timeout=1.0):
+        try:
+            job_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = RUNNING
+            job["updated"] = time.time()
+            return dict(job)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(status=status, result=result, error=error, updated=time.time())
+            if job["dedupe_key"]:
+                self._inflight.pop(job["dedupe_key"], None)
+
+    def complete(self, job_id, result):
+        self._finish(job_id, DONE, result=result)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, FAILED, error=error)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def prune(self, before):
+        """Drop finished jobs last updated before the given time; returns how many."""
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in (DONE, FAILED) and job["updated"] < before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobBackend:
+    """Job backend on a local SQLite file, shared by every process that opens it.
+
+    Jobs left running longer than lease seconds (e.g. by a crashed worker) are
+    handed out again.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT,
+        payload TEXT,
+        result TEXT,
+        error TEXT,
+        dedupe_key TEXT,
+        created REAL,
+        updated REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created);
+    CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status);
+    """
+
+    def __init__(self, path, lease=600, poll_interval=0.5):
+        self.path = path
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, payload, dedupe_key=None):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedupe_key:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?)",
+                    (dedupe_key, QUEUED, RUNNING),
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row["id"], False
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, dedupe_key, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), dedupe_key, now, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._wakeup.set()
+        return job_id, True
+
+    def claim(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._claim_once()
+            if job or time.monotonic() >= deadline:
+                return job
+            self._wakeup.wait(min(self.poll_interval, max(0, deadline - time.monotonic())))
+            self._wakeup.clear()
+
+    def _claim_once(self):
+        conn = self.connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND updated < ?) "
+                "ORDER BY created LIMIT 1",
+                (QUEUED, RUNNING, now - self.lease),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated = ? WHERE id = ?", (RUNNING, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        job = self._row_to_job(row)
+        job["status"] = RUNNING
+        return job
+
+    def complete(self, job_id, result):
+        self.connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, updated = ? WHERE id = ?",
+            (DONE, json.dumps(result), time.time(), job_id),
+        )
+
+    def fail(self, job_id, error):
+        self.connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+            (FAILED, error, time.time(), job_id),
+        )
+
+    def get(self, job_id):
+        row = self.connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def prune(self, before):
+        """Delete finished jobs (and their payloads) last updated before the given time; returns how many."""
+        cursor = self.connect().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?", (DONE, FAILED, before)
+        )
+        return cursor.rowcount
+
+
+class JobQueue:
+    """Worker pool that runs handler(payload) for queued jobs.
+
+    Workers start on the first submit. If a payload carries a callback_url,
+    the finished job is POSTed there as JSON, with an X-Callback-Signature
+    header (sha256=<HMAC of the body>) when a callback_secret is set.
+    Finished jobs are deleted retention seconds after they finish.
+    """
+
+    def __init__(self, backend, handler, workers=4, callback_hosts=(), callback_secret=None,
+                 retention=7 * 86400, prune_interval=3600):
+        self.backend = backend
+        self.handler = handler
+        self.workers = workers
+        self.callback_hosts = frozenset(host.lower() for host in callback_hosts)
+        self.callback_secret = callback_secret
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    @classmethod
+    def from_env(cls, handler, data_dir):
+        if os.environ.get("JOB_BACKEND", "sqlite") == "memory":
+            backend = MemoryJobBackend()
+        else:
+            backend = SQLiteJobBackend(
+                os.path.join(data_dir, "jobs.db"),
+                lease=float(os.environ.get("JOB_LEASE", "600")),
+            )
+        return cls(
+            backend,
+            handler,
+            workers=int(os.environ.get("JOB_WORKERS", "4")),
+            callback_hosts=[h.strip() for h in os.environ.get("JOB_CALLBACK_HOSTS", "").split(",") if h.strip()],
+            callback_secret=os.environ.get("JOB_CALLBACK_SECRET") or None,
+            retention=float(os.environ.get("JOB_RETENTION", str(7 * 86400))),
+        )
+
+    def check_callback(self, url):
+        """Raise ValueError if url may not be used as a callback_url."""
+        check_callback_url(url, self.callback_hosts)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+
+    def submit(self, payload, dedupe_key=None):
+        self.start()
+        return self.backend.enqueue(payload, dedupe_key)
+
+    def get(self, job_id):
+        return self.backend.get(job_id)
+
+    def prune(self):
+        """Delete jobs that finished more than retention seconds ago; returns how many."""
+        return self.backend.prune(time.time() - self.retention)
+
+    def _maybe_prune(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_prune:
+                return
+            self._next_prune = now + self.prune_interval
+        try:
+            self.prune()
+        except sqlite3.Error:
+            # Another process may hold the write lock; try again next interval
+            pass
+
+    def _work(self):
+        while not self._stopping.is_set():
+            self._maybe_prune()
+            job = self.backend.claim()
+            if job is None:
+                continue
+            try:
+                result = self.handler(job["payload"])
+                self.backend.complete(job["id"], result)
+            except Exception as e:
+                self.backend.fail(job["id"], str(e))
+            self._notify(job)
+
+    def _notify(self, job):
+        callback_url = (job["payload"] or {}).get("callback_url")
+        if not callback_url:
+            return
+        finished = self.backend.get(job["id"])
+        body = json.dumps({k: finished[k] for k in ("id", "status", "result", "error")}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.callback_secret:
+            digest = hmac.new(self.callback_secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Callback-Signature"] = f"sha256={digest}"
+        try:
+            # Checked again here: the host may resolve differently than at submit time
+            self.check_callback(callback_url)
+            req = urllib.request.Request(callback_url, data=body, headers=headers, method="POST")
+            _callback_opener.open(req, timeout=10).close()
+        except Exception:
+            # Clients can still poll the status endpoint
+            pass
@@ -1,16 +1,15 @@
 import os
-import json
+from datetime import datetime
 
-HISTORY_FILE = 'review_history.json'
+from modules.storage import get_store
+
+HISTORY_FILE = 'review_history.json'  # legacy JSON history, imported on first use
+
+_store = get_store()
+_store.register_legacy_json(os.path.abspath(HISTORY_FILE))
 
 def save_review(code, review):
-    history = get_previous_reviews()
-    history.append({"code": code, "review": review})
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(history, f)
+    _store.add({"code": code, "review": review, "timestamp": int(datetime.now().timestamp())})
 
 def get_previous_reviews():
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return [{"code": item["code"], "review": item["review"]} for item in _store.list()]
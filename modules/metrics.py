@@ -0,0 +1,305 @@
+import atexit
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Per-request list of (span, seconds); set by the web layer, shared with worker threads via copy_context()
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in key
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    # Full precision: %g would round busy counters to 6 significant digits
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.kind = "counter"
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        # For counters kept elsewhere (e.g. cache stats) and copied in at scrape time
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self.kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.kind = "histogram"
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (1 if value <= bound else 0) for c, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, c in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (("le", f"{bound:g}"),), c))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+class Registry:
+    """The process's metrics; with a directory, /metrics covers every worker process.
+
+    In multiprocess mode each process writes a snapshot of its samples to
+    <directory>/<pid>.json (when scraped, every flush_interval seconds and at
+    exit), and render() merges all snapshots: counters and histograms are
+    summed, gauges are reported per process with a pid label. Snapshots of
+    exited workers are kept so counters never go backwards; their gauges are
+    dropped by mark_process_dead().
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self._metrics = []
+        self._collectors = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flusher = None
+        self._flush_lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text):
+        metric = Gauge(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Register a callable run at scrape time, e.g. to refresh gauges from cache stats."""
+        self._collectors.append(collect)
+
+    def _collect(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception:
+                pass
+        return {metric.name: metric.samples() for metric in self._metrics}
+
+    def write_snapshot(self, samples=None):
+        """Write this process's samples to the multiprocess directory (no-op without one)."""
+        if not self.directory:
+            return
+        samples = self._collect() if samples is None else samples
+        data = {
+            metric.name: {"kind": metric.kind, "samples": [[n, [list(kv) for kv in key], v] for n, key, v in samples[metric.name]]}
+            for metric in self._metrics
+        }
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with self._flush_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+
+    def start_flusher(self):
+        """Write snapshots in the background and at exit, so other workers' scrapes see this one."""
+        if not self.directory or self._flusher is not None:
+            return
+
+        def flush():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.write_snapshot()
+                except OSError:
+                    pass
+
+        self._flusher = threading.Thread(target=flush, name="metrics-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.write_snapshot)
+
+    def _merged(self):
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            pid = os.path.basename(path)[:-len(".json")]
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for family, entry in data.items():
+                merged = totals.setdefault(family, {})
+                for name, key, value in entry["samples"]:
+                    key = tuple(tuple(kv) for kv in key)
+                    if entry["kind"] == "gauge":
+                        merged[(name, key + (("pid", pid),))] = value
+                    else:
+                        merged[(name, key)] = merged.get((name, key), 0) + value
+        return {family: [(name, key, value) for (name, key), value in merged.items()] for family, merged in totals.items()}
+
+    def render(self):
+        """Prometheus text exposition format."""
+        samples = self._collect()
+        if self.directory:
+            self.write_snapshot(samples)
+            samples = self._merged()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in samples.get(metric.name, []):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def clear_directory(directory):
+    """Remove every snapshot; run by the server master before workers start."""
+    for path in glob.glob(os.path.join(directory, "*.json*")):
+        os.remove(path)
+
+
+def mark_process_dead(pid, directory):
+    """Drop an exited worker's gauges, keeping its counters and histograms in the totals."""
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    data = {family: entry for family, entry in data.items() if entry["kind"] != "gauge"}
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+registry = Registry(
+    directory=os.environ.get("METRICS_DIR") or None,
+    flush_interval=float(os.environ.get("METRICS_FLUSH_INTERVAL", "5")),
+)
+
+span_seconds = registry.histogram("codereview_span_seconds", "Time spent in instrumented hot-path spans")
+model_latency = registry.histogram("codereview_model_latency_seconds", "Model call latency by task")
+model_calls = registry.counter("codereview_model_calls_total", "Model calls by task and outcome")
+model_tokens = registry.counter("codereview_model_tokens_total", "Model token usage by task and kind")
+http_latency = registry.histogram("codereview_http_request_seconds", "HTTP request latency by endpoint")
+http_requests = registry.counter("codereview_http_requests_total", "HTTP requests by endpoint and status")
+cache_lookups = registry.counter("codereview_cache_lookups_total", "Cache lookups by cache and result")
+cache_evictions = registry.counter("codereview_cache_evictions_total", "Cache evictions by cache and tier")
+cache_hit_rate = registry.gauge("codereview_cache_hit_rate", "Cache hit rate by cache")
+
+
+def record_span(name, seconds):
+    span_seconds.observe(seconds, span=name)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def span(name):
+    """Time a block into codereview_span_seconds and the current request's breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_model_call(task, seconds, response=None, error=None):
+    model_latency.observe(seconds, task=task)
+    model_calls.inc(task=task, outcome="error" if error else "ok")
+    record_span(f"model_{task}", seconds)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        for kind in ("prompt_tokens", "completion_tokens"):
+            value = getattr(usage, kind, None)
+            if value:
+                model_tokens.inc(value, task=task, kind=kind.split("_")[0])
+
+
+def track_cache(name, cache):
+    """Export a ReviewCache's counters at scrape time."""
+    def collect():
+        stats = cache.get_stats()
+        for result in ("hits", "disk_hits", "misses"):
+            cache_lookups.set_total(stats.get(result, 0), cache=name, result=result)
+        for tier, stat in (("memory", "evictions"), ("disk", "disk_evictions")):
+            cache_evictions.set_total(stats.get(stat, 0), cache=name, tier=tier)
+        cache_hit_rate.set(stats["hit_rate"], cache=name)
+    registry.add_collector(collect)
+
+
+def server_timing_header(timings):
+    """Aggregate a request's spans into a Server-Timing header value (milliseconds)."""
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from modules.repo_review import RepoProviderError
+
+PER_PAGE = 100
+
+
+class TokenClient:
+    """Minimal stand-in for the flask-dance session that works outside a request.
+
+    The OAuth session proxies read their token from the Flask session, so
+    background refreshes capture the token and base URL up front instead.
+    """
+
+    def __init__(self, base_url, token, timeout=10):
+        self.base_url = base_url
+        self.access_token = (token or {}).get("access_token")
+        self.timeout = timeout
+
+    def get(self, path, headers=None):
+        headers = dict(headers or {})
+        headers["Authorization"] = f"Bearer {self.access_token}"
+        try:
+            # Appended rather than joined, so a base path such as GitHub Enterprise's /api/v3 is kept
+            return requests.get(self.base_url.rstrip("/") + path, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise RepoProviderError(str(e)) from e
+
+
+def _github_page(client, page, headers):
+    resp = client.get(f"/user/repos?per_page={PER_PAGE}&page={page}", headers=headers)
+    repos = None
+    if resp.status_code != 304 and resp.ok:
+        repos = [{"name": repo["full_name"], "url": repo["html_url"]} for repo in resp.json()]
+    return resp, repos, 'rel="next"' in resp.headers.get("Link", "")
+
+
+def _gitlab_page(client, page, headers):
+    resp = client.get(f"/api/v4/projects?membership=true&per_page={PER_PAGE}&page={page}", headers=headers)
+    repos = None
+    if resp.status_code != 304 and resp.ok:
+        repos = [{"name": repo["path_with_namespace"], "url": repo["web_url"]} for repo in resp.json()]
+    return resp, repos, bool(resp.headers.get("X-Next-Page"))
+
+
+LISTERS = {
+    "github": _github_page,
+    "gitlab": _gitlab_page,
+}
+
+
+def fetch_repo_page(provider, client, page, etag=None):
+    """Fetch one page of the user's repositories.
+
+    Returns (repos, etag, has_next); repos is None when the provider answered
+    304 Not Modified to the If-None-Match etag.
+    """
+    headers = {"If-None-Match": etag} if etag else {}
+    resp, repos, has_next = LISTERS[provider](client, page, headers)
+    if resp.status_code == 304:
+        return None, etag, None
+    if not resp.ok:
+        raise RepoProviderError(f"{resp.status_code}: {resp.text[:200]}")
+    return repos, resp.headers.get("ETag"), has_next
+
+
+class RepoListCache:
+    """Per-user cache of provider repository lists, one entry per page.
+
+    Pages are fetched the first time they are asked for. Afterwards they are
+    served from memory; once older than ttl the cached page is still returned
+    while a background refresh revalidates it with If-None-Match, so only the
+    first read of a page waits on the provider. Only the first max_pages pages
+    are fetched; later pages read as empty.
+    """
+
+    def __init__(self, ttl=300, workers=2, max_pages=50):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self._pages = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="repo-list")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl=float(os.environ.get("REPO_LIST_TTL", "300")),
+            max_pages=int(os.environ.get("REPO_LIST_MAX_PAGES", "50")),
+        )
+
+    def cached(self, user_key, page=1):
+        """The cached page or None, without contacting the provider. Expired pages carry stale=True."""
+        with self._lock:
+            entry = self._pages.get((user_key, page))
+        if entry is None:
+            return None
+        if time.monotonic() - entry["fetched"] > self.ttl:
+            return dict(entry, stale=True)
+        return entry
+
+    def get(self, user_key, provider, client, page=1):
+        """Return {"repos", "has_next", ...} for a page, fetching it only if it has never been cached."""
+        if page > self.max_pages:
+            return {"repos": [], "has_next": False}
+        entry = self.cached(user_key, page)
+        if entry is None:
+            return self._fetch(user_key, provider, client, page)
+        if entry.get("stale"):
+            self.refresh(user_key, provider, client, page)
+        return entry
+
+    def refresh(self, user_key, provider, client, page=1):
+        """Revalidate a page in the background (at most one refresh per page at a time)."""
+        key = (user_key, page)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._fetch(user_key, provider, client, page)
+            except Exception:
+                # Keep serving the cached page; the next stale read tries again
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(run)
+
+    def _fetch(self, user_key, provider, client, page):
+        with self._lock:
+            previous = self._pages.get((user_key, page))
+        repos, etag, has_next = fetch_repo_page(provider, client, page, previous and previous["etag"])
+        now = time.monotonic()
+        with self._lock:
+            if repos is None:
+                entry = dict(previous, fetched=now)
+            else:
+                has_next = has_next and page < self.max_pages
+                entry = {"repos": repos, "etag": etag, "has_next": has_next, "fetched": now}
+                if previous is not None and page == 1:
+                    # The first page changed, so later pages may have shifted: revalidate on next read
+                    for (user, n), other in self._pages.items():
+                        if user == user_key and n > 1:
+                            other["fetched"] = float("-inf")
+            self._pages[(user_key, page)] = entry
+        return entry
+
+    def invalidate(self, user_key):
+        with self._lock:
+            for key in [k for k in self._pages if k[0] == user_key]:
+                del self._pages[key]
@@ -0,0 +1,174 @@
+import base64
+from urllib.parse import quote
+
+# Files larger than this are skipped rather than sent to the model
+MAX_FILE_BYTES = 100_000
+
+# Paginated provider listings are followed for at most this many pages
+MAX_PAGES = 100
+
+
+class RepoProviderError(Exception):
+    pass
+
+
+def _check(resp):
+    if not resp.ok:
+        raise RepoProviderError(f"{resp.status_code}: {resp.text[:200]}")
+    return resp
+
+
+def _github_tree(client, repo_name, tree_ish, prefix=""):
+    url = f"/repos/{repo_name}/git/trees/{quote(tree_ish, safe='')}"
+    tree = _check(client.get(url + "?recursive=1")).json()
+    truncated = tree.get("truncated")
+    if truncated:
+        # Too large for one recursive listing: list this level and walk each subtree
+        tree = _check(client.get(url)).json()
+    files = []
+    for entry in tree.get("tree", []):
+        if entry.get("type") == "blob":
+            files.append({"path": prefix + entry["path"], "sha": entry["sha"], "size": entry.get("size", 0)})
+        elif entry.get("type") == "tree" and truncated:
+            files.extend(_github_tree(client, repo_name, entry["sha"], prefix + entry["path"] + "/"))
+    return files
+
+
+def list_github_tree(client, repo_name, ref=None):
+    """Return [{"path", "sha", "size"}] for every blob in a GitHub repository.
+
+    GitHub truncates recursive listings of very large trees; those are walked
+    one subtree at a time, so the listing is always complete (files missing
+    from it would otherwise be treated as removed).
+    """
+    if not ref:
+        ref = _check(client.get(f"/repos/{repo_name}")).json()["default_branch"]
+    return _github_tree(client, repo_name, ref)
+
+
+def fetch_github_blob(client, repo_name, sha):
+    blob = _check(client.get(f"/repos/{repo_name}/git/blobs/{sha}")).json()
+    if blob.get("encoding") == "base64":
+        return base64.b64decode(blob["content"]).decode("utf-8")
+    return blob["content"]
+
+
+def list_gitlab_tree(client, repo_name, ref=None):
+    """Return [{"path", "sha", "size"}] for every blob in a GitLab project, following pagination."""
+    project = quote(repo_name, safe="")
+    files = []
+    page = "1"
+    for _ in range(MAX_PAGES):
+        url = f"/api/v4/projects/{project}/repository/tree?recursive=true&per_page=100&page={page}"
+        if ref:
+            url += f"&ref={quote(ref, safe='')}"
+        resp = _check(client.get(url))
+        files.extend(
+            {"path": entry["path"], "sha": entry["id"], "size": 0}
+            for entry in resp.json()
+            if entry.get("type") == "blob"
+        )
+        page = resp.headers.get("X-Next-Page")
+        if not page:
+            return files
+    # A partial listing would make the files it misses look removed
+    raise RepoProviderError(f"Repository tree has more than {MAX_PAGES} pages")
+
+
+def fetch_gitlab_blob(client, repo_name, sha):
+    project = quote(repo_name, safe="")
+    return _check(client.get(f"/api/v4/projects/{project}/repository/blobs/{sha}/raw")).text
+
+
+def fetch_github_pull_diff(client, repo_name, number):
+    """The unified diff of a GitHub pull request."""
+    return _check(client.get(
+        f"/repos/{repo_name}/pulls/{int(number)}", headers={"Accept": "application/vnd.github.v3.diff"}
+    )).text
+
+
+def fetch_gitlab_merge_request_diff(client, repo_name, number):
+    """A GitLab merge request's changes, reassembled into one unified diff."""
+    project = quote(repo_name, safe="")
+    parts = []
+    page = "1"
+    for _ in range(MAX_PAGES):
+        resp = _check(client.get(
+            f"/api/v4/projects/{project}/merge_requests/{int(number)}/diffs?per_page=100&page={page}"
+        ))
+        for change in resp.json():
+            old_path = "/dev/null" if change.get("new_file") else f"a/{change['old_path']}"
+            new_path = "/dev/null" if change.get("deleted_file") else f"b/{change['new_path']}"
+            parts.append(f"--- {old_path}\n+++ {new_path}\n{change.get('diff', '')}")
+        page = resp.headers.get("X-Next-Page")
+        if not page:
+            return "\n".join(parts)
+    raise RepoProviderError(f"Merge request has more than {MAX_PAGES} pages of changes")
+
+
+PULL_DIFFS = {
+    "github": fetch_github_pull_diff,
+    "gitlab": fetch_gitlab_merge_request_diff,
+}
+
+
+def fetch_pull_diff(provider, client, repo_name, number):
+    """Unified diff of a pull request (GitHub) or merge request (GitLab, by iid)."""
+    return PULL_DIFFS[provider](client, repo_name, number)
+
+
+def pull_request_event(provider, event, payload):
+    """The pull/merge request a webhook delivery asks to review, or None for other events.
+
+    Returns {"repo_name", "pull_request", "head_sha"} for requests that were
+    opened, reopened or received new commits.
+    """
+    if provider == "github":
+        pull = payload.get("pull_request") or {}
+        if event != "pull_request" or payload.get("action") not in ("opened", "reopened", "synchronize"):
+            return None
+        return {
+            "repo_name": payload["repository"]["full_name"],
+            "pull_request": pull.get("number") or payload["number"],
+            "head_sha": (pull.get("head") or {}).get("sha"),
+        }
+    if provider == "gitlab":
+        attrs = payload.get("object_attributes") or {}
+        if event != "Merge Request Hook" or attrs.get("action") not in ("open", "reopen", "update"):
+            return None
+        if attrs.get("action") == "update" and not attrs.get("oldrev"):
+            return None  # Title, label or assignee change: no new commits
+        return {
+            "repo_name": payload["project"]["path_with_namespace"],
+            "pull_request": attrs["iid"],
+            "head_sha": (attrs.get("last_commit") or {}).get("id"),
+        }
+    return None
+
+
+PROVIDERS = {
+    "github": (list_github_tree, fetch_github_blob),
+    "gitlab": (list_gitlab_tree, fetch_gitlab_blob),
+}
+
+
+def plan_repo_review(provider, client, repo_name, previous_shas, is_supported, ref=None):
+    """Work out which files need a review.
+
+    previous_shas maps file paths to the blob SHA reviewed last time. Returns
+    (changed, removed): the supported files whose blob SHA differs from the last
+    run, and the paths that no longer exist.
+    """
+    list_tree = PROVIDERS[provider][0]
+    files = [
+        f for f in list_tree(client, repo_name, ref)
+        if is_supported(f["path"]) and f["size"] <= MAX_FILE_BYTES
+    ]
+    current = {f["path"] for f in files}
+    changed = [f for f in files if previous_shas.get(f["path"]) != f["sha"]]
+    removed = [path for path in previous_shas if path not in current]
+    return changed, removed
+
+
+def fetch_file(provider, client, repo_name, sha):
+    return PROVIDERS[provider][1](client, repo_name, sha)
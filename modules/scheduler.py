@@ -0,0 +1,274 @@
+import itertools
+import os
+import random
+import threading
+import time
+
+# Lower value wins; interactive autocomplete is served before reviews, and reviews before batch work
+PRIORITIES = {"interactive": 0, "review": 1, "batch": 2}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Refills rate units per minute up to a one-minute burst. A rate of 0 disables it."""
+
+    def __init__(self, rate_per_minute, clock=time.monotonic):
+        self.rate = rate_per_minute
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount units are available (0 when they are available now)."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.rate
+
+    def consume(self, amount):
+        if self.rate:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta):
+        # Correct an up-front estimate once real usage is known
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+def estimate_request_tokens(kwargs):
+    chars = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+    return chars // 4 + (kwargs.get("max_tokens") or 512)
+
+
+def retry_delay(error, attempt, base=1.0, cap=30.0):
+    """Seconds to wait before retrying error, or None if it should not be retried.
+
+    Honors Retry-After / retry-after-ms headers and otherwise uses full jitter
+    exponential backoff.
+    """
+    status = getattr(error, "status_code", None)
+    retryable = status in RETRYABLE_STATUS or (
+        status is None and any(name in type(error).__name__ for name in ("Connection", "Timeout"))
+    )
+    if not retryable:
+        return None
+
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value is not None:
+            try:
+                return min(cap, float(value) * scale) + random.uniform(0, 0.25)
+            except ValueError:
+                pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class _Ticket:
+    def __init__(self, seq, priority, user_id, tokens):
+        self.seq = seq
+        self.priority = priority
+        self.user_id = user_id
+        self.tokens = tokens
+
+
+class ModelScheduler:
+    """Shared gate in front of every model call.
+
+    Calls wait for request-per-minute and token-per-minute budget, are served
+    by priority, and within a priority the user with the fewest calls in flight
+    goes first. A user never has more than user_max_inflight calls running.
+    429/5xx and connection errors are retried with jittered backoff, and a 429
+    pauses every caller until its Retry-After has passed.
+    """
+
+    def __init__(self, client, rpm=0, tpm=0, max_retries=3, user_max_inflight=4,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.backend = client
+        self.max_retries = max_retries
+        self.user_max_inflight = user_max_inflight
+        self.clock = clock
+        self.sleep = sleep
+        self._requests = TokenBucket(rpm, clock)
+        self._tokens = TokenBucket(tpm, clock)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._inflight = {}
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+
+    @classmethod
+    def from_env(cls, client):
+        return cls(
+            client,
+            rpm=float(os.environ.get("LLM_RPM", "0")),
+            tpm=float(os.environ.get("LLM_TPM", "0")),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", "3")),
+            user_max_inflight=int(os.environ.get("LLM_USER_MAX_INFLIGHT", "4")),
+        )
+
+    def client(self, priority="review", user_id=None):
+        """A client-compatible object whose chat.completions.create goes through the scheduler."""
+        return ScheduledClient(self, priority, user_id)
+
+    def _eligible(self):
+        candidates = [
+            t for t in self._waiting
+            if self._inflight.get(t.user_id, 0) < self.user_max_inflight
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda t: (t.priority, self._inflight.get(t.user_id, 0), t.seq))
+
+    def acquire(self, priority, user_id, tokens):
+        ticket = _Ticket(next(self._seq), PRIORITIES.get(priority, 1), user_id, tokens)
+        with self._cond:
+            self._waiting.append(ticket)
+            while True:
+                if self._eligible() is ticket:
+                    wait = max(
+                        self._paused_until - self.clock(),
+                        self._requests.wait_time(1),
+                        self._tokens.wait_time(tokens),
+                    )
+                    if wait <= 0:
+                        self._requests.consume(1)
+                        self._tokens.consume(tokens)
+                        self._waiting.remove(ticket)
+                        self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait(1.0)
+
+    def release(self, user_id, estimated_tokens, used_tokens=None):
+        with self._cond:
+            self._inflight[user_id] -= 1
+            if not self._inflight[user_id]:
+                del self._inflight[user_id]
+            if used_tokens is not None:
+                self._tokens.adjust(used_tokens - estimated_tokens)
+            self._cond.notify_all()
+
+    def _count(self, *events):
+        with self._cond:
+            for event in events:
+                self.stats[event] += 1
+
+    def pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def create(self, priority, user_id, **kwargs):
+        tokens = estimate_request_tokens(kwargs)
+        # A timeout= covers every attempt, so a retry only gets what is left of it
+        deadline = self.clock() + kwargs["timeout"] if kwargs.get("timeout") else None
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, user_id, tokens)
+            if deadline is not None:
+                kwargs["timeout"] = max(0.001, deadline - self.clock())
+            used = None
+            release = True
+            try:
+                self._count("calls")
+                response = self.backend.chat.completions.create(**kwargs)
+                if kwargs.get("stream"):
+                    # The call is still running until the stream is read, so it keeps its slot
+                    release = False
+                    return _ReleasingStream(response, lambda: self.release(user_id, tokens))
+                usage = getattr(response, "usage", None)
+                used = getattr(usage, "total_tokens", None)
+                return response
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                out_of_time = deadline is not None and delay is not None and self.clock() + delay >= deadline
+                if delay is None or attempt == self.max_retries or out_of_time:
+                    self._count("failures")
+                    raise
+                if getattr(e, "status_code", None) == 429:
+                    self._count("retries", "rate_limited")
+                    self.pause(delay)
+                else:
+                    self._count("retries")
+            finally:
+                if release:
+                    self.release(user_id, tokens, used)
+            self.sleep(delay)
+
+
+class _ReleasingStream:
+    """A streamed response that gives its scheduler slot back once exhausted or closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+        self._lock = threading.Lock()
+        self._released = False
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # A stream dropped unread must not hold its slot forever
+        self.close()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._stream, name)
+
+
+class ScheduledClient:
+    def __init__(self, scheduler, priority, user_id):
+        # Read by the analyzer to run this user's calls on their own pool
+        self.user_id = user_id
+        self.chat = _Chat(_Completions(scheduler, priority, user_id))
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class _Completions:
+    def __init__(self, scheduler, priority, user_id):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.user_id = user_id
+
+    def create(self, **kwargs):
+        return self.scheduler.create(self.priority, self.user_id, **kwargs)
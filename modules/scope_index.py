@@ -0,0 +1,411 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Languages whose blocks are delimited by indentation rather than braces
+INDENT_LANGUAGES = {"python", "ruby"}
+
+# Per-language scope openers: (scope type, compiled pattern with the name in group 1)
+_JS_OPENERS = [
+    ("class", re.compile(r"\bclass\s+(\w+)")),
+    ("function", re.compile(r"\bfunction\s*\*?\s*(\w+)\s*\(")),
+    ("function", re.compile(r"\b(\w+)\s*[:=]\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|\w+\s*=>)")),
+    ("function", re.compile(
+        r"^\s*(?:(?:async|static|get|set|public|private|protected|readonly)\s+)*(\w+)\s*\([^)]*\)\s*(?::\s*[^{]+)?\{"
+    )),
+]
+
+SCOPE_OPENERS = {
+    "python": [
+        ("function", re.compile(r"^\s*(?:async\s+)?def\s+(\w+)")),
+        ("class", re.compile(r"^\s*class\s+(\w+)")),
+    ],
+    "ruby": [
+        ("function", re.compile(r"^\s*def\s+(?:self\.)?([\w?!=]+)")),
+        ("class", re.compile(r"^\s*(?:class|module)\s+([\w:]+)")),
+    ],
+    "javascript": _JS_OPENERS,
+    "typescript": [("class", re.compile(r"\b(?:interface|namespace)\s+(\w+)"))] + _JS_OPENERS,
+    "java": [
+        ("class", re.compile(r"\b(?:class|interface|enum|record)\s+(\w+)")),
+        ("function", re.compile(r"(\w+)\s*\([^;]*\)\s*(?:throws\s+[\w\s,.]+)?\{?\s*$")),
+    ],
+    "go": [
+        ("function", re.compile(r"^\s*func\s+(?:\([^)]*\)\s*)?(\w+)")),
+        ("class", re.compile(r"^\s*type\s+(\w+)\s+(?:struct|interface)\b")),
+    ],
+    "c++": [
+        ("class", re.compile(r"\b(?:class|struct|namespace)\s+(\w+)\s*(?:final\s*)?(?::[^{;]*)?\{?\s*$")),
+        ("function", re.compile(r"([\w:~]+)\s*\([^;]*\)\s*(?:const\s*)?(?:noexcept\s*)?(?:override\s*)?\{?\s*$")),
+    ],
+}
+
+# Control-flow keywords that look like calls to the function patterns above
+_NOT_NAMES = {"if", "for", "while", "switch", "catch", "return", "function", "else", "do", "new", "sizeof", "with"}
+
+# String literals and line comments, blanked out before counting braces
+_NOISE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`|//.*$')
+_BLANK_OR_COMMENT = re.compile(r"^\s*(?:#.*|//.*)?$")
+_INDENT = re.compile(r"^[ \t]*")
+
+# Scope text sent with prompts is the header plus at most this many lines before the cursor
+SCOPE_CONTEXT_LINES = int(os.environ.get("AUTOCOMPLETE_SCOPE_LINES", "30"))
+
+
+def _lex_line(line, language):
+    """Per-line facts used for scope lookup: (indent, blank, opener, brace delta)."""
+    blank = bool(_BLANK_OR_COMMENT.match(line))
+    indent = len(_INDENT.match(line).group(0).expandtabs(4))
+    opener = None
+    if not blank:
+        for kind, pattern in SCOPE_OPENERS.get(language, ()):
+            match = pattern.search(line)
+            if match and match.group(1) not in _NOT_NAMES:
+                opener = (kind, match.group(1))
+                break
+    delta = 0
+    if language not in INDENT_LANGUAGES and not blank:
+        stripped = _NOISE.sub("", line)
+        delta = stripped.count("{") - stripped.count("}")
+    return indent, blank, opener, delta
+
+
+# Characters compared per step when looking for the changed range of a resent buffer
+_COMPARE_BLOCK = 4096
+
+
+def _common_prefix(a, b):
+    n = min(len(a), len(b))
+    lo = 0
+    # Skip whole equal blocks, then bisect inside the first block that differs
+    while lo + _COMPARE_BLOCK <= n and a[lo:lo + _COMPARE_BLOCK] == b[lo:lo + _COMPARE_BLOCK]:
+        lo += _COMPARE_BLOCK
+    hi = min(n, lo + _COMPARE_BLOCK)
+    base = lo
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[base:mid] == b[base:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a, b, limit):
+    # Same as _common_prefix, but from the end and never past limit characters
+    la, lb = len(a), len(b)
+    lo = 0
+    while lo + _COMPARE_BLOCK <= limit and \
+            a[la - lo - _COMPARE_BLOCK:la - lo] == b[lb - lo - _COMPARE_BLOCK:lb - lo]:
+        lo += _COMPARE_BLOCK
+    hi = min(limit, lo + _COMPARE_BLOCK)
+    base = lo
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la - mid:la - base] == b[lb - mid:lb - base]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def text_delta(old, new):
+    """The single edit (start, end, text) that turns old into new."""
+    start = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - start)
+    return start, len(old) - suffix, new[start:len(new) - suffix]
+
+
+class _Fenwick:
+    """Prefix sums over a list of integers, with O(log n) point updates."""
+
+    def __init__(self, values):
+        self.size = len(values)
+        tree = [0] + list(values)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def add(self, i, delta):
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """Sum of the first i values."""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def search(self, target):
+        """How many leading values sum to at most target (all values must be non-negative)."""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            if pos + step <= self.size and self.tree[pos + step] <= target:
+                pos += step
+                target -= self.tree[pos]
+            step >>= 1
+        return pos
+
+
+class _BraceDepths:
+    """Brace depth at the start of each line, ignoring stray closing braces.
+
+    A segment tree over the per-line brace balances keeps each node's sum and
+    lowest running total, so both updates and lookups take O(log n).
+    """
+
+    def __init__(self, deltas):
+        size = 1
+        while size < len(deltas):
+            size *= 2
+        self.size = size
+        self.sums = [0] * (2 * size)
+        self.lows = [0] * (2 * size)
+        for i, delta in enumerate(deltas):
+            self.sums[size + i] = delta
+            self.lows[size + i] = min(0, delta)
+        for i in range(size - 1, 0, -1):
+            self._pull(i)
+
+    def _pull(self, i):
+        left, right = 2 * i, 2 * i + 1
+        self.sums[i] = self.sums[left] + self.sums[right]
+        self.lows[i] = min(self.lows[left], self.sums[left] + self.lows[right])
+
+    def set(self, line_no, delta):
+        i = self.size + line_no
+        self.sums[i] = delta
+        self.lows[i] = min(0, delta)
+        i //= 2
+        while i:
+            self._pull(i)
+            i //= 2
+
+    def depth(self, line_no):
+        """Braces opened before line_no and not yet closed."""
+        lo, hi = self.size, self.size + line_no
+        left, right = [], []
+        while lo < hi:
+            if lo & 1:
+                left.append(lo)
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                right.append(hi)
+            lo //= 2
+            hi //= 2
+        total = low = 0
+        for node in left + right[::-1]:
+            low = min(low, total + self.lows[node])
+            total += self.sums[node]
+        return total - low
+
+
+class ScopeIndex:
+    """Line-level scope index for one document.
+
+    Each line is tokenized once into its indentation, whether it opens a
+    function/class scope and its brace balance. Line offsets and brace depths
+    are kept in trees, so an edit finds its lines and
+    re-tokenizes only those without scanning the buffer, and scope_at() walks
+    outwards from the cursor only as far as the scopes that enclose it.
+    """
+
+    def __init__(self, text, language):
+        self.language = language
+        self.lines = text.split("\n")
+        self.info = [_lex_line(line, language) for line in self.lines]
+        self.length = len(text)
+        self._text = text
+        self._reindex()
+
+    def _reindex(self):
+        # Every line counts its newline, the last one included, so offset len(text) is on the last line
+        self._offsets = _Fenwick([len(line) + 1 for line in self.lines])
+        self._depths = _BraceDepths([info[3] for info in self.info]) if self.language not in INDENT_LANGUAGES else None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = "\n".join(self.lines)
+        return self._text
+
+    def _locate(self, offset):
+        """(line number, column) of a character offset."""
+        line_no = self._offsets.search(offset)
+        return line_no, offset - self._offsets.prefix(line_no)
+
+    def apply_edit(self, start, end, new_text):
+        """Replace text[start:end] with new_text, re-tokenizing only the affected lines."""
+        first, start_column = self._locate(start)
+        last, end_column = self._locate(end)
+        new_lines = (self.lines[first][:start_column] + new_text + self.lines[last][end_column:]).split("\n")
+        new_info = [_lex_line(line, self.language) for line in new_lines]
+
+        if len(new_lines) == last - first + 1:
+            for k, (line, info) in enumerate(zip(new_lines, new_info), first):
+                self._offsets.add(k, len(line) - len(self.lines[k]))
+                if self._depths is not None:
+                    self._depths.set(k, info[3])
+            self.lines[first:last + 1] = new_lines
+            self.info[first:last + 1] = new_info
+        else:
+            # Lines were added or removed, so every later position moves
+            self.lines[first:last + 1] = new_lines
+            self.info[first:last + 1] = new_info
+            self._reindex()
+        self.length += len(new_text) - (end - start)
+        self._text = None
+
+    def update(self, text):
+        """Bring the index up to date with the full new text via a single computed edit."""
+        if text != self.text:
+            self.apply_edit(*text_delta(self.text, text))
+            self._text = text
+
+    def _indent_level(self, line_no, column):
+        """Indentation that decides which indented blocks enclose (line_no, column)."""
+        indent, blank, _, _ = self.info[line_no]
+        if not blank:
+            return indent
+        if column:
+            return len(_INDENT.match(self.lines[line_no][:column]).group(0).expandtabs(4))
+        # Column 0 of an empty line still belongs to the block around it
+        for i in range(line_no - 1, -1, -1):
+            indent, blank, opener, _ = self.info[i]
+            if not blank:
+                opens_block = opener or (self.language == "python" and self.lines[i].rstrip().endswith(":"))
+                return indent + 1 if opens_block else indent
+        return 0
+
+    def _enclosing(self, line_no, column):
+        """Opener line numbers enclosing (line_no, column), innermost first."""
+        found = []
+        if self.language in INDENT_LANGUAGES:
+            level = self._indent_level(line_no, column)
+            if level == 0:
+                return found
+            for i in range(line_no - 1, -1, -1):
+                indent, blank, opener, _ = self.info[i]
+                if blank or indent >= level:
+                    continue
+                level = indent
+                if opener:
+                    found.append(i)
+                if level == 0:
+                    break
+        elif self.language in SCOPE_OPENERS:
+            prefix = _NOISE.sub("", self.lines[line_no][:column])
+            balance = prefix.count("{") - prefix.count("}")
+            # Braces still open at the cursor; the walk stops once each one is matched
+            remaining = self._depths.depth(line_no) + balance
+            i = line_no
+            while i >= 0 and remaining > 0:
+                if balance > 0:
+                    # Line i holds an unmatched "{"; its header is on the same line, or the
+                    # line above when the brace sits on a line of its own
+                    if self.info[i][2]:
+                        found.append(i)
+                    elif i > 0 and self.lines[i].lstrip().startswith("{") and self.info[i - 1][2]:
+                        found.append(i - 1)
+                    remaining -= balance
+                    balance = 0
+                i -= 1
+                if i >= 0:
+                    balance += self.info[i][3]
+        return found
+
+    def scope_at(self, cursor_position):
+        """The innermost function/class scope enclosing the cursor, with its text up to the cursor."""
+        scope = {"type": None, "name": None, "content": "", "indentation": 0}
+        line_no, column = self._locate(max(0, min(cursor_position, self.length)))
+
+        openers = self._enclosing(line_no, column)
+        if not openers:
+            return scope
+
+        start = openers[0]
+        kind, name = self.info[start][2]
+        path = [self.info[i][2][1] for i in reversed(openers[1:])] + [name]
+        body = self.lines[start + 1:line_no] + [self.lines[line_no][:column]]
+        if len(body) > SCOPE_CONTEXT_LINES:
+            body = ["    ..."] + body[-SCOPE_CONTEXT_LINES:]
+        scope.update(
+            type=kind,
+            name=".".join(path),
+            content="\n".join([self.lines[start]] + body),
+            indentation=self.info[start][0],
+            start_line=start + 1,
+        )
+        return scope
+
+
+class DocumentIndex:
+    """LRU of ScopeIndex objects keyed by document, for per-keystroke autocomplete calls."""
+
+    def __init__(self, max_documents=512):
+        self.max_documents = max_documents
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_documents=int(os.environ.get("AUTOCOMPLETE_DOCUMENTS", "512")))
+
+    def get(self, doc_key):
+        with self._lock:
+            entry = self._docs.get(doc_key)
+            if entry is not None:
+                self._docs.move_to_end(doc_key)
+            return entry
+
+    def language(self, doc_key):
+        entry = self.get(doc_key)
+        return entry[0].language if entry else None
+
+    def _put(self, doc_key, entry):
+        with self._lock:
+            self._docs[doc_key] = entry
+            self._docs.move_to_end(doc_key)
+            while len(self._docs) > self.max_documents:
+                self._docs.popitem(last=False)
+
+    def discard(self, doc_key):
+        with self._lock:
+            self._docs.pop(doc_key, None)
+
+    def scope_at(self, doc_key, language, cursor_position, text=None, edits=None):
+        """Bring a document's index up to date and return (text, scope) at the cursor.
+
+        Pass either the full text (the delta from the cached copy is worked out
+        here) or a list of (start, end, text) edits against the cached copy.
+        Returns None when edits arrive for a document that is not cached, or
+        when an edit's range does not fit the cached copy; the client is then
+        out of sync, so the document is dropped until the full text is resent.
+        """
+        entry = self.get(doc_key)
+        if entry is None or entry[0].language != language:
+            if text is None:
+                return None
+            entry = (ScopeIndex(text, language), threading.Lock())
+            self._put(doc_key, entry)
+
+        index, lock = entry
+        with lock:
+            if text is not None:
+                index.update(text)
+            else:
+                for start, end, new_text in edits:
+                    if not 0 <= start <= end <= index.length:
+                        self.discard(doc_key)
+                        return None
+                    index.apply_edit(start, end, new_text)
+            return index.text, index.scope_at(cursor_position)
@@ -0,0 +1,76 @@
+import hashlib
+import re
+import struct
+from array import array
+
+# One-permutation MinHash: each shingle hash lands in one of NUM_BINS bins and
+# every bin keeps its minimum, so a signature costs one hash per shingle.
+NUM_BINS = 64
+# LSH banding: two signatures become candidates when all ROWS bins of any band agree.
+# With 8 bands of 8 rows, pairs above ~0.8 similarity are found with high probability.
+BANDS = 8
+ROWS = NUM_BINS // BANDS
+
+SHINGLE_TOKENS = 5
+
+_TOKEN = re.compile(r"[A-Za-z_]\w*|\d+|[^\w\s]")
+_EMPTY = 0xFFFFFFFF
+_SIGNATURE = struct.Struct(f"<{NUM_BINS}I")
+
+
+def shingles(code):
+    """Hashes of every SHINGLE_TOKENS-token window of code; whitespace and layout are ignored."""
+    tokens = _TOKEN.findall(code or "")
+    if not tokens:
+        return set()
+    return {
+        int.from_bytes(
+            hashlib.blake2b(" ".join(tokens[i:i + SHINGLE_TOKENS]).encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for i in range(max(1, len(tokens) - SHINGLE_TOKENS + 1))
+    }
+
+
+def signature(code):
+    """The packed MinHash signature of code, or None when it has no tokens."""
+    hashes = shingles(code)
+    if not hashes:
+        return None
+    bins = [_EMPTY] * NUM_BINS
+    for h in hashes:
+        b, value = h >> 58, h & _EMPTY
+        if value < bins[b]:
+            bins[b] = value
+    # Fill empty bins from the next non-empty one so sparse inputs still compare bin by bin
+    for i in range(NUM_BINS):
+        if bins[i] == _EMPTY:
+            for step in range(1, NUM_BINS):
+                donor = bins[(i + step) % NUM_BINS]
+                if donor != _EMPTY:
+                    bins[i] = (donor + step * 0x9E3779B1) & 0xFFFFFFFE
+                    break
+    return _SIGNATURE.pack(*bins)
+
+
+def band_keys(packed):
+    """One signed 64-bit bucket key per LSH band, for an integer index lookup."""
+    keys = []
+    for band in range(BANDS):
+        chunk = packed[band * ROWS * 4:(band + 1) * ROWS * 4]
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def estimate(packed_a, packed_b):
+    """Estimated Jaccard similarity of two signatures (the fraction of agreeing bins)."""
+    a, b = array("I", packed_a), array("I", packed_b)
+    return sum(x == y for x, y in zip(a, b)) / NUM_BINS
+
+
+def jaccard(code_a, code_b):
+    """Exact Jaccard similarity of two pieces of code over their shingles."""
+    a, b = shingles(code_a), shingles(code_b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
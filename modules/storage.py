@@ -0,0 +1,737 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+from modules import similarity
+from modules.metrics import timed
+
+DEFAULT_DB_PATH = os.path.join(
+    os.environ.get("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")), "history.db"
+)
+
+HISTORY_FIELDS = ["user_id", "code", "review", "timestamp", "repo_provider", "repo_name", "file_path"]
+# Bodies kept in the blob store; history rows hold their hashes in <field>_hash
+LARGE_FIELDS = ("code", "review")
+ROW_FIELDS = ["user_id", "code_hash", "review_hash", "timestamp", "repo_provider", "repo_name", "file_path"]
+INSERT_SQL = (
+    f"INSERT INTO history ({', '.join(ROW_FIELDS)}) "
+    f"VALUES ({', '.join('?' for _ in ROW_FIELDS)})"
+)
+
+# Characters of each blob kept uncompressed for list views
+BLOB_PREVIEW_CHARS = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    code_hash TEXT,
+    review_hash TEXT,
+    timestamp INTEGER,
+    repo_provider TEXT,
+    repo_name TEXT,
+    file_path TEXT
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB,
+    size INTEGER,
+    preview TEXT,
+    refcount INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_history_user_ts ON history (user_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_history_ts ON history (timestamp, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS repo_files (
+    user_id TEXT,
+    repo_provider TEXT,
+    repo_name TEXT,
+    file_path TEXT,
+    blob_sha TEXT,
+    reviewed_at INTEGER,
+    PRIMARY KEY (user_id, repo_provider, repo_name, file_path)
+);
+CREATE TABLE IF NOT EXISTS suggestion_state (
+    entry_id INTEGER PRIMARY KEY,
+    user_id TEXT,
+    status TEXT,
+    updated INTEGER
+);
+CREATE TABLE IF NOT EXISTS suggestion_stats (
+    user_id TEXT PRIMARY KEY,
+    accepted INTEGER NOT NULL DEFAULT 0,
+    ignored INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS similarity_signatures (
+    entry_id INTEGER PRIMARY KEY,
+    user_id TEXT,
+    signature BLOB
+);
+CREATE TABLE IF NOT EXISTS similarity_bands (
+    user_id TEXT,
+    band_key INTEGER,
+    entry_id INTEGER,
+    PRIMARY KEY (user_id, band_key, entry_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    owner, code, review, repo_name, file_path, content=''
+);
+"""
+
+# history_fts is contentless: it holds only the inverted index, keyed by history id,
+# so bodies stay compressed in the blob store. owner is a per-user token that scopes
+# every query inside the index instead of filtering its matches afterwards.
+SEARCH_COLUMNS = ["code", "review", "repo_name", "file_path"]
+# bm25 column weights: owner, code, review, repo_name, file_path
+SEARCH_WEIGHTS = "0.0, 1.0, 1.0, 2.0, 4.0"
+
+# LSH candidates scored per similarity query; bounds the cost of very common code
+SIMILARITY_CANDIDATES = 200
+
+# Decisions a user can record against a history entry; "pending" clears the decision
+SUGGESTION_STATUSES = ("accepted", "ignored")
+
+
+def search_owner(user_id):
+    return "u" + hashlib.sha1((user_id or "").encode("utf-8")).hexdigest()[:24]
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query where every word or "quoted phrase" must match.
+
+    Terms are quoted, so punctuation such as "billing.py" is matched as a
+    phrase instead of being parsed as query syntax; a trailing * on a word
+    matches prefixes.
+    """
+    terms = []
+    for token in re.findall(r'"[^"]*"|\S+', text or ""):
+        prefix = token.endswith("*") and not token.startswith('"')
+        word = token.strip('"').rstrip("*")
+        if not re.search(r"\w", word):
+            continue
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def blob_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _decompress(data):
+    return zlib.decompress(data).decode("utf-8") if data is not None else ""
+
+
+def _body_columns(fields, preview=None):
+    """SELECT expressions and joins that load the requested history fields.
+
+    Bodies come from the blob store: the stored uncompressed preview when a
+    short preview is enough, otherwise the compressed data, which the caller
+    passes through _inflate(). Returns (columns, joins, compressed_fields).
+    """
+    columns, joins, compressed = [], [], []
+    for field in fields:
+        if field not in LARGE_FIELDS:
+            columns.append(f"h.{field}")
+            continue
+        alias = f"b_{field}"
+        joins.append(f"LEFT JOIN blobs {alias} ON {alias}.hash = h.{field}_hash")
+        if preview and preview <= BLOB_PREVIEW_CHARS:
+            columns.append(f"COALESCE(substr({alias}.preview, 1, {int(preview)}), '') AS {field}")
+        else:
+            columns.append(f"{alias}.data AS {field}")
+            compressed.append(field)
+    return columns, joins, compressed
+
+
+def _inflate(record, compressed, preview=None):
+    for field in compressed:
+        record[field] = _decompress(record[field])
+        if preview:
+            record[field] = record[field][:preview]
+    return record
+
+
+class HistoryStore:
+    """SQLite-backed review history with O(1) appends and a (user_id, timestamp) index."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._legacy_json = []
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    new_index = not conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'history_fts'"
+                    ).fetchone()
+                    conn.executescript(SCHEMA)
+                    with conn:
+                        # Entries up to here may predate the similarity index (the first start
+                        # after an upgrade); index_similarity_backlog() walks down from this mark
+                        conn.execute(
+                            "INSERT OR IGNORE INTO meta (key, value) "
+                            "SELECT 'similarity_backlog', COALESCE(MAX(id), 0) FROM history"
+                        )
+                    if new_index:
+                        # Entries up to here predate the search index; index_search_backlog() catches up
+                        with conn:
+                            conn.execute(
+                                "INSERT OR IGNORE INTO meta (key, value) "
+                                "SELECT 'search_backlog', COALESCE(MAX(id), 0) FROM history"
+                            )
+                    self._migrate_inline_bodies(conn)
+                    for json_path in self._legacy_json:
+                        self.migrate_json(json_path)
+                    self._initialized = True
+        return conn
+
+    def _migrate_inline_bodies(self, conn):
+        """Move code/review bodies of a pre-blob-store database into the blob store.
+
+        The legacy columns are dropped afterwards. Where SQLite cannot drop them
+        (before 3.35, or when a legacy index uses them), the inline_bodies meta
+        row keeps later starts from scanning the history again.
+        """
+        if not self._inline_bodies_pending(conn):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock: another process may have migrated in the meantime
+            if not self._inline_bodies_pending(conn):
+                conn.rollback()
+                return
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+            for field in LARGE_FIELDS:
+                if f"{field}_hash" not in columns:
+                    conn.execute(f"ALTER TABLE history ADD COLUMN {field}_hash TEXT")
+            rows = conn.execute(
+                "SELECT id, code, review FROM history WHERE code IS NOT NULL OR review IS NOT NULL"
+            ).fetchall()
+            conn.executemany(
+                "UPDATE history SET code_hash = ?, review_hash = ?, code = NULL, review = NULL WHERE id = ?",
+                [(self._put_blob(conn, row["code"]), self._put_blob(conn, row["review"]), row["id"]) for row in rows],
+            )
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('inline_bodies', ?)", (str(len(rows)),))
+            for field in LARGE_FIELDS:
+                try:
+                    conn.execute(f"ALTER TABLE history DROP COLUMN {field}")
+                except sqlite3.OperationalError:
+                    pass
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if rows:
+            try:
+                # Give the space taken by the inline bodies back to the filesystem
+                conn.execute("VACUUM")
+            except sqlite3.OperationalError:
+                pass
+
+    @staticmethod
+    def _inline_bodies_pending(conn):
+        if "code" not in {row[1] for row in conn.execute("PRAGMA table_info(history)")}:
+            return False
+        return not conn.execute("SELECT 1 FROM meta WHERE key = 'inline_bodies'").fetchone()
+
+    def register_legacy_json(self, json_path):
+        """Import a legacy JSON history file the first time the store is opened."""
+        with self._init_lock:
+            if not self._initialized:
+                self._legacy_json.append(json_path)
+                return
+        self.migrate_json(json_path)
+
+    @staticmethod
+    def _row_to_record(row):
+        return dict(row)
+
+    @staticmethod
+    def _put_blob(conn, text):
+        """Store text once under its hash (or take another reference to it) and return the hash."""
+        if not text:
+            return None
+        digest = blob_hash(text)
+        updated = conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (digest,))
+        if not updated.rowcount:
+            conn.execute(
+                "INSERT INTO blobs (hash, data, size, preview, refcount) VALUES (?, ?, ?, ?, 1)",
+                (digest, zlib.compress(text.encode("utf-8"), 6), len(text), text[:BLOB_PREVIEW_CHARS]),
+            )
+        return digest
+
+    def _values(self, conn, record):
+        values = [record.get(field) for field in ROW_FIELDS]
+        for field in LARGE_FIELDS:
+            values[ROW_FIELDS.index(f"{field}_hash")] = self._put_blob(conn, record.get(field))
+        # Keep timestamps non-null so (timestamp, id) cursors stay comparable
+        values[ROW_FIELDS.index("timestamp")] = record.get("timestamp") or 0
+        return values
+
+    @staticmethod
+    def _index_similarity(conn, entry_id, user_id, signature):
+        """Add an entry to the similarity index (an entry without code is recorded as indexed)."""
+        conn.execute(
+            "INSERT OR IGNORE INTO similarity_signatures (entry_id, user_id, signature) VALUES (?, ?, ?)",
+            (entry_id, user_id, signature),
+        )
+        if signature is not None:
+            conn.executemany(
+                "INSERT OR IGNORE INTO similarity_bands (user_id, band_key, entry_id) VALUES (?, ?, ?)",
+                [(user_id, key, entry_id) for key in similarity.band_keys(signature)],
+            )
+
+    @staticmethod
+    def _index_search(conn, entry_id, record):
+        conn.execute(
+            f"INSERT INTO history_fts (rowid, owner, {', '.join(SEARCH_COLUMNS)}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in SEARCH_COLUMNS)})",
+            [entry_id, search_owner(record.get("user_id"))] + [record.get(field) or "" for field in SEARCH_COLUMNS],
+        )
+
+    @timed("history_write")
+    def add(self, record):
+        """Append one record and return its id."""
+        signature = similarity.signature(record.get("code"))
+        conn = self.connect()
+        with conn:
+            cursor = conn.execute(
+                INSERT_SQL,
+                self._values(conn, record),
+            )
+            self._index_similarity(conn, cursor.lastrowid, record.get("user_id"), signature)
+            self._index_search(conn, cursor.lastrowid, record)
+        return cursor.lastrowid
+
+    @timed("history_write")
+    def add_many(self, records, index_similar=True):
+        """Append several records in a single transaction.
+
+        With index_similar=False they are kept out of the similarity index
+        (records that are not reviews, such as autocomplete results).
+        """
+        signatures = [similarity.signature(record.get("code")) if index_similar else None for record in records]
+        conn = self.connect()
+        with conn:
+            for record, signature in zip(records, signatures):
+                cursor = conn.execute(INSERT_SQL, self._values(conn, record))
+                self._index_similarity(conn, cursor.lastrowid, record.get("user_id"), signature)
+                self._index_search(conn, cursor.lastrowid, record)
+
+    def _select(self, fields=None, preview=None, extra=(), source="history h"):
+        """SELECT ... FROM history h with joins for the requested fields; returns (sql, compressed)."""
+        columns, joins, compressed = _body_columns(fields or HISTORY_FIELDS, preview)
+        sql = f"SELECT h.id, {', '.join(columns + list(extra))} FROM {source} {' '.join(joins)}"
+        return sql, compressed
+
+    @timed("history_read")
+    def list(self, user_id=None):
+        conn = self.connect()
+        select, compressed = self._select()
+        if user_id:
+            rows = conn.execute(f"{select} WHERE h.user_id = ? ORDER BY h.timestamp, h.id", (user_id,))
+        else:
+            rows = conn.execute(f"{select} ORDER BY h.timestamp, h.id")
+        return [_inflate(self._row_to_record(row), compressed) for row in rows]
+
+    @timed("history_read")
+    def page(self, user_id, limit=50, cursor=None, fields=None, preview=None):
+        """Return one page of a user's history, newest first.
+
+        cursor is the (timestamp, id) of the last record of the previous page.
+        fields restricts the returned columns; preview truncates the code and
+        review bodies to that many characters. Returns (records, next_cursor).
+        """
+        # timestamp is always needed to build the next cursor
+        wanted = ["timestamp"] + [f for f in fields or HISTORY_FIELDS if f not in ("id", "timestamp")]
+        select, compressed = self._select(wanted, preview)
+
+        query = f"{select} WHERE h.user_id = ?"
+        params = [user_id]
+        if cursor:
+            query += " AND (h.timestamp, h.id) < (?, ?)"
+            params.extend(cursor)
+        query += " ORDER BY h.timestamp DESC, h.id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self.connect().execute(query, params).fetchall()
+        records = [_inflate(self._row_to_record(row), compressed, preview) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = (records[-1]["timestamp"], records[-1]["id"])
+        if fields:
+            keep = set(fields) | {"id"}
+            records = [{k: v for k, v in record.items() if k in keep} for record in records]
+        return records, next_cursor
+
+    @timed("history_read")
+    def get(self, entry_id, user_id=None):
+        """One full entry, bodies included."""
+        select, compressed = self._select()
+        query = f"{select} WHERE h.id = ?"
+        params = [entry_id]
+        if user_id:
+            query += " AND h.user_id = ?"
+            params.append(user_id)
+        row = self.connect().execute(query, params).fetchone()
+        return _inflate(self._row_to_record(row), compressed) if row else None
+
+    def version(self, user_id):
+        """Cheap fingerprint of a user's history, used for ETags."""
+        row = self.connect().execute(
+            "SELECT COUNT(*), MAX(id) FROM history WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return f"{row[0]}-{row[1] or 0}"
+
+    def review_lengths(self, user_id, limit=200):
+        """(timestamp, review length) of the most recent entries, oldest first."""
+        rows = self.connect().execute(
+            "SELECT h.timestamp, b.size FROM history h LEFT JOIN blobs b ON b.hash = h.review_hash "
+            "WHERE h.user_id = ? ORDER BY h.timestamp DESC, h.id DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [{"timestamp": row[0], "review_length": row[1] or 0} for row in reversed(rows)]
+
+    def repo_file_shas(self, user_id, repo_provider, repo_name):
+        """{file_path: blob_sha} recorded by the last review of a repository."""
+        rows = self.connect().execute(
+            "SELECT file_path, blob_sha FROM repo_files "
+            "WHERE user_id = ? AND repo_provider = ? AND repo_name = ?",
+            (user_id, repo_provider, repo_name),
+        )
+        return {row[0]: row[1] for row in rows}
+
+    def set_repo_file_shas(self, user_id, repo_provider, repo_name, shas, reviewed_at):
+        conn = self.connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO repo_files "
+                "(user_id, repo_provider, repo_name, file_path, blob_sha, reviewed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, repo_provider, repo_name, path, sha, reviewed_at) for path, sha in shas.items()],
+            )
+
+    def forget_repo_files(self, user_id, repo_provider, repo_name, file_paths):
+        conn = self.connect()
+        with conn:
+            conn.executemany(
+                "DELETE FROM repo_files "
+                "WHERE user_id = ? AND repo_provider = ? AND repo_name = ? AND file_path = ?",
+                [(user_id, repo_provider, repo_name, path) for path in file_paths],
+            )
+
+    @timed("history_write")
+    def replace_all(self, records):
+        """Replace the whole history. Records that carry an id keep it, along with their suggestion state."""
+        signatures = [similarity.signature(record.get("code")) for record in records]
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM history")
+            conn.execute("DELETE FROM similarity_signatures")
+            conn.execute("DELETE FROM similarity_bands")
+            conn.execute("INSERT INTO history_fts (history_fts) VALUES ('delete-all')")
+            conn.execute("UPDATE meta SET value = '0' WHERE key IN ('search_backlog', 'similarity_backlog')")
+            conn.execute("UPDATE blobs SET refcount = 0")
+            for record, signature in zip(records, signatures):
+                cursor = conn.execute(
+                    f"INSERT INTO history (id, {', '.join(ROW_FIELDS)}) "
+                    f"VALUES (?, {', '.join('?' for _ in ROW_FIELDS)})",
+                    [record.get("id")] + self._values(conn, record),
+                )
+                self._index_similarity(conn, cursor.lastrowid, record.get("user_id"), signature)
+                self._index_search(conn, cursor.lastrowid, record)
+            conn.execute("DELETE FROM blobs WHERE refcount <= 0")
+            conn.execute("DELETE FROM suggestion_state WHERE entry_id NOT IN (SELECT id FROM history)")
+            conn.execute("DELETE FROM suggestion_stats")
+            conn.execute(
+                "INSERT INTO suggestion_stats (user_id, accepted, ignored) "
+                "SELECT user_id, SUM(status = 'accepted'), SUM(status = 'ignored') "
+                "FROM suggestion_state GROUP BY user_id"
+            )
+
+    def set_suggestion_state(self, entry_id, user_id, status):
+        """Record a user's decision on one of their history entries.
+
+        The per-user accepted/ignored counters are adjusted in the same
+        transaction, so acceptance rates never need a scan. Returns False if
+        the entry does not exist or belongs to someone else.
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute(
+                "SELECT 1 FROM history WHERE id = ? AND user_id = ?", (entry_id, user_id)
+            ).fetchone():
+                conn.rollback()
+                return False
+            row = conn.execute("SELECT status FROM suggestion_state WHERE entry_id = ?", (entry_id,)).fetchone()
+            previous = row[0] if row else None
+            if previous != status:
+                if status in SUGGESTION_STATUSES:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO suggestion_state (entry_id, user_id, status, updated) "
+                        "VALUES (?, ?, ?, strftime('%s', 'now'))",
+                        (entry_id, user_id, status),
+                    )
+                else:
+                    conn.execute("DELETE FROM suggestion_state WHERE entry_id = ?", (entry_id,))
+                conn.execute("INSERT OR IGNORE INTO suggestion_stats (user_id) VALUES (?)", (user_id,))
+                if previous:
+                    conn.execute(f"UPDATE suggestion_stats SET {previous} = {previous} - 1 WHERE user_id = ?", (user_id,))
+                if status in SUGGESTION_STATUSES:
+                    conn.execute(f"UPDATE suggestion_stats SET {status} = {status} + 1 WHERE user_id = ?", (user_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return True
+
+    def suggestion_counts(self, user_id):
+        """(accepted, ignored) decisions recorded by a user."""
+        row = self.connect().execute(
+            "SELECT accepted, ignored FROM suggestion_stats WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    @timed("history_read")
+    def suggestions(self, user_id, status=None, limit=50, cursor=None, preview=None):
+        """One page of a user's reviewed entries with their decision state, newest first.
+
+        status filters to "pending", "accepted" or "ignored"; by default
+        ignored entries are left out. Returns (records, next_cursor) like page().
+        """
+        select, compressed = self._select(
+            ["timestamp", "code", "review", "repo_name", "file_path"], preview,
+            extra=["COALESCE(s.status, 'pending') AS status"],
+        )
+        query = (
+            f"{select} LEFT JOIN suggestion_state s ON s.entry_id = h.id "
+            "WHERE h.user_id = ? AND h.code_hash IS NOT NULL AND h.review_hash IS NOT NULL"
+        )
+        params = [user_id]
+        if status:
+            query += " AND COALESCE(s.status, 'pending') = ?"
+            params.append(status)
+        else:
+            query += " AND s.status IS NOT 'ignored'"
+        if cursor:
+            query += " AND (h.timestamp, h.id) < (?, ?)"
+            params.extend(cursor)
+        query += " ORDER BY h.timestamp DESC, h.id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self.connect().execute(query, params).fetchall()
+        records = [_inflate(self._row_to_record(row), compressed, preview) for row in rows[:limit]]
+        next_cursor = (records[-1]["timestamp"], records[-1]["id"]) if len(rows) > limit else None
+        return records, next_cursor
+
+    def index_similarity_backlog(self, batch=500):
+        """Index up to batch entries written without a signature (migrated or older rows), newest first.
+
+        Walks down from the similarity_backlog mark, so the whole backlog is
+        read once. Returns how many were indexed, so callers can loop until it
+        returns 0. Runs under the write lock, so concurrent workers never
+        compute the same signatures twice.
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'similarity_backlog'").fetchone()
+            upto = int(row[0]) if row else 0
+            records = []
+            if upto > 0:
+                select, compressed = self._select(["user_id", "code"])
+                rows = conn.execute(
+                    f"{select} WHERE h.id <= ? "
+                    "AND NOT EXISTS (SELECT 1 FROM similarity_signatures s WHERE s.entry_id = h.id) "
+                    "ORDER BY h.id DESC LIMIT ?",
+                    (upto, batch),
+                ).fetchall()
+                records = [_inflate(self._row_to_record(row), compressed) for row in rows]
+                for record in records:
+                    self._index_similarity(conn, record["id"], record["user_id"], similarity.signature(record["code"]))
+                conn.execute(
+                    "UPDATE meta SET value = ? WHERE key = 'similarity_backlog'",
+                    (str(records[-1]["id"] - 1 if records else 0),),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return len(records)
+
+    def index_search_backlog(self, batch=500):
+        """Add up to batch entries written before the search index existed to it, newest first.
+
+        Returns how many were indexed, so callers can loop until it returns 0.
+        Runs under the write lock, so concurrent workers never index an entry twice.
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'search_backlog'").fetchone()
+            upto = int(row[0]) if row else 0
+            records = []
+            if upto > 0:
+                select, compressed = self._select(["user_id"] + SEARCH_COLUMNS)
+                rows = conn.execute(f"{select} WHERE h.id <= ? ORDER BY h.id DESC LIMIT ?", (upto, batch)).fetchall()
+                records = [_inflate(self._row_to_record(row), compressed) for row in rows]
+                for record in records:
+                    self._index_search(conn, record["id"], record)
+                conn.execute(
+                    "UPDATE meta SET value = ? WHERE key = 'search_backlog'",
+                    (str(records[-1]["id"] - 1 if records else 0),),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return len(records)
+
+    @timed("history_read")
+    def search(self, user_id, query, repo_name=None, since=None, until=None, limit=20, offset=0,
+               preview=BLOB_PREVIEW_CHARS):
+        """Full-text search over a user's code, reviews, repository names and file paths.
+
+        Results are ranked by BM25 (file path and repository matches weigh
+        most) and carry a "score", higher being better. repo_name, since and
+        until (timestamps, until exclusive) narrow the matches. Returns
+        (records, next_offset); next_offset is None on the last page.
+        """
+        terms = fts_query(query)
+        if not terms:
+            return [], None
+        select, compressed = self._select(
+            ["timestamp"] + SEARCH_COLUMNS, preview,
+            extra=[f"bm25(history_fts, {SEARCH_WEIGHTS}) AS score"],
+            source="history_fts CROSS JOIN history h ON h.id = history_fts.rowid",
+        )
+        sql = f"{select} WHERE history_fts MATCH ?"
+        params = [f'owner:"{search_owner(user_id)}" AND ({terms})']
+        if repo_name:
+            sql += " AND h.repo_name = ?"
+            params.append(repo_name)
+        if since is not None:
+            sql += " AND h.timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND h.timestamp < ?"
+            params.append(until)
+        sql += " ORDER BY score, h.id DESC LIMIT ? OFFSET ?"
+        params.extend([limit + 1, offset])
+
+        rows = self.connect().execute(sql, params).fetchall()
+        records = []
+        for row in rows[:limit]:
+            record = _inflate(self._row_to_record(row), compressed, preview)
+            record["score"] = round(-record["score"], 4)
+            records.append(record)
+        return records, (offset + limit if len(rows) > limit else None)
+
+    @timed("history_read")
+    def similar(self, user_id, code, limit=5, min_similarity=0.5, preview=None):
+        """A user's past entries whose code is most similar to code, most similar first.
+
+        Candidates come from the LSH band index and are ranked by their
+        estimated Jaccard similarity, which each record carries as "similarity".
+        """
+        signature = similarity.signature(code)
+        if signature is None:
+            return []
+        keys = similarity.band_keys(signature)
+        conn = self.connect()
+        # Each bucket is read newest first and capped before aggregating, so a
+        # bucket shared by many near-duplicates costs at most SIMILARITY_CANDIDATES rows
+        bucket = (
+            "SELECT * FROM (SELECT entry_id FROM similarity_bands "
+            "WHERE user_id = ? AND band_key = ? ORDER BY entry_id DESC LIMIT ?)"
+        )
+        rows = conn.execute(
+            f"SELECT c.entry_id, s.signature FROM ({' UNION ALL '.join(bucket for _ in keys)}) c "
+            "JOIN similarity_signatures s ON s.entry_id = c.entry_id "
+            "GROUP BY c.entry_id ORDER BY COUNT(*) DESC, c.entry_id DESC LIMIT ?",
+            [value for key in keys for value in (user_id, key, SIMILARITY_CANDIDATES)] + [SIMILARITY_CANDIDATES],
+        ).fetchall()
+        scored = sorted(
+            ((similarity.estimate(signature, row[1]), row[0]) for row in rows),
+            key=lambda pair: (-pair[0], -pair[1]),
+        )
+        scores = {entry_id: score for score, entry_id in scored[:limit] if score >= min_similarity}
+        if not scores:
+            return []
+
+        select, compressed = self._select(["timestamp", "code", "review", "repo_name", "file_path"], preview)
+        rows = conn.execute(
+            f"{select} WHERE h.id IN ({', '.join('?' for _ in scores)})", list(scores)
+        ).fetchall()
+        records = [
+            dict(_inflate(self._row_to_record(row), compressed, preview), similarity=scores[row["id"]])
+            for row in rows
+        ]
+        records.sort(key=lambda record: (-record["similarity"], -record["id"]))
+        return records
+
+    def migrate_json(self, json_path):
+        """One-shot import of a legacy JSON history file.
+
+        The source file is left in place; a marker in the meta table makes the
+        import run only once per file, even with several processes starting up.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        marker = f"migrated:{os.path.abspath(json_path)}"
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                conn.rollback()
+                return 0
+            try:
+                with open(json_path, "r") as f:
+                    records = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                records = []
+            last_id = 0
+            for record in records:
+                cursor = conn.execute(INSERT_SQL, self._values(conn, record))
+                self._index_search(conn, cursor.lastrowid, record)
+                last_id = cursor.lastrowid
+            # Signatures are computed later by index_similarity_backlog(), off the startup path
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('similarity_backlog', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+                (last_id,),
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(len(records))))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return len(records)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=DEFAULT_DB_PATH):
+    """Return the shared HistoryStore for a database path."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = HistoryStore(path)
+        return _stores[path]
@@ -0,0 +1,122 @@
+import json
+import threading
+import types
+import unittest
+
+from modules import analyzer
+
+CHUNKED = "".join(f"def step_{i}(x):\n    y = x + {i}\n    return y * 2\n\n\n" for i in range(6))
+
+
+def chunk(text=None, usage=None):
+    delta = types.SimpleNamespace(content=text)
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(delta=delta)] if text is not None else [],
+        x_groq=types.SimpleNamespace(usage=usage) if usage else None,
+    )
+
+
+class StreamingClient:
+    """Streams "<prompt verb> done"; prompts for the chunk at line 1 wait for first_done."""
+
+    def __init__(self, combined=None):
+        self.combined = combined
+        self.calls = []
+        self.first_done = threading.Event()
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        prompt = kwargs["messages"][0]["content"]
+        self.calls.append(prompt)
+        if not kwargs.get("stream"):
+            return types.SimpleNamespace(
+                choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=json.dumps(self.combined)))],
+                usage=None,
+            )
+        section = next(name for name in ("Review", "Complete", "Suggest") if prompt.startswith(name))
+        first = "    1 | " in prompt
+        usage = types.SimpleNamespace(prompt_tokens=11, completion_tokens=3)
+
+        def stream():
+            if first:
+                self.first_done.wait(2)
+            yield chunk(section)
+            yield chunk(" done")
+            yield chunk(usage=usage)
+
+        return stream()
+
+
+class StreamReviewTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (analyzer.CHUNK_TOKENS, analyzer.REVIEW_MODE, analyzer.record_model_call)
+        self.recorded = []
+        analyzer.record_model_call = lambda task, seconds, response=None, error=None: self.recorded.append(
+            (task, getattr(response, "usage", None), error)
+        )
+
+    def tearDown(self):
+        analyzer.CHUNK_TOKENS, analyzer.REVIEW_MODE, analyzer.record_model_call = self.saved
+
+    def run_stream(self, code, client):
+        events = list(analyzer.stream_review(code, client, timeout=10, use_cache=False, language="python"))
+        self.assertEqual(events[-1][0], "done")
+        return events[:-1], events[-1][2]
+
+    def test_streams_each_section_and_records_usage(self):
+        client = StreamingClient()
+        client.first_done.set()
+        events, review = self.run_stream("def f(x):\n    return x\n", client)
+        self.assertEqual(review["analysis"], "Review done")
+        self.assertEqual(review["errors"], {})
+        self.assertEqual(len(self.recorded), 3)
+        self.assertTrue(all(usage.prompt_tokens == 11 and error is None for _, usage, error in self.recorded))
+
+    def test_large_code_is_streamed_in_chunks_in_order(self):
+        analyzer.CHUNK_TOKENS = 40
+        client = StreamingClient()
+        # Later chunks finish first and must wait for the first one
+        threading.Timer(0.3, client.first_done.set).start()
+        events, review = self.run_stream(CHUNKED, client)
+        self.assertGreater(review["chunks"], 1)
+        streamed = "".join(text for kind, section, text in events if kind == "delta" and section == "analysis")
+        self.assertEqual(streamed, review["analysis"])
+        headings = [line for line in review["analysis"].split("\n") if line.startswith("Lines ")]
+        self.assertEqual(len(headings), review["chunks"])
+        starts = [int(line.split()[1].split("-")[0]) for line in headings]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(review["completion"], "Complete done")
+
+    def test_combined_mode_streams_only_missing_sections(self):
+        analyzer.REVIEW_MODE = "combined"
+        client = StreamingClient(combined={"analysis": "A", "suggestions": "S"})
+        client.first_done.set()
+        events, review = self.run_stream("def f(x):\n    return x\n", client)
+        self.assertEqual((review["analysis"], review["suggestions"], review["completion"]), ("A", "S", "Complete done"))
+        self.assertEqual(len(client.calls), 2)
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        message = types.SimpleNamespace(content="ok")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+class RunReviewTest(unittest.TestCase):
+    def test_calls_get_what_is_left_of_the_review_timeout(self):
+        client = RecordingClient()
+        review = analyzer.run_review("def f(x):\n    return x\n", client, timeout=5, use_cache=False, language="python")
+        self.assertEqual(review["errors"], {})
+        self.assertEqual(len(client.calls), 3)
+        self.assertTrue(all(0 < call["timeout"] <= 5 for call in client.calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
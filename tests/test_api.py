@@ -0,0 +1,179 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="codereview-tests-"))
+os.environ.setdefault("REVIEW_CACHE_DIR", "")
+
+import app as app_module  # noqa: E402
+from modules import auth  # noqa: E402
+from modules.analyzer import format_review  # noqa: E402
+from modules.similarity import jaccard  # noqa: E402
+
+PAST_CODE = "".join(f"def step_{i}(x):\n    y = x + {i}\n    return y * 2\n\n" for i in range(12))
+
+
+class RecordingQueue:
+    """Takes the place of the review job queue; submissions with the same key share a job."""
+
+    def __init__(self):
+        self.keys = []
+
+    def submit(self, payload, dedupe_key=None):
+        created = dedupe_key not in self.keys
+        if created:
+            self.keys.append(dedupe_key)
+        return f"job-{self.keys.index(dedupe_key) + 1}", created
+
+
+class ApiTestCase(unittest.TestCase):
+    def setUp(self):
+        # A fresh user per test, since the app's stores are shared by the whole run
+        self.user_id = f"api-user-{uuid.uuid4().hex[:8]}"
+        _, self.token = app_module.token_store.create(self.user_id, "tests")
+        self.client = app_module.app.test_client()
+
+    def headers(self, token=None, **extra):
+        return dict({"Authorization": f"Bearer {token or self.token}"}, **extra)
+
+    def get(self, path, token=None, **headers):
+        return self.client.get(path, headers=self.headers(token, **headers))
+
+    def post(self, path, body, token=None):
+        return self.client.post(path, json=body, headers=self.headers(token))
+
+
+class TokenAuthTest(ApiTestCase):
+    url = f"/api/{app_module.API_VERSION}/history"
+
+    def test_tokens_are_stored_hashed(self):
+        with open(app_module.token_store.path) as f:
+            stored = f.read()
+        self.assertNotIn(self.token, stored)
+        self.assertIn(auth.hash_token(self.token), stored)
+        self.assertEqual(app_module.token_store.resolve(self.token), self.user_id)
+        self.assertIsNone(app_module.token_store.resolve(self.token + "x"))
+
+    def test_unknown_or_missing_token_is_401(self):
+        self.assertEqual(self.get(self.url, token=self.token + "x").status_code, 401)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_naming_another_user_is_403(self):
+        self.assertEqual(self.get(f"{self.url}?user_id={self.user_id}").status_code, 200)
+        self.assertEqual(self.get(f"{self.url}?user_id=someone-else").status_code, 403)
+        response = self.post(f"/api/{app_module.API_VERSION}/review", {"code": "x = 1\n", "user_id": "someone-else"})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json["error"], "Token does not belong to this user")
+
+
+class AsyncReviewTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.saved_jobs = app_module.review_jobs
+        app_module.review_jobs = RecordingQueue()
+
+    def tearDown(self):
+        app_module.review_jobs = self.saved_jobs
+
+    def submit(self, **options):
+        body = dict({"code": "x = 1\n", "async": True, "file_path": "a.py"}, **options)
+        response = self.post(f"/api/{app_module.API_VERSION}/review", body)
+        self.assertEqual(response.status_code, 202)
+        return response.json
+
+    def test_identical_requests_share_a_job(self):
+        first, second = self.submit(), self.submit()
+        self.assertEqual(first["job_id"], second["job_id"])
+        self.assertTrue(second["deduplicated"])
+
+    def test_requests_with_other_options_get_their_own_job(self):
+        first = self.submit()
+        for options in ({"file_path": "b.py"}, {"repo_name": "acme/shop"}, {"file_path": "a.js"}, {"no_cache": True}):
+            other = self.submit(**options)
+            self.assertFalse(other["deduplicated"], options)
+            self.assertNotEqual(other["job_id"], first["job_id"])
+
+    def test_diff_jobs_are_keyed_on_their_options(self):
+        with open(os.path.join(os.path.dirname(__file__), "fixtures", "pull_request.diff")) as f:
+            diff = f.read()
+        keys = set()
+        for options in ({}, {}, {"repo_name": "acme/shop"}, {"context": 1}, {"no_cache": True}):
+            body = dict({"diff": diff, "async": True}, **options)
+            response = self.post(f"/api/{app_module.API_VERSION}/review/diff", body)
+            self.assertEqual(response.status_code, 202, response.json)
+            keys.add(response.json["job_id"])
+        self.assertEqual(len(keys), 4)
+
+
+class HistoryApiTest(ApiTestCase):
+    url = f"/api/{app_module.API_VERSION}/history"
+
+    def setUp(self):
+        super().setUp()
+        for timestamp in (10, 20, 20, 30, 40):
+            app_module.history_store.add({"user_id": self.user_id, "code": "x", "review": "r", "timestamp": timestamp})
+
+    def test_cursor_pages_through_history(self):
+        ids, cursor = [], None
+        while True:
+            response = self.get(f"{self.url}?limit=2" + (f"&cursor={cursor}" if cursor else ""))
+            self.assertEqual(response.status_code, 200)
+            ids.extend(entry["id"] for entry in response.json["history"])
+            cursor = response.json["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_invalid_cursor_or_limit(self):
+        for query in ("cursor=abc", "cursor=1", "limit=0", "limit=x"):
+            self.assertEqual(self.get(f"{self.url}?{query}").status_code, 400, query)
+
+    def test_etag_answers_304_until_history_changes(self):
+        first = self.get(self.url)
+        etag = first.headers["ETag"]
+        self.assertEqual(self.get(self.url, If_None_Match=etag).status_code, 304)
+        # Another page is another representation
+        self.assertEqual(self.get(f"{self.url}?limit=1", If_None_Match=etag).status_code, 200)
+
+        app_module.history_store.add({"user_id": self.user_id, "code": "y", "review": "r", "timestamp": 50})
+        changed = self.get(self.url, If_None_Match=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+
+class ReusableReviewTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_threshold = app_module.SIMILAR_REUSE_THRESHOLD
+        self.user_id = f"reuse-user-{uuid.uuid4().hex[:8]}"
+        review = format_review({"analysis": "A", "suggestions": "S", "completion": "C"})
+        self.entry_id = app_module.history_store.add(
+            {"user_id": self.user_id, "code": PAST_CODE, "review": review, "timestamp": 1}
+        )
+        self.code = PAST_CODE.replace("x + 5", "x - 5")
+        self.score = jaccard(self.code, PAST_CODE)
+
+    def tearDown(self):
+        app_module.SIMILAR_REUSE_THRESHOLD = self.saved_threshold
+
+    def test_reuses_a_candidate_at_the_threshold(self):
+        app_module.SIMILAR_REUSE_THRESHOLD = self.score
+        result = app_module.find_reusable_review(self.user_id, self.code, "python")
+        self.assertEqual((result["analysis"], result["suggestions"], result["completion"]), ("A", "S", "C"))
+        self.assertEqual(result["reused_from"], {"entry_id": self.entry_id, "similarity": round(self.score, 3)})
+
+    def test_rejects_a_candidate_just_below_the_threshold(self):
+        app_module.SIMILAR_REUSE_THRESHOLD = self.score + 0.001
+        # The index still offers the entry; only the exact comparison turns it down
+        candidates = app_module.history_store.similar(self.user_id, self.code, min_similarity=self.score - 0.1)
+        self.assertEqual([match["id"] for match in candidates], [self.entry_id])
+        self.assertIsNone(app_module.find_reusable_review(self.user_id, self.code, "python"))
+
+    def test_other_users_reviews_are_never_reused(self):
+        app_module.SIMILAR_REUSE_THRESHOLD = self.score
+        self.assertIsNone(app_module.find_reusable_review("someone-else", PAST_CODE, "python"))
+
+
+if __name__ == "__main__":
+    unittest.main()
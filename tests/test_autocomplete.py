@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import types
+import unittest
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="codereview-tests-"))
+os.environ.setdefault("REVIEW_CACHE_DIR", "")
+
+import app as app_module  # noqa: E402
+
+CODE = "def total(items):\n    return sum(items)\n"
+
+
+class RecordingWriter:
+    """Takes the place of the autocomplete history writer and keeps what was submitted."""
+
+    def __init__(self):
+        self.records = []
+
+    def submit(self, record):
+        self.records.append(record)
+
+
+class FakeModel:
+    def __init__(self):
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        text = json.dumps({"completions": [{"code": "x", "explanation": "y"}]})
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))], usage=None
+        )
+
+
+class AutocompleteHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_writer = app_module.autocomplete_history
+        self.saved_backend = app_module.llm_scheduler.backend
+        app_module.autocomplete_history = RecordingWriter()
+        app_module.llm_scheduler.backend = FakeModel()
+        self.client = app_module.app.test_client()
+        with self.client.session_transaction() as session:
+            session["username"] = "ada"
+            session["user_id"] = "autocomplete-user"
+
+    def tearDown(self):
+        app_module.autocomplete_history = self.saved_writer
+        app_module.llm_scheduler.backend = self.saved_backend
+
+    def complete(self, **body):
+        response = self.client.post("/autocomplete", json=dict(body, file_path="cart.py", document_id="d1"))
+        self.assertTrue(response.json["success"], response.json)
+
+    def test_edits_store_the_synced_document(self):
+        self.complete(code=CODE, cursor_position=len(CODE))
+        edit = {"start": len(CODE), "end": len(CODE), "text": "print(total([1]))\n"}
+        self.complete(edits=[edit], cursor_position=len(CODE) + 5)
+        stored = [record["code"] for record in app_module.autocomplete_history.records]
+        self.assertEqual(stored, [CODE, CODE + "print(total([1]))\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
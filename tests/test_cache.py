@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from modules import cache
+from modules.cache import ReviewCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class DiskTierTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "review_cache.db")
+        self.clock = FakeClock()
+        patcher = mock.patch.object(cache.time, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def disk_keys(self, review_cache):
+        return {row[0] for row in review_cache._connect().execute("SELECT key FROM cache")}
+
+    def test_a_fresh_cache_reads_entries_from_disk(self):
+        ReviewCache(path=self.path).set("k", {"analysis": "fine"})
+        fresh = ReviewCache(path=self.path)
+        self.assertEqual(fresh.get("k"), {"analysis": "fine"})
+        self.assertEqual(fresh.get("k"), {"analysis": "fine"})
+        self.assertEqual(fresh.get("other"), None)
+        stats = fresh.get_stats()
+        self.assertEqual((stats["disk_hits"], stats["hits"], stats["misses"]), (1, 1, 1))
+
+    def test_expired_disk_entries_are_misses(self):
+        ReviewCache(ttl=60, path=self.path).set("k", "v")
+        self.clock.now += 61
+        fresh = ReviewCache(ttl=60, path=self.path)
+        self.assertIsNone(fresh.get("k"))
+        self.assertEqual(self.disk_keys(fresh), set())
+
+    def test_pruning_keeps_the_newest_max_disk_entries(self):
+        review_cache = ReviewCache(ttl=0, path=self.path, max_disk_entries=3)
+        review_cache.PRUNE_EVERY = 4
+        for i in range(4):
+            self.clock.now += 1
+            review_cache.set(f"k{i}", i)
+        self.assertEqual(self.disk_keys(review_cache), {"k1", "k2", "k3"})
+        self.assertEqual(review_cache.get_stats()["disk_evictions"], 1)
+
+        for i in range(4, 6):
+            self.clock.now += 1
+            review_cache.set(f"k{i}", i)
+        self.assertEqual(review_cache.prune_disk(), 2)
+        self.assertEqual(self.disk_keys(review_cache), {"k3", "k4", "k5"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from code_analyzer import local_precheck
+
+
+class LocalPrecheckTest(unittest.TestCase):
+    def test_deeply_nested_code_is_unparseable_not_an_error(self):
+        for code in ("-" * 100000 + "1", "x = " + "+".join(["a"] * 100000)):
+            result = local_precheck(code, "python")
+            self.assertIsNotNone(result["syntax_error"])
+            self.assertTrue(result["syntax_error"]["msg"])
+            self.assertEqual(result["findings"], [])
+
+    def test_valid_code_parses(self):
+        result = local_precheck("def f(x):\n    return x + 1\n", "python")
+        self.assertIsNone(result["syntax_error"])
+
+    def test_nested_scopes_are_scored_separately(self):
+        code = (
+            "def outer(x):\n"
+            "    def inner(y):\n"
+            "        if y and x:\n"
+            "            return 1\n"
+            "    for i in range(x):\n"
+            "        if i:\n"
+            "            x = eval('i')\n"
+            "    return inner\n"
+        )
+        result = local_precheck(code, "python")
+        self.assertEqual(result["metrics"]["complexity"], 3)
+        self.assertEqual([f["type"] for f in result["findings"]], ["unused_function", "eval_usage"])
+
+
+if __name__ == "__main__":
+    unittest.main()
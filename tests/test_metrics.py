@@ -0,0 +1,28 @@
+import unittest
+
+from modules.metrics import Registry
+
+
+class RenderTest(unittest.TestCase):
+    def test_large_values_keep_full_precision(self):
+        registry = Registry()
+        tokens = registry.counter("tokens_total", "Tokens")
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(1,))
+        tokens.inc(1234567, kind="prompt")
+        tokens.inc(1, kind="prompt")
+        for _ in range(3):
+            latency.observe(412345.678901)
+
+        lines = registry.render().splitlines()
+        self.assertIn('tokens_total{kind="prompt"} 1234568', lines)
+        self.assertIn("latency_seconds_count 3", lines)
+        self.assertIn(f"latency_seconds_sum {repr(412345.678901 * 3)}", lines)
+
+    def test_small_fractions_render_exactly(self):
+        registry = Registry()
+        registry.gauge("hit_rate", "Hit rate").set(0.1234567)
+        self.assertIn("hit_rate 0.1234567", registry.render().splitlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import types
+import unittest
+from unittest import mock
+
+from modules import repo_listing
+from modules.repo_listing import RepoListCache, TokenClient
+from modules.repo_review import MAX_PAGES, RepoProviderError, fetch_gitlab_merge_request_diff
+
+
+class PagedClient:
+    """Answers every listing request with one repository and a next page."""
+
+    def __init__(self):
+        self.paths = []
+
+    def get(self, path, headers=None):
+        self.paths.append(path)
+        return types.SimpleNamespace(
+            ok=True,
+            status_code=200,
+            headers={"Link": '<next>; rel="next"', "X-Next-Page": "2", "ETag": "e"},
+            json=lambda: [{"full_name": "acme/shop", "html_url": "u", "new_file": True, "new_path": "a.py"}],
+        )
+
+
+class TokenClientTest(unittest.TestCase):
+    def test_keeps_the_base_path(self):
+        with mock.patch.object(repo_listing.requests, "get") as get:
+            TokenClient("https://ghe.example.com/api/v3/", {"access_token": "t"}).get("/user/repos?page=2")
+        self.assertEqual(get.call_args[0][0], "https://ghe.example.com/api/v3/user/repos?page=2")
+        self.assertEqual(get.call_args[1]["headers"]["Authorization"], "Bearer t")
+
+
+class PageCapTest(unittest.TestCase):
+    def test_listing_stops_at_max_pages(self):
+        cache = RepoListCache(max_pages=2)
+        client = PagedClient()
+        self.assertTrue(cache.get("u", "github", client, 1)["has_next"])
+        self.assertFalse(cache.get("u", "github", client, 2)["has_next"])
+        self.assertEqual(cache.get("u", "github", client, 3), {"repos": [], "has_next": False})
+        self.assertEqual(len(client.paths), 2)
+
+    def test_merge_request_diff_pages_are_capped(self):
+        client = PagedClient()
+        with self.assertRaises(RepoProviderError):
+            fetch_gitlab_merge_request_diff(client, "acme/shop", 7)
+        self.assertEqual(len(client.paths), MAX_PAGES)
+
+
+if __name__ == "__main__":
+    unittest.main()
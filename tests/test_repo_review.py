@@ -0,0 +1,88 @@
+import types
+import unittest
+
+from modules.repo_review import MAX_PAGES, RepoProviderError, list_github_tree, list_gitlab_tree, plan_repo_review
+
+
+def blob(path, sha):
+    return {"path": path, "type": "blob", "sha": sha, "size": 10}
+
+
+def subtree(path, sha):
+    return {"path": path, "type": "tree", "sha": sha}
+
+
+class FakeGitHub:
+    """Serves a repository whose recursive root listing is truncated, like GitHub does for huge trees."""
+
+    TREES = {
+        "main": [blob("README.md", "r1"), blob("setup.py", "s1"), subtree("src", "t-src")],
+        "t-src": [blob("app.py", "a1"), subtree("pkg", "t-pkg")],
+        "t-pkg": [blob("core.py", "c1")],
+    }
+
+    def __init__(self):
+        self.paths = []
+
+    def get(self, path):
+        self.paths.append(path)
+        name, _, query = path.split("/git/trees/")[1].partition("?")
+        entries = self.TREES[name]
+        if query == "recursive=1" and name == "main":
+            # A partial recursive listing that misses src/pkg/core.py
+            data = {"truncated": True, "tree": entries + [blob("src/app.py", "a1")]}
+        elif query == "recursive=1":
+            data = {"truncated": False, "tree": self._flatten(name)}
+        else:
+            data = {"truncated": False, "tree": entries}
+        return types.SimpleNamespace(ok=True, json=lambda: data)
+
+    def _flatten(self, name, prefix=""):
+        entries = []
+        for entry in self.TREES[name]:
+            entries.append(dict(entry, path=prefix + entry["path"]))
+            if entry["type"] == "tree":
+                entries.extend(self._flatten(entry["sha"], prefix + entry["path"] + "/"))
+        return entries
+
+
+class GitHubTreeTest(unittest.TestCase):
+    def test_truncated_listing_is_completed_from_subtrees(self):
+        files = list_github_tree(FakeGitHub(), "acme/shop", ref="main")
+        self.assertEqual(
+            sorted(f["path"] for f in files),
+            ["README.md", "setup.py", "src/app.py", "src/pkg/core.py"],
+        )
+
+    def test_truncated_listing_does_not_mark_files_removed(self):
+        previous = {"src/pkg/core.py": "c1", "src/old.py": "o1"}
+        changed, removed = plan_repo_review(
+            "github", FakeGitHub(), "acme/shop", previous, is_supported=lambda path: path.endswith(".py"), ref="main"
+        )
+        self.assertEqual(removed, ["src/old.py"])
+        self.assertEqual(sorted(f["path"] for f in changed), ["setup.py", "src/app.py"])
+
+
+class EndlessGitLab:
+    """Always reports another page of the project tree."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, path):
+        self.calls += 1
+        return types.SimpleNamespace(
+            ok=True, headers={"X-Next-Page": str(self.calls + 1)}, json=lambda: [{"type": "blob", "path": "a.py", "id": "x"}]
+        )
+
+
+class GitLabTreeTest(unittest.TestCase):
+    def test_listing_fails_rather_than_stopping_partway(self):
+        client = EndlessGitLab()
+        with self.assertRaises(RepoProviderError):
+            list_gitlab_tree(client, "acme/shop")
+        self.assertEqual(client.calls, MAX_PAGES)
+
+
+if __name__ == "__main__":
+    unittest.main()
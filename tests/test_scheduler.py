@@ -0,0 +1,240 @@
+import threading
+import time
+import unittest
+
+from modules import analyzer
+from modules.scheduler import ModelScheduler, TokenBucket
+
+
+class FakeClock:
+    """Stands in for time.monotonic and time.sleep; sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+class FakeClient:
+    """Returns (or raises) the given outcomes in order, one per create() call."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_refills_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+        self.assertEqual(bucket.wait_time(1), 0.0)
+        bucket.consume(60)
+        self.assertAlmostEqual(bucket.wait_time(1), 1.0)
+        clock.now += 0.5
+        self.assertAlmostEqual(bucket.wait_time(1), 0.5)
+        clock.now += 120
+        self.assertEqual(bucket.wait_time(60), 0.0)
+
+    def test_adjust_corrects_estimate(self):
+        bucket = TokenBucket(100, FakeClock())
+        bucket.consume(50)
+        bucket.adjust(-30)  # used 30 fewer tokens than estimated
+        self.assertAlmostEqual(bucket.tokens, 80)
+
+    def test_zero_rate_is_unlimited(self):
+        bucket = TokenBucket(0, FakeClock())
+        bucket.consume(10 ** 6)
+        self.assertEqual(bucket.wait_time(10 ** 6), 0.0)
+
+
+class SchedulingTest(unittest.TestCase):
+    def test_higher_priority_served_first(self):
+        clock = FakeClock()
+        scheduler = ModelScheduler(FakeClient(), rpm=1, clock=clock, sleep=clock.sleep)
+        scheduler.acquire("review", "a", 1)  # takes the only request of this minute
+        order = []
+
+        def call(priority, user_id):
+            scheduler.acquire(priority, user_id, 1)
+            order.append(priority)
+
+        batch = threading.Thread(target=call, args=("batch", "b"))
+        batch.start()
+        wait_until(lambda: len(scheduler._waiting) == 1)
+        interactive = threading.Thread(target=call, args=("interactive", "c"))
+        interactive.start()
+        wait_until(lambda: len(scheduler._waiting) == 2)
+
+        clock.now += 60
+        scheduler.release("a", 1)
+        wait_until(lambda: order)
+        clock.now += 60
+        scheduler.release("c", 1)
+        batch.join(5)
+        interactive.join(5)
+        self.assertEqual(order, ["interactive", "batch"])
+
+    def test_user_inflight_cap(self):
+        scheduler = ModelScheduler(FakeClient(), user_max_inflight=1)
+        scheduler.acquire("review", "a", 1)
+        done = []
+        second_a = threading.Thread(target=lambda: (scheduler.acquire("review", "a", 1), done.append("a")))
+        other_user = threading.Thread(target=lambda: (scheduler.acquire("review", "b", 1), done.append("b")))
+        second_a.start()
+        wait_until(lambda: len(scheduler._waiting) == 1)
+        other_user.start()
+        other_user.join(5)
+        self.assertEqual(done, ["b"])
+
+        scheduler.release("a", 1)
+        second_a.join(5)
+        self.assertEqual(done, ["b", "a"])
+
+
+class RetryTest(unittest.TestCase):
+    def make(self, *outcomes, **kwargs):
+        clock = FakeClock()
+        client = FakeClient(*outcomes)
+        scheduler = ModelScheduler(client, clock=clock, sleep=clock.sleep, **kwargs)
+        return scheduler, client, clock
+
+    def test_retries_server_errors(self):
+        scheduler, client, clock = self.make(FakeError(503), FakeError(502), "ok")
+        self.assertEqual(scheduler.create("review", "u", messages=[]), "ok")
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(len(clock.sleeps), 2)
+        self.assertEqual(scheduler.stats["retries"], 2)
+        self.assertEqual(scheduler._inflight, {})
+
+    def test_rate_limit_honors_retry_after_and_pauses(self):
+        scheduler, client, clock = self.make(FakeError(429, {"retry-after": "5"}), "ok")
+        start = clock.now
+        self.assertEqual(scheduler.create("review", "u", messages=[]), "ok")
+        self.assertTrue(5 <= clock.sleeps[0] <= 5.25)
+        self.assertGreaterEqual(scheduler._paused_until, start + 5)
+        self.assertEqual(scheduler.stats["rate_limited"], 1)
+
+    def test_client_errors_are_not_retried(self):
+        scheduler, client, clock = self.make(FakeError(400))
+        with self.assertRaises(FakeError):
+            scheduler.create("review", "u", messages=[])
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(scheduler.stats["failures"], 1)
+        self.assertEqual(scheduler._inflight, {})
+
+    def test_retries_share_the_call_timeout(self):
+        scheduler, client, clock = self.make(FakeError(503), "ok")
+        clock.sleep = lambda seconds: setattr(clock, "now", clock.now + 1)
+        scheduler.sleep = clock.sleep
+        self.assertEqual(scheduler.create("review", "u", messages=[], timeout=10), "ok")
+        self.assertEqual([call["timeout"] for call in client.calls], [10, 9])
+
+    def test_no_retry_past_the_call_timeout(self):
+        scheduler, client, clock = self.make(FakeError(429, {"retry-after": "30"}), "ok")
+        with self.assertRaises(FakeError):
+            scheduler.create("review", "u", messages=[], timeout=10)
+        self.assertEqual(len(client.calls), 1)
+
+    def test_gives_up_after_max_retries(self):
+        scheduler, client, clock = self.make(*[FakeError(503)] * 3, max_retries=2)
+        with self.assertRaises(FakeError):
+            scheduler.create("review", "u", messages=[])
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(scheduler._inflight, {})
+
+
+class StreamTest(unittest.TestCase):
+    def test_stream_holds_slot_until_read(self):
+        scheduler = ModelScheduler(FakeClient(iter(["a", "b"])))
+        stream = scheduler.create("review", "u", messages=[], stream=True)
+        self.assertEqual(scheduler._inflight, {"u": 1})
+        self.assertEqual(list(stream), ["a", "b"])
+        self.assertEqual(scheduler._inflight, {})
+
+    def test_closed_stream_releases_once(self):
+        scheduler = ModelScheduler(FakeClient(iter(["a", "b"])))
+        stream = scheduler.create("review", "u", messages=[], stream=True)
+        stream.close()
+        stream.close()
+        self.assertEqual(scheduler._inflight, {})
+
+    def test_unread_stream_counts_toward_user_cap(self):
+        scheduler = ModelScheduler(FakeClient(iter(["a"]), "ok"), user_max_inflight=1)
+        stream = scheduler.create("review", "u", messages=[], stream=True)
+        done = []
+        second = threading.Thread(target=lambda: done.append(scheduler.create("review", "u", messages=[])))
+        second.start()
+        wait_until(lambda: len(scheduler._waiting) == 1)
+        self.assertEqual(done, [])
+        list(stream)
+        second.join(5)
+        self.assertEqual(done, ["ok"])
+
+
+class GatedClient:
+    """Holds every call for the "slow" model until released."""
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        if kwargs["model"] == "slow":
+            self.released.wait(5)
+        return kwargs["model"]
+
+
+def call(client, model):
+    return client.chat.completions.create(model=model, messages=[])
+
+
+class UserPoolTest(unittest.TestCase):
+    def test_queued_calls_do_not_hold_other_users_workers(self):
+        backend = GatedClient()
+        scheduler = ModelScheduler(backend, user_max_inflight=1)
+        busy, other = scheduler.client("batch", "a"), scheduler.client("interactive", "b")
+        held = [
+            analyzer._executor.submit(busy, call, busy, "slow")
+            for _ in range(analyzer.MAX_INFLIGHT_CALLS + 2)
+        ]
+        try:
+            quick = analyzer._executor.submit(other, call, other, "fast")
+            self.assertEqual(quick.result(timeout=2), "fast")
+        finally:
+            backend.released.set()
+        self.assertEqual([f.result(timeout=5) for f in held], ["slow"] * len(held))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from modules.scope_index import ScopeIndex, text_delta
+
+PYTHON = "class Cart:\n    def total(self):\n        x = 1\n\n        return x\n\nvalue = 2\n"
+
+JAVASCRIPT = "}\nfunction load(url) {\n  fetch(url);\n}\nlet done = true;\n"
+
+
+class ScopeIndexTest(unittest.TestCase):
+    def test_blank_line_at_column_zero_stays_in_function(self):
+        index = ScopeIndex(PYTHON, "python")
+        blank = PYTHON.index("\n\n") + 1
+        self.assertEqual(index.scope_at(blank)["name"], "Cart.total")
+        self.assertIsNone(index.scope_at(PYTHON.index("value"))["name"])
+
+    def test_stray_closing_brace_does_not_hide_scopes(self):
+        index = ScopeIndex(JAVASCRIPT, "javascript")
+        self.assertEqual(index.scope_at(JAVASCRIPT.index("fetch"))["name"], "load")
+        self.assertIsNone(index.scope_at(len(JAVASCRIPT) - 2)["name"])
+
+    def test_edits_keep_text_and_scopes_in_sync(self):
+        index = ScopeIndex(PYTHON, "python")
+        text = PYTHON
+        for start, end, new_text in [(0, 0, "import os\n"), (25, 29, "sum"), (40, 41, "\n    y = 2\n")]:
+            index.apply_edit(start, end, new_text)
+            text = text[:start] + new_text + text[end:]
+            self.assertEqual(index.text, text)
+            self.assertEqual(index.length, len(text))
+        fresh = ScopeIndex(text, "python")
+        for offset in range(len(text) + 1):
+            self.assertEqual(index.scope_at(offset), fresh.scope_at(offset), offset)
+
+    def test_text_delta_over_long_buffers(self):
+        old = "ab" * 5000
+        new = old[:7001] + "XY" + old[7003:]
+        start, end, text = text_delta(old, new)
+        self.assertEqual((start, end, text), (7001, 7003, "XY"))
+
+
+if __name__ == "__main__":
+    unittest.main()
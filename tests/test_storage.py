@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from modules.storage import HistoryStore
+
+LEGACY_SCHEMA = """
+CREATE TABLE history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    code TEXT,
+    review TEXT,
+    timestamp INTEGER,
+    repo_provider TEXT,
+    repo_name TEXT,
+    file_path TEXT
+);
+CREATE INDEX idx_history_user_ts ON history (user_id, timestamp, id);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def make_legacy_db(path, extra_sql=""):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA + extra_sql)
+    conn.executemany(
+        "INSERT INTO history (user_id, code, review, timestamp) VALUES (?, ?, ?, ?)",
+        [("u1", "print(1)", "looks fine", 1), ("u2", "print(2)", "looks fine", 2)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def columns(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+    finally:
+        conn.close()
+
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "history.db")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+
+class InlineBodyMigrationTest(StoreTestCase):
+    def test_moves_bodies_to_blobs_and_drops_legacy_columns(self):
+        make_legacy_db(self.path)
+        store = HistoryStore(self.path)
+        self.assertEqual([(r["code"], r["review"]) for r in store.list("u1")], [("print(1)", "looks fine")])
+        self.assertEqual(
+            store.connect().execute("SELECT refcount FROM blobs WHERE preview = 'looks fine'").fetchone()[0], 2
+        )
+        self.assertFalse({"code", "review"} & columns(self.path))
+
+    def test_runs_once_when_columns_cannot_be_dropped(self):
+        # A legacy index on the column keeps SQLite from dropping it
+        make_legacy_db(self.path, "CREATE INDEX idx_history_code ON history (code);")
+        HistoryStore(self.path).connect()
+        self.assertIn("code", columns(self.path))
+
+        conn = sqlite3.connect(self.path)
+        conn.execute("INSERT INTO history (user_id, code, timestamp) VALUES ('u1', 'inline', 3)")
+        conn.commit()
+        conn.close()
+        HistoryStore(self.path).connect()
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("SELECT code FROM history WHERE timestamp = 3").fetchone()[0], "inline")
+        conn.close()
+
+
+def record(user_id, timestamp, code="x = 1", review="fine"):
+    return {"user_id": user_id, "code": code, "review": review, "timestamp": timestamp}
+
+
+class HistoryPageTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = HistoryStore(self.path)
+        # Several entries share a timestamp, so the cursor must break ties on id
+        for timestamp in (1, 2, 2, 2, 3, 5, 5):
+            self.store.add(record("u1", timestamp))
+        self.store.add(record("u2", 4))
+
+    def test_cursor_walks_every_entry_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.store.page("u1", limit=2, cursor=cursor)
+            seen.extend((entry["timestamp"], entry["id"]) for entry in page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_fields_and_preview(self):
+        self.store.add(record("u1", 9, code="a" * 500))
+        page, cursor = self.store.page("u1", limit=1, fields=["code"], preview=10)
+        self.assertEqual(page, [{"id": page[0]["id"], "code": "a" * 10}])
+        self.assertIsNotNone(cursor)
+
+    def test_version_changes_only_with_the_users_history(self):
+        before = self.store.version("u1")
+        self.store.add(record("u2", 6))
+        self.assertEqual(self.store.version("u1"), before)
+        self.store.add(record("u1", 6))
+        self.assertNotEqual(self.store.version("u1"), before)
+
+
+class BlobRefcountTest(StoreTestCase):
+    def refcounts(self, store):
+        return dict(store.connect().execute("SELECT preview, refcount FROM blobs").fetchall())
+
+    def test_replace_all_recounts_shared_blobs_and_drops_orphans(self):
+        store = HistoryStore(self.path)
+        store.add_many([record("u1", 1, code="old"), record("u1", 2, code="old")])
+        self.assertEqual(self.refcounts(store), {"old": 2, "fine": 2})
+
+        kept = store.list("u1")[0]
+        store.replace_all([kept, record("u2", 3, code="new"), record("u2", 4, code="new", review="new")])
+        self.assertEqual(self.refcounts(store), {"old": 1, "fine": 2, "new": 3})
+        self.assertEqual([r["code"] for r in store.list("u2")], ["new", "new"])
+
+        store.replace_all([])
+        self.assertEqual(self.refcounts(store), {})
+
+
+class SearchTest(StoreTestCase):
+    def test_search_only_matches_the_users_own_entries(self):
+        store = HistoryStore(self.path)
+        store.add(dict(record("u1", 1, code="def checkout(cart): pass"), file_path="shop/cart.py"))
+        store.add(dict(record("u2", 2, code="def checkout(order): pass"), file_path="shop/order.py"))
+        # A user id that looks like query syntax is still just an owner
+        store.add(record('u1" OR "u2', 3, code="def checkout(): pass"))
+
+        results, next_offset = store.search("u1", "checkout")
+        self.assertEqual([r["file_path"] for r in results], ["shop/cart.py"])
+        self.assertIsNone(next_offset)
+        self.assertEqual(len(store.search('u1" OR "u2', "checkout")[0]), 1)
+        self.assertEqual(store.search("u3", "checkout"), ([], None))
+
+    def test_backlog_indexes_entries_older_than_the_index(self):
+        make_legacy_db(self.path)
+        store = HistoryStore(self.path)
+        self.assertEqual(store.search("u1", "print")[0], [])
+
+        self.assertEqual(store.index_search_backlog(batch=1), 1)
+        self.assertEqual(store.index_search_backlog(batch=1), 1)
+        self.assertEqual(store.index_search_backlog(), 0)
+        self.assertEqual([r["timestamp"] for r in store.search("u1", "print")[0]], [1])
+        self.assertEqual([r["timestamp"] for r in store.search("u2", "print")[0]], [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
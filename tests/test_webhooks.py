@@ -0,0 +1,148 @@
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import types
+import unittest
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="codereview-tests-"))
+os.environ.setdefault("REVIEW_CACHE_DIR", "")
+
+import app as app_module  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+SECRET = "webhook-test-secret"
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+class RecordingQueue:
+    """Takes the place of the review job queue and keeps what was submitted."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, payload, dedupe_key=None):
+        self.jobs.append((payload, dedupe_key))
+        return f"job-{len(self.jobs)}", True
+
+
+class FakeProviderClient:
+    """Answers every provider API request with the sample pull request diff."""
+
+    def __init__(self):
+        self.paths = []
+
+    def get(self, path, **kwargs):
+        self.paths.append(path)
+        return types.SimpleNamespace(ok=True, status_code=200, text=fixture("pull_request.diff").decode())
+
+
+class FakeModel:
+    """A chat client whose review cites one line inside the diff and one outside it."""
+
+    def __init__(self):
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        text = "Line 12: returning 0 hides a missing customer from the caller\nLine 40: unrelated"
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))], usage=None
+        )
+
+
+class WebhookTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = {
+            name: getattr(app_module, name)
+            for name in ("WEBHOOK_SECRET", "review_jobs", "provider_api_client")
+        }
+        self.saved_backend = app_module.llm_scheduler.backend
+        app_module.WEBHOOK_SECRET = SECRET
+        app_module.review_jobs = RecordingQueue()
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(app_module, name, value)
+        app_module.llm_scheduler.backend = self.saved_backend
+
+    def post_github(self, body, signature, event="pull_request"):
+        return self.client.post(
+            "/webhooks/github",
+            data=body,
+            headers={"X-Hub-Signature-256": signature, "X-GitHub-Event": event, "Content-Type": "application/json"},
+        )
+
+    @staticmethod
+    def sign(body):
+        return "sha256=" + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+    def test_github_rejects_bad_signatures(self):
+        body = fixture("github_pull_request.json")
+        for signature in ("", "sha256=" + "0" * 64, self.sign(body + b" "), "sha256=ünïcode"):
+            response = self.post_github(body, signature)
+            self.assertEqual(response.status_code, 401, signature)
+        self.assertEqual(app_module.review_jobs.jobs, [])
+
+    def test_gitlab_rejects_bad_tokens(self):
+        for token in ("", "wrong", "sécret"):
+            response = self.client.post(
+                "/webhooks/gitlab",
+                data=fixture("gitlab_merge_request.json"),
+                headers={"X-Gitlab-Token": token, "X-Gitlab-Event": "Merge Request Hook"},
+            )
+            self.assertEqual(response.status_code, 401, token)
+        self.assertEqual(app_module.review_jobs.jobs, [])
+
+    def test_github_pull_request_queues_diff_review(self):
+        body = fixture("github_pull_request.json")
+        response = self.post_github(body, self.sign(body))
+        self.assertEqual(response.status_code, 202)
+        payload, dedupe_key = app_module.review_jobs.jobs[0]
+        self.assertEqual(payload["kind"], "diff")
+        self.assertEqual(payload["repo_name"], "acme/shop")
+        self.assertEqual(payload["pull_request"], 42)
+        self.assertIn("9f3c0e2a7d1b4c5e8f6a0b1c2d3e4f5a6b7c8d9e", dedupe_key)
+
+    def test_gitlab_merge_request_queues_diff_review(self):
+        response = self.client.post(
+            "/webhooks/gitlab",
+            data=fixture("gitlab_merge_request.json"),
+            headers={"X-Gitlab-Token": SECRET, "X-Gitlab-Event": "Merge Request Hook"},
+        )
+        self.assertEqual(response.status_code, 202)
+        payload, _ = app_module.review_jobs.jobs[0]
+        self.assertEqual((payload["repo_name"], payload["pull_request"]), ("acme/shop", 7))
+
+    def test_other_actions_are_ignored(self):
+        event = json.loads(fixture("github_pull_request.json"))
+        event["action"] = "closed"
+        body = json.dumps(event).encode()
+        response = self.post_github(body, self.sign(body))
+        self.assertEqual(response.json, {"ignored": True})
+        self.assertEqual(app_module.review_jobs.jobs, [])
+
+    def test_queued_job_maps_findings_to_changed_lines(self):
+        body = fixture("github_pull_request.json")
+        self.post_github(body, self.sign(body))
+        payload, _ = app_module.review_jobs.jobs[0]
+
+        provider = FakeProviderClient()
+        app_module.provider_api_client = lambda name: provider
+        app_module.llm_scheduler.backend = FakeModel()
+        result = app_module.process_diff_job(dict(payload, no_cache=True))
+
+        self.assertEqual(provider.paths, ["/repos/acme/shop/pulls/42"])
+        self.assertEqual(
+            [(f["file_path"], f["line"]) for f in result["findings"]],
+            [("shop/orders.py", 12)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()